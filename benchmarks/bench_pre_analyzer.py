@@ -0,0 +1,50 @@
+"""
+Benchmarks the local pre-analyzer on a synthetic repository, serially and across a process pool of `workers`
+processes, the way the pipeline extracts the facts with `[pre_analysis] workers`.
+
+    PYTHONPATH=src python -m benchmarks.bench_pre_analyzer --files 10000 --workers 4
+"""
+
+import argparse
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from benchmarks.synthetic_repo import generate_repository
+from service.pre_analyzer import extract_facts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=5000, help="Files of the generated repository")
+    parser.add_argument("--fields", type=int, default=20, help="Fields per generated entity")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        root = Path(directory)
+        file_count = generate_repository(root, args.files, args.fields)
+        files = [(str(path.relative_to(root)), path.read_text()) for path in sorted(root.rglob("*.*"))]
+        size_mb = sum(len(content) for _, content in files) / 1024 / 1024
+        print(f"Generated {file_count} files ({size_mb:.1f} MB)")
+
+        start = time.perf_counter()
+        serial_facts = [extract_facts(relative_path, content) for relative_path, content in files]
+        serial_seconds = time.perf_counter() - start
+        print(f"serial: {serial_seconds:.2f}s ({len(files) / serial_seconds:.0f} files/s)")
+
+        with ProcessPoolExecutor(args.workers) as executor:
+            start = time.perf_counter()
+            paths, contents = zip(*files)
+            pooled_facts = list(executor.map(extract_facts, paths, contents, chunksize=64))
+            pooled_seconds = time.perf_counter() - start
+        print(f"{args.workers} processes: {pooled_seconds:.2f}s ({len(files) / pooled_seconds:.0f} files/s)")
+
+        assert pooled_facts == serial_facts
+        trivial = sum(facts.trivial for facts in serial_facts)
+        print(f"{trivial} of {len(files)} files are described by their facts and skip the LLM analysis")
+
+
+if __name__ == "__main__":
+    main()
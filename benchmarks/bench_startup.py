@@ -0,0 +1,71 @@
+"""
+Benchmarks the CLI's cold start, the import of `main` in a fresh interpreter, and the setup of an LLM call: reading
+and compiling its prompt template and binding its structured output, built for every call versus taken from the
+chain registry.
+
+    PYTHONPATH=src python -m benchmarks.bench_startup --imports 5 --calls 1000
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from langchain_core.prompts import PromptTemplate
+from pydantic import SecretStr
+
+from model.llm_response_models import MigratedFileSchema
+from service.chain_registry import ChainRegistry
+from util.config import get_config
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+IMPORT_SCRIPT = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def _cold_import_seconds() -> float:
+    env = dict(os.environ, PYTHONPATH=str(PROJECT_ROOT / "src"))
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT], cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--imports", type=int, default=5, help="Fresh interpreters to import main in")
+    parser.add_argument("--calls", type=int, default=1000, help="LLM call setups to time")
+    args = parser.parse_args()
+
+    imports = [_cold_import_seconds() for _ in range(args.imports)]
+    print(f"import main: {statistics.median(imports) * 1000:.0f}ms median of {args.imports}")
+
+    os.chdir(PROJECT_ROOT)
+    config = get_config()
+    chains = ChainRegistry(config)
+    start = time.perf_counter()
+    from langchain_openai import ChatOpenAI
+
+    llm = ChatOpenAI(model=config.openai_model, api_key=SecretStr(config.openai_key), max_retries=0)
+    print(f"first LLM client: {(time.perf_counter() - start) * 1000:.0f}ms, paid on the first call only")
+
+    start = time.perf_counter()
+    for _ in range(args.calls):
+        with open("./resources/prompts_templates/migrate_file.prompt", "r") as f:
+            PromptTemplate(template=f.read(), input_variables=["analysis", "file_content"])
+        llm.with_structured_output(MigratedFileSchema)
+    per_call_seconds = (time.perf_counter() - start) / args.calls
+    print(f"setup built per call: {per_call_seconds * 1e6:.0f}us")
+
+    start = time.perf_counter()
+    for _ in range(args.calls):
+        chains.prompt("migrate_file", ["analysis", "file_content"])
+        chains.model(MigratedFileSchema)
+    registry_seconds = (time.perf_counter() - start) / args.calls
+    print(f"setup from the registry: {registry_seconds * 1e6:.1f}us ({per_call_seconds / registry_seconds:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+A local stand-in for the OpenAI chat completions endpoint, for benchmarking the planner offline.
+
+Plain completions are answered with filler text, structured outputs (`response_format` JSON schemas and tool calls)
+with JSON generated from their schema. Latency is drawn from a log-normal distribution, and a share of the requests
+fail with a 429 or a 500, so the scheduler's retries and rate limiting are part of what's measured.
+
+    PYTHONPATH=src python -m benchmarks.fake_openai_server --port 8000 --median-latency 0.5 --rate-limit-rate 0.05
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+
+from util.token_counter import count_tokens
+
+FILLER_WORDS = (
+    "the member repository persists entities with jpa and exposes them through jax-rs endpoints backed by a "
+    "relational database configured in the persistence unit and migrated to spring boot with mongodb"
+).split()
+_FILE_HEADER_PATTERN = re.compile(r"===== File: (.+) =====")
+
+
+@dataclass
+class FakeServerSettings:
+    # Log-normal latency: half the requests are faster than the median, sigma sets how long the tail is
+    median_latency_seconds: float = 0.0
+    latency_sigma: float = 0.5
+    # Seconds per completion token on top of the base latency, like a real model streaming its answer
+    seconds_per_output_token: float = 0.0
+    rate_limit_rate: float = 0.0
+    error_rate: float = 0.0
+    retry_after_seconds: float = 0.1
+    completion_words: int = 120
+    max_list_items: int = 3
+    seed: int | None = None
+
+
+@dataclass
+class FakeServerStats:
+    requests: int = 0
+    completed: int = 0
+    rate_limited: int = 0
+    errors: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # Requests per kind of response: text, json_schema or tools
+    requests_by_kind: Dict[str, int] = field(default_factory=dict)
+
+
+class FakeOpenAIServer:
+    """Runs the fake endpoint in a background thread, at `base_url`."""
+
+    def __init__(self, settings: FakeServerSettings | None = None, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.settings = settings or FakeServerSettings()
+        self.stats = FakeServerStats()
+        self._random = random.Random(self.settings.seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host!s}:{port}/v1"
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _draw(self) -> tuple[str, float]:
+        """Picks the outcome of a request, one of "ok", "rate_limited" or "error", and its latency."""
+        with self._lock:
+            roll = self._random.random()
+            latency = 0.0
+            if self.settings.median_latency_seconds > 0:
+                latency = self._random.lognormvariate(
+                    math.log(self.settings.median_latency_seconds), self.settings.latency_sigma
+                )
+        if roll < self.settings.rate_limit_rate:
+            return "rate_limited", 0.0
+        if roll < self.settings.rate_limit_rate + self.settings.error_rate:
+            return "error", latency
+        return "ok", latency
+
+    def _filler(self, words: int) -> str:
+        with self._lock:
+            return " ".join(self._random.choice(FILLER_WORDS) for _ in range(words))
+
+    def _generate(self, schema: Dict[str, Any], definitions: Dict[str, Any], name: str, prompt: str) -> Any:
+        """Generates a value that satisfies a JSON schema, as produced by pydantic for the planner's models."""
+        if "$ref" in schema:
+            return self._generate(definitions[schema["$ref"].rsplit("/", 1)[-1]], definitions, name, prompt)
+        for combinator in ("anyOf", "oneOf", "allOf"):
+            if combinator in schema:
+                return self._generate(schema[combinator][0], definitions, name, prompt)
+        schema_type = schema.get("type", "string")
+        if schema_type == "object":
+            return {
+                property_name: self._generate(property_schema, definitions, property_name, prompt)
+                for property_name, property_schema in schema.get("properties", {}).items()
+            }
+        if schema_type == "array":
+            if name == "analyses" and _FILE_HEADER_PATTERN.search(prompt):
+                # A multi-file analysis has to answer for every file it was given
+                return [
+                    {"file_path": file_path, "analysis": self._filler(self.settings.completion_words)}
+                    for file_path in _FILE_HEADER_PATTERN.findall(prompt)
+                ]
+            with self._lock:
+                items = self._random.randint(1, self.settings.max_list_items)
+            return [self._generate(schema.get("items", {}), definitions, name, prompt) for _ in range(items)]
+        if schema_type in ("integer", "number"):
+            return 1
+        if schema_type == "boolean":
+            return True
+        if name == "db_schema":
+            return "CREATE TABLE member (id BIGINT PRIMARY KEY, name VARCHAR(25) NOT NULL, email VARCHAR(255))"
+        if name == "name":
+            return self._filler(1)
+        return self._filler(self.settings.completion_words // 10 or 1)
+
+    def respond(self, body: Dict[str, Any]) -> tuple[int, Dict[str, Any], Dict[str, str]]:
+        """Returns the status, JSON body and headers of the answer to a chat completions request."""
+        prompt = "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+        outcome, latency = self._draw()
+        with self._lock:
+            self.stats.requests += 1
+        if outcome == "rate_limited":
+            with self._lock:
+                self.stats.rate_limited += 1
+            return (
+                429,
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                {"Retry-After": str(self.settings.retry_after_seconds)},
+            )
+
+        message: Dict[str, Any] = {"role": "assistant", "content": None, "refusal": None}
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            kind = "json_schema"
+            schema = response_format["json_schema"]["schema"]
+            message["content"] = json.dumps(self._generate(schema, schema.get("$defs", {}), "", prompt))
+            completion = message["content"]
+        elif body.get("tools"):
+            kind = "tools"
+            function = body["tools"][0]["function"]
+            parameters = function.get("parameters", {})
+            arguments = json.dumps(self._generate(parameters, parameters.get("$defs", {}), "", prompt))
+            message["tool_calls"] = [
+                {"id": "call_fake", "type": "function", "function": {"name": function["name"], "arguments": arguments}}
+            ]
+            completion = arguments
+        else:
+            kind = "text"
+            message["content"] = self._filler(self.settings.completion_words)
+            completion = message["content"]
+
+        prompt_tokens = count_tokens(prompt, body.get("model", "gpt-4o-mini"))
+        completion_tokens = count_tokens(completion, body.get("model", "gpt-4o-mini"))
+        time.sleep(latency + completion_tokens * self.settings.seconds_per_output_token)
+        with self._lock:
+            self.stats.requests_by_kind[kind] = self.stats.requests_by_kind.get(kind, 0) + 1
+            if outcome == "error":
+                self.stats.errors += 1
+            else:
+                self.stats.completed += 1
+                self.stats.prompt_tokens += prompt_tokens
+                self.stats.completion_tokens += completion_tokens
+        if outcome == "error":
+            return 500, {"error": {"message": "The server had an error", "type": "server_error"}}, {}
+        return (
+            200,
+            {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "gpt-4o-mini"),
+                "choices": [
+                    {"index": 0, "message": message, "finish_reason": "tool_calls" if kind == "tools" else "stop"}
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            },
+            {},
+        )
+
+
+def _make_handler(server: FakeOpenAIServer) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self) -> None:
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            status, payload, headers = server.respond(body)
+            self._send(status, payload, headers)
+
+        def do_GET(self) -> None:
+            # The token accounting, for checking on a running server
+            self._send(200, asdict(server.stats), {})
+
+        def _send(self, status: int, payload: Dict[str, Any], headers: Dict[str, str]) -> None:
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *_: Any) -> None:
+            pass
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--median-latency", type=float, default=0.5)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    settings = FakeServerSettings(
+        median_latency_seconds=args.median_latency,
+        latency_sigma=args.latency_sigma,
+        rate_limit_rate=args.rate_limit_rate,
+        error_rate=args.error_rate,
+    )
+    with FakeOpenAIServer(settings, port=args.port) as server:
+        print(f"Serving a fake OpenAI API at {server.base_url}, set it as [openai] base_url")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
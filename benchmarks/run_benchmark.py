@@ -0,0 +1,181 @@
+"""
+Runs `create_migration_plan` end to end on a generated repository against the fake OpenAI server, and reports the
+wall time, throughput, peak RSS, per-stage timings and LLM token accounting as JSON.
+
+    PYTHONPATH=src python -m benchmarks.run_benchmark --files 1000 --median-latency 0.2 --rate-limit-rate 0.02
+    PYTHONPATH=src python -m benchmarks.run_benchmark --files 1000 --baseline benchmarks/results/<previous>.json
+
+Everything runs in a temporary working directory with its own config.ini, so the project's input, output, cache
+and config are left alone.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from dataclasses import asdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict
+
+from benchmarks.fake_openai_server import FakeOpenAIServer, FakeServerSettings
+from benchmarks.synthetic_repo import generate_repository
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = PROJECT_ROOT / "benchmarks" / "results"
+PROJECT_NAME = "synthetic"
+
+CONFIG_TEMPLATE = """[general]
+cache_llm_responses=False
+input_project={project}
+file_extensions_to_analyze=java,xml,gradle,properties,md,adoc
+file_extensions_to_migrate=.java,.xml,.properties
+log_llm_responses=False
+
+[openai]
+model=gpt-4o-mini
+api_key=benchmark
+base_url={base_url}
+
+[scheduler]
+max_concurrency={max_concurrency}
+requests_per_minute={requests_per_minute}
+tokens_per_minute={tokens_per_minute}
+backoff_base_seconds=0.05
+backoff_max_seconds=2.0
+
+[cache]
+enabled={cache}
+dir=./cache/analysis
+"""
+
+
+def _peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def _version() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _prepare_workdir(workdir: Path, args: argparse.Namespace, base_url: str) -> int:
+    file_count = generate_repository(workdir / "input" / PROJECT_NAME, args.files, args.fields, args.seed)
+    try:
+        (workdir / "resources").symlink_to(PROJECT_ROOT / "resources", target_is_directory=True)
+    except OSError:  # Symlinks need extra privileges on Windows
+        shutil.copytree(PROJECT_ROOT / "resources", workdir / "resources")
+    (workdir / "output" / "llm_responses").mkdir(parents=True)
+    (workdir / "config.ini").write_text(
+        CONFIG_TEMPLATE.format(
+            project=PROJECT_NAME,
+            base_url=base_url,
+            max_concurrency=args.max_concurrency,
+            requests_per_minute=args.requests_per_minute,
+            tokens_per_minute=args.tokens_per_minute,
+            cache=args.cache,
+        )
+    )
+    return file_count
+
+
+def _compare(result: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    print(f"Compared to {baseline['version']} ({baseline['timestamp']}):")
+    metrics = [("wall_seconds", result["wall_seconds"], baseline["wall_seconds"])]
+    metrics.append(("files_per_second", result["files_per_second"], baseline["files_per_second"]))
+    if result["peak_rss_mb"] and baseline["peak_rss_mb"]:
+        metrics.append(("peak_rss_mb", result["peak_rss_mb"], baseline["peak_rss_mb"]))
+    for stage, seconds in result["stages"].items():
+        if stage in baseline["stages"]:
+            metrics.append((stage, seconds, baseline["stages"][stage]))
+    for name, value, baseline_value in metrics:
+        change = (value - baseline_value) / baseline_value * 100 if baseline_value else 0.0
+        print(f"  {name}: {baseline_value:.2f} -> {value:.2f} ({change:+.1f}%)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=100, help="Files of the generated repository (10 to 50000)")
+    parser.add_argument("--fields", type=int, default=10, help="Fields per generated entity")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--median-latency", type=float, default=0.05, help="Median seconds per LLM request")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--seconds-per-output-token", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with a 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 500")
+    parser.add_argument("--max-concurrency", type=int, default=32)
+    parser.add_argument("--requests-per-minute", type=int, default=0)
+    parser.add_argument("--tokens-per-minute", type=int, default=0)
+    parser.add_argument("--cache", action="store_true", help="Run with the analysis cache enabled")
+    parser.add_argument("--output", type=Path, help="Where to save the JSON result, benchmarks/results by default")
+    parser.add_argument("--baseline", type=Path, help="A previous result to compare with")
+    parser.add_argument("--verbose", action="store_true", help="Keep the planner's info logs")
+    args = parser.parse_args()
+
+    settings = FakeServerSettings(
+        median_latency_seconds=args.median_latency,
+        latency_sigma=args.latency_sigma,
+        seconds_per_output_token=args.seconds_per_output_token,
+        rate_limit_rate=args.rate_limit_rate,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    original_cwd = Path.cwd()
+    with tempfile.TemporaryDirectory() as directory, FakeOpenAIServer(settings) as server:
+        workdir = Path(directory)
+        file_count = _prepare_workdir(workdir, args, server.base_url)
+        # The planner reads config.ini and resolves its input, output and resources relative to the working directory
+        os.chdir(workdir)
+        try:
+            from service import migration_planner
+            from util.log_manager import stage_timings
+
+            if not args.verbose:
+                logging.getLogger("log_manager").setLevel(logging.WARNING)
+                # langchain-openai's parsed responses trip pydantic's serializer warnings on every request
+                warnings.filterwarnings("ignore", message="Pydantic serializer warnings")
+            start = time.perf_counter()
+            asyncio.run(migration_planner.create_migration_plan())
+            wall_seconds = time.perf_counter() - start
+        finally:
+            os.chdir(original_cwd)
+
+    result: Dict[str, Any] = {
+        "version": _version(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "parameters": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+        "files": file_count,
+        "wall_seconds": wall_seconds,
+        "files_per_second": file_count / wall_seconds,
+        "peak_rss_mb": _peak_rss_mb(),
+        "stages": dict(stage_timings),
+        "llm": asdict(server.stats),
+    }
+    output = args.output or RESULTS_DIR / f"{result['timestamp'].replace(':', '-')}_{file_count}_files.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+    print(json.dumps(result, indent=2))
+    print(f"Saved the result to {output}")
+    if args.baseline:
+        _compare(result, json.loads(args.baseline.read_text()))
+
+
+if __name__ == "__main__":
+    main()
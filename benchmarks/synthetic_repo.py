@@ -0,0 +1,238 @@
+import random
+from pathlib import Path
+from typing import List, Tuple
+
+ENTITY_TEMPLATE = """package com.example.app.model;
+
+import jakarta.persistence.*;
+import jakarta.validation.constraints.*;
+
+/**
+ * The {name} entity.
+ */
+@Entity
+@Table(name = "{table}", uniqueConstraints = @UniqueConstraint(columnNames = "code"))
+public class {name} implements Serializable {{
+    @Id
+    @GeneratedValue
+    private Long id;
+
+    @NotNull
+    @Size(min = 1, max = 64)
+    private String code;
+{fields}
+    public Long getId() {{
+        return id;
+    }}
+
+    public void setId(Long id) {{
+        this.id = id;
+    }}
+{accessors}}}
+"""
+
+FIELD_TEMPLATE = """
+    @Column(name = "{column}")
+    private {type} {field};
+"""
+
+ACCESSOR_TEMPLATE = """
+    public {type} get{property}() {{
+        return {field};
+    }}
+
+    public void set{property}({type} {field}) {{
+        this.{field} = {field};
+    }}
+"""
+
+RESOURCE_TEMPLATE = """package com.example.app.rest;
+
+import jakarta.ws.rs.*;
+import jakarta.ws.rs.core.*;
+
+@Path("/{path}")
+@RequestScoped
+public class {name}Resource {{
+    @Inject
+    private {name}Repository repository;
+
+    @GET
+    @Produces(MediaType.APPLICATION_JSON)
+    public List<{name}> listAll() {{
+        // Sorted by code, the UI relies on it
+        return repository.findAllOrderedByCode();
+    }}
+
+    @GET
+    @Path("/{{id:[0-9]+}}")
+    @Produces(MediaType.APPLICATION_JSON)
+    public {name} lookup(@PathParam("id") long id) {{
+        {name} entity = repository.findById(id);
+        if (entity == null) {{
+            throw new WebApplicationException(Response.Status.NOT_FOUND);
+        }}
+        return entity;
+    }}
+
+    @POST
+    @Consumes(MediaType.APPLICATION_JSON)
+    public Response create({name} entity) {{
+        repository.save(entity);
+        return Response.ok().build();
+    }}
+}}
+"""
+
+DATASOURCE_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<datasources xmlns="http://www.jboss.org/ironjacamar/schema">
+    <datasource jndi-name="java:jboss/datasources/Module{index}DS" pool-name="module{index}">
+        <connection-url>jdbc:h2:mem:module{index}</connection-url>
+        <driver>h2</driver>
+    </datasource>
+</datasources>
+"""
+
+REPOSITORY_TEMPLATE = """package com.example.app.data;
+
+import jakarta.enterprise.context.ApplicationScoped;
+import jakarta.inject.Inject;
+import jakarta.persistence.EntityManager;
+import jakarta.persistence.criteria.*;
+
+@ApplicationScoped
+public class {name}Repository {{
+    @Inject
+    private EntityManager em;
+
+    public {name} findById(Long id) {{
+        return em.find({name}.class, id);
+    }}
+
+    public List<{name}> findAllOrderedByCode() {{
+        CriteriaBuilder cb = em.getCriteriaBuilder();
+        CriteriaQuery<{name}> criteria = cb.createQuery({name}.class);
+        Root<{name}> root = criteria.from({name}.class);
+        criteria.select(root).orderBy(cb.asc(root.get("code")));
+        return em.createQuery(criteria).getResultList();
+    }}
+
+    public void save({name} entity) {{
+        em.persist(entity);
+    }}
+}}
+"""
+
+SERVICE_TEMPLATE = """package com.example.app.service;
+
+import jakarta.ejb.Stateless;
+import jakarta.enterprise.event.Event;
+import jakarta.inject.Inject;
+import java.util.logging.Logger;
+
+@Stateless
+public class {name}Registration {{
+    @Inject
+    private Logger log;
+
+    @Inject
+    private {name}Repository repository;
+
+    @Inject
+    private Event<{name}> eventSrc;
+
+    public void register({name} entity) throws Exception {{
+        log.info("Registering " + entity.getCode());
+        repository.save(entity);
+        eventSrc.fire(entity);
+    }}
+}}
+"""
+
+STATIC_FILES = {
+    "pom.xml": """<?xml version="1.0" encoding="UTF-8"?>
+<project xmlns="http://maven.apache.org/POM/4.0.0">
+    <modelVersion>4.0.0</modelVersion>
+    <groupId>com.example</groupId>
+    <artifactId>synthetic-app</artifactId>
+    <version>1.0.0</version>
+    <packaging>war</packaging>
+    <dependencies>
+        <dependency><groupId>jakarta.platform</groupId><artifactId>jakarta.jakartaee-api</artifactId><version>10.0.0</version><scope>provided</scope></dependency>
+        <dependency><groupId>org.hibernate.orm</groupId><artifactId>hibernate-core</artifactId><version>6.4.0.Final</version><scope>provided</scope></dependency>
+        <dependency><groupId>junit</groupId><artifactId>junit</artifactId><version>4.13.2</version><scope>test</scope></dependency>
+    </dependencies>
+</project>
+""",
+    "src/main/resources/META-INF/persistence.xml": """<?xml version="1.0" encoding="UTF-8"?>
+<persistence version="3.0" xmlns="https://jakarta.ee/xml/ns/persistence">
+    <persistence-unit name="primary">
+        <jta-data-source>java:jboss/datasources/Module0DS</jta-data-source>
+        <properties>
+            <property name="hibernate.hbm2ddl.auto" value="create-drop" />
+        </properties>
+    </persistence-unit>
+</persistence>
+""",
+    "src/main/webapp/WEB-INF/beans.xml": """<?xml version="1.0" encoding="UTF-8"?>
+<beans xmlns="https://jakarta.ee/xml/ns/jakartaee" bean-discovery-mode="all">
+</beans>
+""",
+    "src/main/java/com/example/app/rest/JaxRsActivator.java": """package com.example.app.rest;
+
+import jakarta.ws.rs.ApplicationPath;
+import jakarta.ws.rs.core.Application;
+
+@ApplicationPath("/rest")
+public class JaxRsActivator extends Application {
+}
+""",
+    "README.md": """# Synthetic application
+
+A generated JBoss EAP application with JPA entities, JAX-RS resources and an H2 database.
+""",
+}
+
+FIELD_TYPES = ["String", "Integer", "Long", "Boolean", "BigDecimal", "LocalDate"]
+
+
+def _entity(name: str, field_count: int, rng: random.Random) -> str:
+    fields = []
+    accessors = []
+    for i in range(field_count):
+        field_type = rng.choice(FIELD_TYPES)
+        field = f"attribute{i}"
+        fields.append(FIELD_TEMPLATE.format(column=f"attribute_{i}", type=field_type, field=field))
+        accessors.append(ACCESSOR_TEMPLATE.format(type=field_type, property=f"Attribute{i}", field=field))
+    return ENTITY_TEMPLATE.format(name=name, table=name.lower(), fields="".join(fields), accessors="".join(accessors))
+
+
+def _module_files(index: int, fields_per_entity: int, rng: random.Random) -> List[Tuple[str, str]]:
+    name = f"Entity{index}"
+    java_root = "src/main/java/com/example/app"
+    return [
+        (f"{java_root}/model/{name}.java", _entity(name, fields_per_entity, rng)),
+        (f"{java_root}/rest/{name}Resource.java", RESOURCE_TEMPLATE.format(name=name, path=name.lower())),
+        (f"{java_root}/data/{name}Repository.java", REPOSITORY_TEMPLATE.format(name=name)),
+        (f"{java_root}/service/{name}Registration.java", SERVICE_TEMPLATE.format(name=name)),
+        (f"src/main/webapp/WEB-INF/module{index}-ds.xml", DATASOURCE_TEMPLATE.format(index=index)),
+    ]
+
+
+def generate_repository(root: Path, file_count: int, fields_per_entity: int = 20, seed: int = 0) -> int:
+    """
+    Generates a kitchensink-like repository of `file_count` files: a pom.xml, persistence.xml, beans.xml, JAX-RS
+    activator and readme, then modules of an entity, its REST resource, repository, registration service and data
+    source. Returns the number of generated files.
+    """
+    rng = random.Random(seed)
+    files = list(STATIC_FILES.items())[:file_count]
+    index = 0
+    while len(files) < file_count:
+        files.extend(_module_files(index, fields_per_entity, rng)[: file_count - len(files)])
+        index += 1
+    for relative_path, content in files:
+        path = root / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    return len(files)
@@ -1,31 +1,101 @@
+import argparse
 import asyncio
+import json
+from functools import partial
 from pathlib import Path
+from typing import List
 
-from langchain.globals import set_llm_cache
-from langchain_community.cache import SQLiteCache
-
-from service.migration_planner import create_migration_plan
+from service.migration_planner import create_migration_plan, estimate_migration_plan
+from service.project_batch import estimate_projects, migrate_projects, resolve_projects
 from util.config import get_config
 from util.log_manager import LogManager, log_time
 from util.md_utils import generate_markdown_from_json
 
 OUTPUT_TEMPLATE_PATH = Path("./resources/output_templates/migration_plan.md.j2")
 OUTPUT_RESULT_PATH = Path("./output/migration_plan.md")
+OUTPUT_DIR = Path("./output")
+ESTIMATE_RESULT_PATH = Path("./output/run_estimate.json")
 
 log = LogManager.get_logger()
 config = get_config()
-if config.cache_llm_responses:
-    log.info("Using cached LLM responses.")
-    set_llm_cache(SQLiteCache("./cache/.langchain.db"))
 
 
-async def main() -> None:
+def use_llm_cache() -> None:
+    """Sets up LangChain's response cache, if enabled. Only the runs that call the LLM pay for its imports."""
+    if config.cache_llm_responses:
+        from langchain.globals import set_llm_cache
+        from langchain_community.cache import SQLiteCache
+
+        log.info("Using cached LLM responses.")
+        set_llm_cache(SQLiteCache("./cache/.langchain.db"))
+
+
+async def main(resume: bool) -> None:
+    use_llm_cache()
     async with log_time("Code migration planner", log):
-        code_migration_output = await create_migration_plan()
+        code_migration_output = await create_migration_plan(resume)
         # Add the repository name for the title placeholder
         code_migration_output["application_name"] = config.input_project
-        generate_markdown_from_json(code_migration_output, OUTPUT_TEMPLATE_PATH, OUTPUT_RESULT_PATH)
+        await asyncio.to_thread(
+            generate_markdown_from_json,
+            code_migration_output,
+            OUTPUT_TEMPLATE_PATH,
+            OUTPUT_RESULT_PATH,
+            config.output_shard_by,
+        )
+
+
+def _resolve_projects(patterns: List[str]) -> List[str]:
+    projects = resolve_projects(patterns)
+    if not projects:
+        raise SystemExit(f"No project in ./input matches {' '.join(patterns)}")
+    return projects
+
+
+async def main_projects(patterns: List[str], resume: bool) -> None:
+    projects = _resolve_projects(patterns)
+    use_llm_cache()
+    async with log_time(f"Code migration planner for {len(projects)} projects", log):
+        render_plan = partial(
+            generate_markdown_from_json, template_path=OUTPUT_TEMPLATE_PATH, shard_by=config.output_shard_by
+        )
+        await migrate_projects(projects, render_plan, OUTPUT_DIR, resume)
+
+
+async def dry_run(patterns: List[str] | None) -> None:
+    if patterns:
+        projects = _resolve_projects(patterns)
+        estimate = await estimate_projects(projects)
+    else:
+        projects = [config.input_project]
+        estimate = await estimate_migration_plan()
+    log.info("Estimated migration run of %s:\n%s", ", ".join(projects), estimate.render())
+    ESTIMATE_RESULT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    ESTIMATE_RESULT_PATH.write_text(json.dumps(estimate.to_dict(), indent=2))
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Plans the migration of a legacy Java application.")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Reuse the work journaled by the previous run of the project and only do what's missing",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only estimate the requests, tokens, cost and wall time of a run, without sending anything to the LLM",
+    )
+    parser.add_argument(
+        "--projects",
+        nargs="+",
+        metavar="PROJECT",
+        help="Migrate these projects of ./input instead of the configured one, names or glob patterns like 'svc-*'",
+    )
+    args = parser.parse_args()
+    if args.dry_run:
+        asyncio.run(dry_run(args.projects))
+    elif args.projects:
+        asyncio.run(main_projects(args.projects, args.resume))
+    else:
+        asyncio.run(main(args.resume))
@@ -36,6 +36,21 @@ class CurrentApplication(BaseModel):
     )
 
 
+class ApplicationSummary(BaseModel):
+    application_summary: str = Field(
+        description="A paragraph containing a comprehensible summary of the analyzed application. It should include at the very least a programming language, web framework, databases used, and the main tech stack."
+    )
+
+
+class FileAnalysis(BaseModel):
+    file_path: str = Field(description="The path of the analyzed file exactly as given in the prompt.")
+    analysis: str = Field(description="The analysis of the file.")
+
+
+class FileAnalyses(BaseModel):
+    analyses: List[FileAnalysis] = Field(description="The analysis of every file given in the prompt.")
+
+
 class MongoDBDesignDecision(BaseModel):
     name: str = Field(
         description="A name that represents the design decision for recommending the proposed MongoDB schema."
@@ -58,6 +73,17 @@ class MigratedFileSchema(BaseModel):
     file_category: str = Field(description="The spring stereotype of that file")
 
 
+class MigratedFilePartSchema(BaseModel):
+    header: str = Field(
+        description="The beginning of the migrated file that precedes this part: the package, the imports this part needs and the declaration of the enclosing type, or the XML prolog and root element start tag. Empty if there is none."
+    )
+    body: str = Field(description="The migrated version of this part of the file only, without the header and footer.")
+    footer: str = Field(
+        description="The end of the migrated file that follows this part, e.g. the closing brace of the enclosing type or the root element end tag. Empty if there is none."
+    )
+    file_category: str = Field(description="The spring stereotype of the whole migrated file")
+
+
 class ImplementationStep(BaseModel):
     name: str = Field(
         description="A name that describes the goal of the implementation step. For example: 'Set up MongoDB environment' or 'Update service layer'"
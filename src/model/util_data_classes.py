@@ -1,12 +1,67 @@
-from dataclasses import dataclass
+from collections.abc import Mapping
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Iterator, Tuple
 
-from langchain_core.documents import Document
+if TYPE_CHECKING:
+    from service.record_store import RecordStore
 
 
-@dataclass
 class AnalyzedFileDefinition:
-    doc: Document
-    analysis: str
-    name: str
-    relative_path: str
-    file_extension: str
+    """
+    A file of the repository and its analysis. Only the file's metadata is held in memory, its content and analysis
+    are read from the record store on access.
+    """
+
+    __slots__ = ("store", "relative_path", "name", "file_extension")
+
+    def __init__(self, store: "RecordStore", relative_path: str) -> None:
+        self.store = store
+        self.relative_path = relative_path
+        path = Path(relative_path)
+        self.name = path.name
+        self.file_extension = path.suffix
+
+    @property
+    def content(self) -> str:
+        return self.store.content(self.relative_path)
+
+    @property
+    def analysis(self) -> str:
+        return self.store.analysis(self.relative_path)
+
+
+class MigratedFileDefinition(Mapping[str, Any]):
+    """
+    The migrated version of a file. It reads like the dict the plan used to hold, e.g. `file["new_file"]` or
+    `file.new_file` in a template, but the new file's content is only read from the record store on access.
+    """
+
+    __slots__ = ("store", "relative_path", "name", "file_extension", "file_category")
+    KEYS: Tuple[str, ...] = ("name", "relative_path", "file_extension", "file_category", "new_file")
+
+    def __init__(self, store: "RecordStore", relative_path: str, file_category: str) -> None:
+        self.store = store
+        self.relative_path = relative_path
+        path = Path(relative_path)
+        self.name = path.name
+        self.file_extension = path.suffix
+        self.file_category = file_category
+
+    @property
+    def new_file(self) -> str:
+        return self.store.new_file(self.relative_path)
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.KEYS)
+
+    def __len__(self) -> int:
+        return len(self.KEYS)
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        # The store stays in this process, elsewhere (e.g. a process pool rendering the plan) it's a plain dict
+        return dict, (dict(self),)
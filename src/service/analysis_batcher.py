@@ -0,0 +1,136 @@
+import asyncio
+from typing import Awaitable, Callable, Generic, List, Set, TypeVar
+
+from util.log_manager import LogManager
+
+T = TypeVar("T")
+
+log = LogManager.get_logger()
+
+
+class _Batch(Generic[T]):
+    def __init__(self) -> None:
+        self.items: List[T] = []
+        self.results: List[asyncio.Future[str | None]] = []
+        self.tokens = 0
+
+
+class AnalysisBatcher(Generic[T]):
+    """
+    Bin-packs small files into multi-file analysis requests as they arrive. A file goes into the first open batch it
+    fits (first fit), and a batch is sent as soon as no other small file could fit it anymore, or when too many
+    batches are open, so the analysis of the scanned files starts before the scan is done.
+
+    `run_batch` returns an analysis per item, in order. An item without one resolves to `None`, and so do all the
+    items of a failed batch, so the caller can fall back to analyzing them one by one.
+
+    Every file the caller is going to decide about is announced with `expect`, and the returned slot is then either
+    submitted or skipped. Once `close` is called and every slot is decided, the remaining open batches are sent.
+    While the caller has `pause`d, e.g. waiting for the files in flight before reading more, no other file could fill
+    a batch, so the open batches and every new one are sent right away until it `resume`s.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[T]], Awaitable[List[str | None]]],
+        token_budget: int,
+        max_item_tokens: int,
+        max_items: int,
+        max_open_batches: int = 4,
+    ) -> None:
+        self.run_batch = run_batch
+        self.token_budget = token_budget
+        self.max_item_tokens = max_item_tokens
+        self.max_items = max_items
+        self.max_open_batches = max_open_batches
+        self._open_batches: List[_Batch[T]] = []
+        # Keeps references to the running batches, the event loop only keeps weak ones
+        self._running: Set[asyncio.Task[None]] = set()
+        self._expected = 0
+        self._closed = False
+        self._paused = False
+        self.batches_sent = 0
+
+    def expect(self) -> "BatchSlot[T]":
+        self._expected += 1
+        return BatchSlot(self)
+
+    def close(self) -> None:
+        """No more files are coming, the open batches are sent as soon as all the expected files are decided."""
+        self._closed = True
+        self._flush_if_done()
+
+    def pause(self) -> None:
+        self._paused = True
+        for batch in list(self._open_batches):
+            self._send(batch)
+
+    def resume(self) -> None:
+        self._paused = False
+
+    def _submit(self, item: T, tokens: int) -> "asyncio.Future[str | None]":
+        result: asyncio.Future[str | None] = asyncio.get_running_loop().create_future()
+        batch = next((batch for batch in self._open_batches if batch.tokens + tokens <= self.token_budget), None)
+        if batch is None:
+            if len(self._open_batches) >= self.max_open_batches:
+                self._send(max(self._open_batches, key=lambda open_batch: open_batch.tokens))
+            batch = _Batch()
+            self._open_batches.append(batch)
+        batch.items.append(item)
+        batch.results.append(result)
+        batch.tokens += tokens
+        if (
+            self._paused
+            or len(batch.items) >= self.max_items
+            or batch.tokens + self.max_item_tokens > self.token_budget
+        ):
+            self._send(batch)
+        return result
+
+    def _decided(self) -> None:
+        self._expected -= 1
+        self._flush_if_done()
+
+    def _flush_if_done(self) -> None:
+        if self._closed and self._expected <= 0:
+            for batch in list(self._open_batches):
+                self._send(batch)
+
+    def _send(self, batch: _Batch[T]) -> None:
+        self._open_batches.remove(batch)
+        self.batches_sent += 1
+        task = asyncio.ensure_future(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: _Batch[T]) -> None:
+        try:
+            analyses = await self.run_batch(batch.items)
+        except Exception:
+            log.exception("Failed to analyze a batch of %d files, analyzing them one by one", len(batch.items))
+            analyses = []
+        for i, result in enumerate(batch.results):
+            if not result.done():
+                result.set_result(analyses[i] if i < len(analyses) else None)
+
+
+class BatchSlot(Generic[T]):
+    """The batcher's place for an expected file. Only the first decision counts, so it's safe to skip in a `finally`."""
+
+    def __init__(self, batcher: AnalysisBatcher[T]) -> None:
+        self._batcher = batcher
+        self._decided = False
+
+    def submit(self, item: T, tokens: int) -> "asyncio.Future[str | None]":
+        if self._decided:
+            raise RuntimeError("The batch slot was already decided")
+        self._decided = True
+        result = self._batcher._submit(item, tokens)
+        self._batcher._decided()
+        return result
+
+    def skip(self) -> None:
+        """Marks the file as not batched, e.g. because it's too big or its analysis is cached."""
+        if not self._decided:
+            self._decided = True
+            self._batcher._decided()
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Set
+
+from util.config import AppConfig
+from util.log_manager import LogManager
+
+log = LogManager.get_logger()
+
+
+@dataclass
+class ManifestDiff:
+    added: List[str] = field(default_factory=list)
+    modified: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+
+class AnalysisCache:
+    """
+    A content-addressed cache of per-file LLM results.
+    Entries are keyed by a hash of everything that determines the response (stage, file content, prompt template and
+    model), so editing one file, template or model only invalidates the entries that actually depend on it.
+    A manifest per project records the content hash of every file and the entries the last run used, which is used
+    to report what changed between runs and to keep the live entries safe from garbage collection.
+    """
+
+    def __init__(self, cache_dir: Path, max_entries: int = 0, max_size_mb: int = 0, max_age_days: int = 0) -> None:
+        self.cache_dir = cache_dir
+        self.objects_dir = cache_dir / "objects"
+        self.manifests_dir = cache_dir / "manifests"
+        self.max_entries = max_entries
+        self.max_size_bytes = max_size_mb * 1024 * 1024
+        self.max_age_seconds = max_age_days * 24 * 60 * 60
+        self.hits = 0
+        self.misses = 0
+        self._tracked_keys: Set[str] = set()
+
+    @classmethod
+    def from_config(cls, config: AppConfig) -> "AnalysisCache":
+        return cls(
+            Path(config.analysis_cache_dir),
+            max_entries=config.analysis_cache_max_entries,
+            max_size_mb=config.analysis_cache_max_size_mb,
+            max_age_days=config.analysis_cache_max_age_days,
+        )
+
+    @staticmethod
+    def compute_key(stage: str, *parts: str) -> str:
+        digest = hashlib.sha256(stage.encode())
+        for part in parts:
+            # Length prefixes keep ("ab", "c") and ("a", "bc") from hashing the same
+            encoded = part.encode("utf-8", errors="surrogatepass")
+            digest.update(len(encoded).to_bytes(8, "big"))
+            digest.update(encoded)
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.objects_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Any | None:
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+        # The modification time doubles as the last access time for the LRU eviction
+        os.utime(path)
+        self.hits += 1
+        self._tracked_keys.add(key)
+        return value
+
+    def peek(self, key: str) -> Any | None:
+        """Like `get`, but neither counted nor tracked, e.g. for estimating a run."""
+        try:
+            with open(self._entry_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, key: str, value: Any) -> None:
+        path = self._entry_path(key)
+        _write_atomically(path, json.dumps(value))
+        self._tracked_keys.add(key)
+
+    def _manifest_path(self, project: str) -> Path:
+        return self.manifests_dir / f"{project}.json"
+
+    def _load_manifest(self, project: str) -> Dict[str, Any]:
+        try:
+            with open(self._manifest_path(project), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"files": {}, "keys": []}
+
+    def diff_manifest(self, project: str, file_hashes: Dict[str, str]) -> ManifestDiff:
+        previous_files: Dict[str, str] = self._load_manifest(project)["files"]
+        diff = ManifestDiff()
+        for relative_path, file_hash in file_hashes.items():
+            if relative_path not in previous_files:
+                diff.added.append(relative_path)
+            elif previous_files[relative_path] != file_hash:
+                diff.modified.append(relative_path)
+            else:
+                diff.unchanged.append(relative_path)
+        diff.removed = [relative_path for relative_path in previous_files if relative_path not in file_hashes]
+        return diff
+
+    def save_manifest(self, project: str, files: Dict[str, str]) -> None:
+        """
+        Saves the content hashes of the project's files and the entries used so far.
+        A cache shared by several projects in one run records the entries used by all of them, which only keeps more
+        entries safe from garbage collection.
+        """
+        manifest = {"files": files, "keys": sorted(self._tracked_keys)}
+        _write_atomically(self._manifest_path(project), json.dumps(manifest, indent=2))
+
+    def _live_keys(self) -> Set[str]:
+        live_keys = set(self._tracked_keys)
+        if self.manifests_dir.exists():
+            for manifest_path in self.manifests_dir.glob("*.json"):
+                live_keys.update(self._load_manifest(manifest_path.stem)["keys"])
+        return live_keys
+
+    def collect_garbage(self) -> int:
+        """
+        Evicts entries older than the max age, then the least recently used ones until the cache is within its
+        entry and size limits. Entries referenced by a project's latest manifest are never evicted.
+        Returns the number of evicted entries.
+        """
+        if not self.objects_dir.exists():
+            return 0
+        live_keys = self._live_keys()
+        entries = []
+        for path in self.objects_dir.glob("*/*.json"):
+            stat = path.stat()
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        now = time.time()
+        total_entries = len(entries)
+        total_size = sum(size for _, size, _ in entries)
+        evicted = 0
+        for mtime, size, path in entries:
+            expired = self.max_age_seconds > 0 and now - mtime > self.max_age_seconds
+            too_many = self.max_entries > 0 and total_entries > self.max_entries
+            too_big = self.max_size_bytes > 0 and total_size > self.max_size_bytes
+            if not (expired or too_many or too_big):
+                # Entries are sorted by access time, none of the newer ones can be expired either
+                break
+            if path.stem in live_keys:
+                continue
+            path.unlink(missing_ok=True)
+            total_entries -= 1
+            total_size -= size
+            evicted += 1
+
+        if evicted:
+            log.info("Evicted %d entries from the analysis cache", evicted)
+        return evicted
+
+
+def _write_atomically(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file in the same directory and rename it, so readers never see a partial entry
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
@@ -0,0 +1,99 @@
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, Tuple, Type
+
+from langchain_core.prompts import PromptTemplate
+from langchain_core.runnables import Runnable
+from pydantic import BaseModel, SecretStr
+
+from service.provider_pool import Endpoint
+from util.config import AppConfig
+from util.token_counter import count_tokens
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
+
+PROMPTS_TEMPLATES_DIR = Path("./resources/prompts_templates")
+
+
+class ChainRegistry:
+    """
+    Builds the parts of the LLM chains once per process: the prompt templates are read and compiled on first use, and
+    so is the structured output binding of every response model. The LLM clients, one per endpoint of the provider pool,
+    and the OpenAI stack they import, are only created when the first chain needs them, so commands and tests that
+    never call the LLM don't pay for it.
+    Building a part twice from concurrent threads is harmless, the last one wins.
+    """
+
+    def __init__(self, config: AppConfig, templates_dir: Path = PROMPTS_TEMPLATES_DIR) -> None:
+        self._config = config
+        self._templates_dir = templates_dir
+        self._llm: "ChatOpenAI | None" = None
+        self._templates: Dict[str, str] = {}
+        self._template_tokens: Dict[str, int] = {}
+        self._prompts: Dict[Tuple[str, Tuple[str, ...]], PromptTemplate] = {}
+        self._clients: Dict[Endpoint, "ChatOpenAI"] = {}
+        self._models: Dict[Tuple[Type[BaseModel] | None, Endpoint | None], Runnable] = {}
+
+    def _create_client(self, model: str, api_key: str, base_url: str | None) -> "ChatOpenAI":
+        from langchain_openai import ChatOpenAI
+
+        # Retries are handled by the scheduler, so they are coordinated with the rate limits and the concurrency cap
+        return ChatOpenAI(
+            model=model,
+            api_key=SecretStr(api_key),
+            base_url=base_url,
+            temperature=self._config.temperature,
+            max_retries=0,
+        )
+
+    @property
+    def llm(self) -> "ChatOpenAI":
+        """The client of the `[openai]` endpoint."""
+        if self._llm is None:
+            self._llm = self._create_client(
+                self._config.openai_model, self._config.openai_key, self._config.openai_base_url
+            )
+        return self._llm
+
+    def client(self, endpoint: Endpoint | None = None) -> "ChatOpenAI":
+        """Returns the client of the endpoint, or of the `[openai]` endpoint if none is given."""
+        if endpoint is None:
+            return self.llm
+        if endpoint not in self._clients:
+            self._clients[endpoint] = self._create_client(endpoint.model, endpoint.api_key, endpoint.base_url)
+        return self._clients[endpoint]
+
+    def template(self, name: str) -> str:
+        """Returns the text of `<templates_dir>/<name>.prompt`."""
+        if name not in self._templates:
+            self._templates[name] = (self._templates_dir / f"{name}.prompt").read_text()
+        return self._templates[name]
+
+    def template_tokens(self, name: str) -> int:
+        if name not in self._template_tokens:
+            self._template_tokens[name] = count_tokens(self.template(name), self._config.openai_model)
+        return self._template_tokens[name]
+
+    def prompt(self, name: str, input_variables: Iterable[str]) -> PromptTemplate:
+        key = (name, tuple(input_variables))
+        if key not in self._prompts:
+            self._prompts[key] = PromptTemplate(template=self.template(name), input_variables=list(key[1]))
+        return self._prompts[key]
+
+    def model(self, response_model: Type[BaseModel] | None = None, endpoint: Endpoint | None = None) -> Runnable:
+        """Returns the endpoint's LLM, bound to answer with `response_model` if given."""
+        if response_model is None:
+            return self.client(endpoint)
+        key = (response_model, endpoint)
+        if key not in self._models:
+            self._models[key] = self.client(endpoint).with_structured_output(response_model)
+        return self._models[key]
+
+    def clear(self) -> None:
+        """Forgets everything built so far, e.g. after the prompt templates changed."""
+        self._llm = None
+        self._clients.clear()
+        self._templates.clear()
+        self._template_tokens.clear()
+        self._prompts.clear()
+        self._models.clear()
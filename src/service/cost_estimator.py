@@ -0,0 +1,317 @@
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+from util.config import AppConfig
+from util.log_manager import LogManager
+
+log = LogManager.get_logger()
+
+# Expected completion tokens of a request, standing in for the LLM outputs a dry run doesn't have
+ESTIMATED_COMPLETION_TOKENS = {"analysis": 450, "overview": 1500, "summary": 300, "schema": 600, "plan": 2500}
+# A migrated file is about the size of the file it replaces, plus its JSON envelope
+MIGRATION_COMPLETION_RATIO = 1.1
+# Stages that run at the same time and share the concurrency cap, the phases themselves run one after the other
+PHASES = (("analysis", "migration"), ("overview",), ("schema",), ("plan",))
+# Stages whose requests can be dropped once the spend limit is reached without losing the plan as a whole
+DEGRADABLE_STAGES = ("migration",)
+ON_EXCEED_ACTIONS = ("fail", "degrade")
+
+
+class BudgetExceededError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class ModelPricing:
+    input_price_per_million: float
+    output_price_per_million: float
+
+    def cost(self, prompt_tokens: int, completion_tokens: int) -> float:
+        return (prompt_tokens * self.input_price_per_million + completion_tokens * self.output_price_per_million) / 1e6
+
+
+@dataclass
+class StageEstimate:
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+    # The sum of the requests' latencies, and the longest one
+    latency_seconds: float = 0.0
+    max_latency_seconds: float = 0.0
+
+
+@dataclass
+class RunEstimate:
+    """
+    The projected requests, tokens, cost and wall time of a run, every request priced at its model's prices, by default
+    `pricing`. Every request's latency is modeled as a fixed overhead plus its completion tokens at a constant output
+    speed; a phase takes as long as the slowest of its latencies spread over the concurrency cap, its longest request,
+    and its requests and tokens at the per-minute limits.
+    """
+
+    pricing: ModelPricing
+    max_concurrency: int
+    requests_per_minute: int = 0
+    tokens_per_minute: int = 0
+    request_latency_seconds: float = 2.0
+    output_tokens_per_second: float = 60.0
+    files: int = 0
+    # Files whose analysis needs no request: described by their facts or already in the cache
+    files_without_analysis_request: int = 0
+    stages: Dict[str, StageEstimate] = field(default_factory=dict)
+
+    @classmethod
+    def from_config(cls, config: AppConfig) -> "RunEstimate":
+        return cls(
+            pricing=ModelPricing(config.input_price_per_million, config.output_price_per_million),
+            max_concurrency=config.max_concurrency,
+            requests_per_minute=config.requests_per_minute,
+            tokens_per_minute=config.tokens_per_minute,
+            request_latency_seconds=config.estimate_request_latency_seconds,
+            output_tokens_per_second=config.estimate_output_tokens_per_second,
+        )
+
+    def add_request(
+        self, stage: str, prompt_tokens: int, completion_tokens: int, pricing: ModelPricing | None = None
+    ) -> None:
+        estimate = self.stages.setdefault(stage, StageEstimate())
+        latency = self.request_latency_seconds + completion_tokens / self.output_tokens_per_second
+        estimate.requests += 1
+        estimate.prompt_tokens += prompt_tokens
+        estimate.completion_tokens += completion_tokens
+        estimate.cost_usd += (pricing or self.pricing).cost(prompt_tokens, completion_tokens)
+        estimate.latency_seconds += latency
+        estimate.max_latency_seconds = max(estimate.max_latency_seconds, latency)
+
+    def merge(self, other: "RunEstimate") -> None:
+        """Adds another project's estimate, for projects that run at the same time and share the budgets."""
+        self.files += other.files
+        self.files_without_analysis_request += other.files_without_analysis_request
+        for name, other_stage in other.stages.items():
+            stage = self.stages.setdefault(name, StageEstimate())
+            stage.requests += other_stage.requests
+            stage.prompt_tokens += other_stage.prompt_tokens
+            stage.completion_tokens += other_stage.completion_tokens
+            stage.cost_usd += other_stage.cost_usd
+            stage.latency_seconds += other_stage.latency_seconds
+            stage.max_latency_seconds = max(stage.max_latency_seconds, other_stage.max_latency_seconds)
+
+    @property
+    def requests(self) -> int:
+        return sum(stage.requests for stage in self.stages.values())
+
+    @property
+    def prompt_tokens(self) -> int:
+        return sum(stage.prompt_tokens for stage in self.stages.values())
+
+    @property
+    def completion_tokens(self) -> int:
+        return sum(stage.completion_tokens for stage in self.stages.values())
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def cost_usd(self) -> float:
+        return sum(stage.cost_usd for stage in self.stages.values())
+
+    @property
+    def wall_seconds(self) -> float:
+        total = 0.0
+        for phase in PHASES:
+            stages = [self.stages[stage] for stage in phase if stage in self.stages]
+            if not stages:
+                continue
+            requests = sum(stage.requests for stage in stages)
+            tokens = sum(stage.prompt_tokens + stage.completion_tokens for stage in stages)
+            bounds = [
+                sum(stage.latency_seconds for stage in stages) / max(1, self.max_concurrency),
+                max(stage.max_latency_seconds for stage in stages),
+            ]
+            if self.requests_per_minute > 0:
+                bounds.append(requests / self.requests_per_minute * 60)
+            if self.tokens_per_minute > 0:
+                bounds.append(tokens / self.tokens_per_minute * 60)
+            total += max(bounds)
+        return total
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "files": self.files,
+            "files_without_analysis_request": self.files_without_analysis_request,
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": round(self.cost_usd, 4),
+            "wall_seconds": round(self.wall_seconds, 1),
+            "stages": {
+                name: {
+                    "requests": stage.requests,
+                    "prompt_tokens": stage.prompt_tokens,
+                    "completion_tokens": stage.completion_tokens,
+                    "cost_usd": round(stage.cost_usd, 4),
+                }
+                for name, stage in self.stages.items()
+            },
+        }
+
+    def render(self) -> str:
+        lines = [
+            f"{self.files} files, {self.files_without_analysis_request} of them analyzed without a request",
+            f"{'stage':<12}{'requests':>10}{'prompt tokens':>16}{'output tokens':>16}{'cost USD':>12}",
+        ]
+        for name, stage in self.stages.items():
+            lines.append(
+                f"{name:<12}{stage.requests:>10}{stage.prompt_tokens:>16}{stage.completion_tokens:>16}"
+                f"{stage.cost_usd:>12.4f}"
+            )
+        lines.append(
+            f"{'total':<12}{self.requests:>10}{self.prompt_tokens:>16}{self.completion_tokens:>16}"
+            f"{self.cost_usd:>12.4f}"
+        )
+        lines.append(
+            f"Expected wall time: {self.wall_seconds / 60:.1f} minutes at a concurrency of {self.max_concurrency}"
+        )
+        return "\n".join(lines)
+
+
+def pack_into_batches(sizes: List[int], token_budget: int, max_items: int = 0, min_items: int = 1) -> List[List[int]]:
+    """
+    Greedily groups consecutive sizes into batches that fit the budget and, if given, the item cap, like
+    `batch_by_tokens` does with the texts themselves.
+    """
+    batches: List[List[int]] = []
+    batch: List[int] = []
+    for size in sizes:
+        over_budget = sum(batch) + size > token_budget and len(batch) >= min_items
+        if batch and (over_budget or (max_items and len(batch) >= max_items)):
+            batches.append(batch)
+            batch = []
+        batch.append(size)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def expected_completion_tokens(stage: str, prompt_tokens: int) -> int:
+    """The completion tokens a request of `stage` is expected to take, a migration's relative to its prompt."""
+    return ESTIMATED_COMPLETION_TOKENS.get(stage, int(prompt_tokens * MIGRATION_COMPLETION_RATIO))
+
+
+@dataclass(frozen=True)
+class SpendReservation:
+    tokens: int
+    cost_usd: float
+
+
+class SpendLimit:
+    """
+    Hard limits on the tokens and the cost of a run, 0 disables a limit.
+    Every request reserves its estimated spend before it's sent and releases it once it's done, when its actual usage
+    is recorded, so requests in flight together can't all pass the limit. A request that would go over it raises a
+    `BudgetExceededError`: with `on_exceed=fail` that aborts the run, with `degrade` only the requests of the
+    degradable stages (the per-file migrations) are dropped, so the analysis, overview, schemas and plan are still
+    produced.
+    """
+
+    def __init__(
+        self, pricing: ModelPricing, max_tokens: int = 0, max_cost_usd: float = 0.0, on_exceed: str = "fail"
+    ) -> None:
+        if on_exceed not in ON_EXCEED_ACTIONS:
+            raise ValueError(f"on_exceed must be one of {', '.join(ON_EXCEED_ACTIONS)}, got {on_exceed!r}")
+        self.pricing = pricing
+        self.max_tokens = max_tokens
+        self.max_cost_usd = max_cost_usd
+        self.on_exceed = on_exceed
+        self.spent_tokens = 0
+        self.spent_usd = 0.0
+        # The estimated spend of the requests in flight
+        self.reserved_tokens = 0
+        self.reserved_usd = 0.0
+        self._lock = threading.Lock()
+        self._degraded = False
+
+    @classmethod
+    def from_config(cls, config: AppConfig) -> "SpendLimit":
+        return cls(
+            ModelPricing(config.input_price_per_million, config.output_price_per_million),
+            max_tokens=config.spend_max_tokens,
+            max_cost_usd=config.spend_max_cost_usd,
+            on_exceed=config.spend_on_exceed,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_tokens > 0 or self.max_cost_usd > 0
+
+    def reset(self) -> None:
+        with self._lock:
+            self.spent_tokens = 0
+            self.spent_usd = 0.0
+            self.reserved_tokens = 0
+            self.reserved_usd = 0.0
+            self._degraded = False
+
+    def record(self, prompt_tokens: int, completion_tokens: int, pricing: ModelPricing | None = None) -> None:
+        """Records spent tokens, priced at `pricing` if they were spent on another model than the default one."""
+        with self._lock:
+            self.spent_tokens += prompt_tokens + completion_tokens
+            self.spent_usd += (pricing or self.pricing).cost(prompt_tokens, completion_tokens)
+
+    def _overrun(self, tokens: int, cost_usd: float) -> str | None:
+        if self.max_tokens > 0 and tokens > self.max_tokens:
+            return f"{tokens} tokens exceed the limit of {self.max_tokens}"
+        if self.max_cost_usd > 0 and cost_usd > self.max_cost_usd:
+            return f"${cost_usd:.4f} exceeds the limit of ${self.max_cost_usd:.4f}"
+        return None
+
+    def check_projection(self, estimate: RunEstimate) -> None:
+        """Fails before the first request if the projected spend is over the limit, or warns when degrading."""
+        overrun = self._overrun(estimate.total_tokens, estimate.cost_usd)
+        if overrun is None:
+            return
+        if self.on_exceed == "fail":
+            raise BudgetExceededError(f"The projected spend of the run is over the limit: {overrun}")
+        log.warning("The projected spend of the run is over the limit, some files won't be migrated: %s", overrun)
+
+    def reserve(
+        self,
+        stage: str,
+        estimated_prompt_tokens: int,
+        estimated_completion_tokens: int = 0,
+        pricing: ModelPricing | None = None,
+    ) -> SpendReservation | None:
+        """
+        Reserves the estimated spend of a request of `stage`, or raises a `BudgetExceededError` if the spend so far,
+        the reservations in flight and this request would go over the limit. None if there's no limit.
+        """
+        if not self.enabled:
+            return None
+        tokens = estimated_prompt_tokens + estimated_completion_tokens
+        cost_usd = (pricing or self.pricing).cost(estimated_prompt_tokens, estimated_completion_tokens)
+        with self._lock:
+            overrun = None
+            # Requests of the stages that aren't degraded still count against the limit of the ones that are
+            if self.on_exceed == "fail" or stage in DEGRADABLE_STAGES:
+                overrun = self._overrun(
+                    self.spent_tokens + self.reserved_tokens + tokens, self.spent_usd + self.reserved_usd + cost_usd
+                )
+            if overrun is None:
+                self.reserved_tokens += tokens
+                self.reserved_usd += cost_usd
+                return SpendReservation(tokens, cost_usd)
+            if self.on_exceed == "degrade" and not self._degraded:
+                self._degraded = True
+                log.warning("Spend limit reached (%s), skipping the %s requests from now on", overrun, stage)
+        raise BudgetExceededError(f"Spend limit reached: {overrun}")
+
+    def release(self, reservation: SpendReservation | None) -> None:
+        """Releases the reservation of a finished request, whose actual usage is recorded by then."""
+        if reservation is None:
+            return
+        with self._lock:
+            self.reserved_tokens -= reservation.tokens
+            self.reserved_usd -= reservation.cost_usd
@@ -0,0 +1,183 @@
+import re
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Set
+
+from util.java_source import mask_comments_and_literals, parse_java
+
+# Capitalized identifiers, the simple names of the types a file may refer to
+_TYPE_NAME_PATTERN = re.compile(r"\b[A-Z][\w$]*\b")
+
+
+@dataclass
+class TypeReferences:
+    package: str
+    # The simple names of the top-level types the file declares
+    declared: List[str]
+    # Single-type imports, and on-demand imports ending in `.*`
+    imports: List[str]
+    # The simple names of the types the file may use, the declared ones excluded
+    names: List[str]
+
+    def to_json(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_json(cls, value: Dict[str, Any]) -> "TypeReferences":
+        return cls(**value)
+
+
+def extract_type_references(content: str) -> TypeReferences:
+    source = parse_java(content)
+    masked = mask_comments_and_literals(content)
+    declared = [java_type.name for java_type in source.types]
+    names = set(_TYPE_NAME_PATTERN.findall(masked, source.header_end)) - set(declared)
+    return TypeReferences(source.package or "", declared, source.imports, sorted(names))
+
+
+class DependencyGraph:
+    """
+    The dependencies between the Java files of a project: a file depends on the files declaring the types it uses,
+    resolved like the compiler does through its imports, its own package and its on-demand imports. Types outside
+    the project, like the JDK's or a library's, are ignored.
+    Files that depend on each other, directly or through others, form a strongly connected component. The components
+    form a DAG, whose topological waves are the order the files can be migrated in: every file after the files it
+    depends on, the files of a wave in parallel, and the files of a cycle together.
+    """
+
+    def __init__(self) -> None:
+        self._references: Dict[str, TypeReferences] = {}
+        self._extra_edges: Dict[str, Set[str]] = defaultdict(set)
+        self.dependencies: Dict[str, List[str]] = {}
+        self._component_of: Dict[str, int] = {}
+        self.components: List[List[str]] = []
+
+    def __len__(self) -> int:
+        return len(self._references)
+
+    def __contains__(self, relative_path: object) -> bool:
+        return relative_path in self._references
+
+    def add_file(self, relative_path: str, references: TypeReferences) -> None:
+        self._references[relative_path] = references
+
+    def add_edge(self, relative_path: str, dependency: str) -> None:
+        """Makes a file depend on another regardless of their types, ignored unless both files are in the graph."""
+        self._extra_edges[relative_path].add(dependency)
+
+    def resolve(self) -> None:
+        """Resolves the dependencies of every file added so far, and groups the files in components."""
+        types: Dict[str, str] = {}
+        for relative_path, references in sorted(self._references.items()):
+            for name in references.declared:
+                # The first declaration wins if several files declare the same type, e.g. copies in other modules
+                types.setdefault(f"{references.package}.{name}".lstrip("."), relative_path)
+
+        self.dependencies = {}
+        for relative_path, references in self._references.items():
+            single_imports = {fqn.rsplit(".", 1)[-1]: fqn for fqn in references.imports if not fqn.endswith(".*")}
+            packages = [references.package] + [fqn[:-2] for fqn in references.imports if fqn.endswith(".*")]
+            dependencies = {dependency for dependency in self._extra_edges.get(relative_path, ()) if dependency in self}
+            for name in references.names:
+                if name in single_imports:
+                    dependency = types.get(single_imports[name])
+                else:
+                    dependency = next(
+                        (
+                            types[fqn]
+                            for fqn in (f"{package}.{name}".lstrip(".") for package in packages)
+                            if fqn in types
+                        ),
+                        None,
+                    )
+                if dependency is not None:
+                    dependencies.add(dependency)
+            dependencies.discard(relative_path)
+            self.dependencies[relative_path] = sorted(dependencies)
+        self._find_components()
+
+    def _find_components(self) -> None:
+        # Tarjan's algorithm, iterative so deep dependency chains don't hit the recursion limit
+        index: Dict[str, int] = {}
+        low_link: Dict[str, int] = {}
+        on_stack: Set[str] = set()
+        stack: List[str] = []
+        self.components = []
+        self._component_of = {}
+        for root in sorted(self.dependencies):
+            if root in index:
+                continue
+            work = [(root, 0)]
+            while work:
+                node, next_child = work.pop()
+                if next_child == 0:
+                    index[node] = low_link[node] = len(index)
+                    stack.append(node)
+                    on_stack.add(node)
+                children = self.dependencies[node]
+                if next_child < len(children):
+                    work.append((node, next_child + 1))
+                    child = children[next_child]
+                    if child not in index:
+                        work.append((child, 0))
+                    elif child in on_stack:
+                        low_link[node] = min(low_link[node], index[child])
+                    continue
+                if low_link[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        self._component_of[member] = len(self.components)
+                        component.append(member)
+                        if member == node:
+                            break
+                    self.components.append(sorted(component))
+                if work:
+                    parent = work[-1][0]
+                    low_link[parent] = min(low_link[parent], low_link[node])
+
+    def in_same_cycle(self, first: str, second: str) -> bool:
+        component = self._component_of.get(first)
+        return component is not None and component == self._component_of.get(second)
+
+    def prerequisites(self, relative_path: str) -> List[str]:
+        """The direct dependencies of the file to migrate before it, all but the ones in its own cycle."""
+        if relative_path not in self.dependencies:
+            return []
+        component = self._component_of[relative_path]
+        return [
+            dependency for dependency in self.dependencies[relative_path] if self._component_of[dependency] != component
+        ]
+
+    def waves(self) -> List[List[str]]:
+        """The files grouped by topological wave, a file's dependencies are in earlier waves or in its own cycle."""
+        # Tarjan's algorithm finds a component after all the components it depends on
+        levels: List[int] = []
+        for component in self.components:
+            levels.append(
+                max(
+                    (
+                        levels[self._component_of[dependency]] + 1
+                        for member in component
+                        for dependency in self.prerequisites(member)
+                    ),
+                    default=0,
+                )
+            )
+        waves: List[List[str]] = [[] for _ in range(max(levels, default=-1) + 1)]
+        for component, level in zip(self.components, levels):
+            waves[level].extend(component)
+        return [sorted(wave) for wave in waves]
+
+    def report(self) -> Dict[str, Any]:
+        cycles = [component for component in self.components if len(component) > 1]
+        waves = self.waves()
+        return {
+            "files": len(self.dependencies),
+            "dependencies": sum(len(dependencies) for dependencies in self.dependencies.values()),
+            "cycles": len(cycles),
+            "largest_cycle": max(map(len, cycles), default=0),
+            "waves": len(waves),
+            "largest_wave": max(map(len, waves), default=0),
+        }
@@ -0,0 +1,157 @@
+import difflib
+import re
+import zlib
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+from service.analysis_cache import content_hash
+from util.java_source import strip_comments
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+SHINGLE_SIZE = 4
+# The sketch's bins, split into bands for the lookup: files with an identical band are compared
+SKETCH_BINS = 64
+BAND_SIZE = 4
+# Files of fewer shingles than bins are too small to estimate a similarity from, only exact duplicates are found
+MIN_SHINGLES = SKETCH_BINS
+_MASK = (1 << 64) - 1
+_BIN_BITS = SKETCH_BINS.bit_length() - 1
+_VALUE_MASK = (1 << (64 - _BIN_BITS)) - 1
+
+
+@dataclass(frozen=True)
+class FileSketch:
+    content_hash: str
+    # The smallest shingle hash in every bin of the hash space, a one permutation MinHash. Empty for small files.
+    bins: Tuple[int, ...]
+
+
+@dataclass(frozen=True)
+class DuplicateMatch:
+    # The earlier file whose results the duplicate reuses
+    representative: str
+    # The estimated Jaccard similarity of the two files' shingles, 1 for an exact duplicate
+    similarity: float
+    exact: bool
+
+
+def _mix(value: int) -> int:
+    # The 64-bit finalizer of MurmurHash3, so the shingles spread evenly over the bins
+    value ^= value >> 33
+    value = (value * 0xFF51AFD7ED558CCD) & _MASK
+    value ^= value >> 33
+    value = (value * 0xC4CEB9FE1A85EC53) & _MASK
+    return value ^ (value >> 33)
+
+
+def sketch_file(relative_path: str, content: str) -> FileSketch:
+    """
+    Sketches the file's normalized tokens: comments of Java files are dropped and whitespace is ignored, so copies
+    that only differ in formatting and comments have the same sketch.
+    """
+    text = strip_comments(content) if relative_path.endswith(".java") else content
+    tokens = _TOKEN_PATTERN.findall(text)
+    token_hashes = {token: zlib.crc32(token.encode()) for token in set(tokens)}
+    hashes = [token_hashes[token] for token in tokens]
+    shingles = set()
+    for i in range(max(0, len(hashes) - SHINGLE_SIZE + 1)):
+        value = 0
+        for token_hash in hashes[i : i + SHINGLE_SIZE]:
+            value = ((value ^ token_hash) * 0x100000001B3) & _MASK
+        shingles.add(_mix(value))
+    if len(shingles) < MIN_SHINGLES:
+        return FileSketch(content_hash(content), ())
+    empty = _VALUE_MASK + 1
+    bins = [empty] * SKETCH_BINS
+    for shingle in shingles:
+        index, value = shingle >> (64 - _BIN_BITS), shingle & _VALUE_MASK
+        if value < bins[index]:
+            bins[index] = value
+    # An empty bin borrows the value of the next full one, marked with the distance, so it's only equal to the same
+    # bin of a file with the same borrowed value
+    for i in range(SKETCH_BINS):
+        if bins[i] == empty:
+            distance = next(d for d in range(1, SKETCH_BINS) if bins[(i + d) % SKETCH_BINS] <= _VALUE_MASK)
+            bins[i] = bins[(i + distance) % SKETCH_BINS] + (distance << 64)
+    return FileSketch(content_hash(content), tuple(bins))
+
+
+def estimate_similarity(first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+    """The share of equal bins of two sketches estimates the Jaccard similarity of the files' shingles."""
+    if not first or len(first) != len(second):
+        return 0.0
+    return sum(a == b for a, b in zip(first, second)) / len(first)
+
+
+class DuplicateIndex:
+    """
+    Matches every file added to an earlier one with the same content, or else to the most similar earlier one at or
+    above the threshold. Only files that don't duplicate another become representatives, so a duplicate's results
+    are always reused or adapted from an original rather than from another duplicate.
+    Candidates are looked up by locality-sensitive hashing: only files with an identical band of bins are compared,
+    which similar files are very likely to have and dissimilar ones aren't.
+    """
+
+    def __init__(self, threshold: float = 0.85) -> None:
+        self.threshold = threshold
+        self._by_content: Dict[str, str] = {}
+        self._sketches: Dict[str, Tuple[int, ...]] = {}
+        self._bands: Dict[Tuple[int, Tuple[int, ...]], List[str]] = defaultdict(list)
+        self.matches: Dict[str, DuplicateMatch] = {}
+        self.files = 0
+        # The results reused by stage and match kind, "exact" or "near", counted by the pipeline
+        self.reused: Counter[Tuple[str, str]] = Counter()
+
+    @staticmethod
+    def _band_keys(bins: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+        return [(start, bins[start : start + BAND_SIZE]) for start in range(0, len(bins), BAND_SIZE)]
+
+    def add(self, relative_path: str, sketch: FileSketch) -> DuplicateMatch | None:
+        self.files += 1
+        representative = self._by_content.get(sketch.content_hash)
+        match = DuplicateMatch(representative, 1.0, True) if representative is not None else self._most_similar(sketch)
+        if match is not None:
+            self.matches[relative_path] = match
+            return match
+        self._by_content[sketch.content_hash] = relative_path
+        if sketch.bins:
+            self._sketches[relative_path] = sketch.bins
+            for key in self._band_keys(sketch.bins):
+                self._bands[key].append(relative_path)
+        return None
+
+    def _most_similar(self, sketch: FileSketch) -> DuplicateMatch | None:
+        if not sketch.bins:
+            return None
+        candidates = {path for key in self._band_keys(sketch.bins) for path in self._bands.get(key, ())}
+        best: DuplicateMatch | None = None
+        # Sorted, so ties go to the same representative every run
+        for path in sorted(candidates):
+            similarity = estimate_similarity(sketch.bins, self._sketches[path])
+            if similarity >= self.threshold and (best is None or similarity > best.similarity):
+                best = DuplicateMatch(path, similarity, False)
+        return best
+
+    def report(self) -> Dict[str, Any]:
+        cluster_sizes = Counter(match.representative for match in self.matches.values())
+        return {
+            "files": self.files,
+            "exact_duplicates": sum(match.exact for match in self.matches.values()),
+            "near_duplicates": sum(not match.exact for match in self.matches.values()),
+            "clusters": len(cluster_sizes),
+            # The representative included
+            "largest_cluster": max(cluster_sizes.values()) + 1 if cluster_sizes else 0,
+            # Exact duplicates cost no request, near duplicates an adapting one instead of a full one
+            "requests_saved": sum(count for (_, kind), count in self.reused.items() if kind == "exact"),
+            "requests_adapted": sum(count for (_, kind), count in self.reused.items() if kind == "near"),
+        }
+
+
+def file_diff(original_path: str, original: str, relative_path: str, content: str) -> str:
+    """The unified diff from the original file to the given one, with two lines of context around every change."""
+    return "".join(
+        difflib.unified_diff(
+            original.splitlines(keepends=True), content.splitlines(keepends=True), original_path, relative_path, n=2
+        )
+    )
@@ -0,0 +1,196 @@
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+from util.java_source import parse_java
+from util.token_counter import count_tokens
+
+# Comments, CDATA sections, processing instructions and declarations are skipped, the rest are element tags
+_XML_TOKEN_PATTERN = re.compile(r"<!--.*?-->|<!\[CDATA\[.*?]]>|<\?.*?\?>|<!.*?>|<(/?)[^>]*?(/?)>", re.DOTALL)
+_IMPORT_LINE_PATTERN = re.compile(r"^\s*import\s+[\w.*\s]+;\s*$")
+_PACKAGE_LINE_PATTERN = re.compile(r"^\s*package\s+[\w.]+\s*;\s*$")
+
+# A segment of the file: the shared context it needs and its offsets, consecutive segments of a context are adjacent
+Segment = Tuple[str, int, int]
+
+
+@dataclass
+class FileChunk:
+    # Sent with the chunk, shared by the chunks of the same type or root element: the package, imports and type
+    # declaration of a Java file, or the prolog and root start tag of an XML file
+    context: str
+    content: str
+    first_line: int
+    last_line: int
+
+    @property
+    def label(self) -> str:
+        return f"lines {self.first_line}-{self.last_line}"
+
+
+def _java_segments(content: str) -> List[Segment]:
+    """Every member of the top-level types is a segment, along with the comments and blank lines before it."""
+    source = parse_java(content)
+    header = content[: source.header_end]
+    segments: List[Segment] = []
+    for java_type in source.types:
+        context = header + content[java_type.start : java_type.body_start] + "\n"
+        # The type's body ends right before its closing brace
+        body_end = max(java_type.body_start, java_type.end - 1)
+        position = java_type.body_start
+        for member in java_type.members:
+            segments.append((context, position, member.end))
+            position = member.end
+        if segments and segments[-1][0] == context:
+            segments[-1] = (context, segments[-1][1], body_end)
+        elif body_end > position:
+            segments.append((context, position, body_end))
+    return segments
+
+
+def _xml_segments(content: str) -> List[Segment]:
+    """Every child element of the root is a segment, along with the comments and whitespace before it."""
+    segments: List[Segment] = []
+    context = ""
+    depth = 0
+    position = 0
+    for match in _XML_TOKEN_PATTERN.finditer(content):
+        closing, self_closing = match.group(1), match.group(2)
+        if closing is None:
+            continue
+        if closing:
+            depth -= 1
+            if depth == 0:
+                if segments and match.start() > position:
+                    segments[-1] = (context, segments[-1][1], match.start())
+                return segments
+        elif not self_closing:
+            depth += 1
+            if depth == 1:
+                context = content[: match.end()] + "\n"
+                position = match.end()
+                continue
+        if depth == 1:
+            segments.append((context, position, match.end()))
+            position = match.end()
+    # The root element isn't closed, the file is split between lines instead
+    return []
+
+
+def _line_spans(content: str, start: int, end: int) -> Iterator[Tuple[int, int]]:
+    while start < end:
+        line_end = content.find("\n", start, end)
+        line_end = end if line_end == -1 else line_end + 1
+        yield start, line_end
+        start = line_end
+
+
+def _fit(content: str, start: int, end: int, budget: int, model: str) -> Iterator[Tuple[int, int, int]]:
+    """Yields the span with its tokens, or consecutive lines of it that fit the budget if it doesn't on its own."""
+    tokens = count_tokens(content[start:end], model)
+    if tokens <= budget:
+        yield start, end, tokens
+        return
+    piece_start, piece_tokens = start, 0
+    for line_start, line_end in _line_spans(content, start, end):
+        line_tokens = count_tokens(content[line_start:line_end], model)
+        if line_start > piece_start and piece_tokens + line_tokens > budget:
+            yield piece_start, line_start, piece_tokens
+            piece_start, piece_tokens = line_start, 0
+        piece_tokens += line_tokens
+    yield piece_start, end, piece_tokens
+
+
+def _line_number(content: str, offset: int) -> int:
+    return content.count("\n", 0, offset) + 1
+
+
+def chunk_file(relative_path: str, content: str, max_tokens: int, model: str = "gpt-4o-mini") -> List[FileChunk]:
+    """
+    Splits a file of more than `max_tokens` into chunks of up to `max_tokens`, their shared context included. Java
+    files are split between the members of their top-level types and XML files between the children of the root
+    element, other files between lines, as are single members or elements too big for a chunk on their own.
+    A file within the limit is a single chunk without context.
+    """
+    if count_tokens(content, model) <= max_tokens:
+        return [FileChunk("", content, 1, _line_number(content, len(content)))]
+    suffix = Path(relative_path).suffix
+    segments: List[Segment] = []
+    if suffix == ".java":
+        segments = _java_segments(content)
+    elif suffix == ".xml":
+        segments = _xml_segments(content)
+    if not segments:
+        segments = [("", 0, len(content))]
+
+    chunks: List[FileChunk] = []
+    context_budgets: Dict[str, int] = {}
+    current: List[int] = []  # The start, end and tokens of the chunk being filled
+    current_context: str | None = None
+
+    def flush() -> None:
+        if current_context is not None and current[1] > current[0]:
+            chunk_content = content[current[0] : current[1]]
+            first_line = _line_number(content, current[0]) + len(chunk_content) - len(chunk_content.lstrip("\n"))
+            chunks.append(FileChunk(current_context, chunk_content, first_line, _line_number(content, current[1] - 1)))
+
+    for context, start, end in segments:
+        if context not in context_budgets:
+            # A context too big for the limit still leaves room for some content
+            context_budgets[context] = max(max_tokens - count_tokens(context, model), max_tokens // 4)
+        budget = context_budgets[context]
+        for piece_start, piece_end, piece_tokens in _fit(content, start, end, budget, model):
+            if current_context is not None and (context != current_context or current[2] + piece_tokens > budget):
+                flush()
+                current_context = None
+            if current_context is None:
+                current_context, current = context, [piece_start, piece_end, 0]
+            current[1] = piece_end
+            current[2] += piece_tokens
+    flush()
+    return chunks
+
+
+def merge_analyses(chunks: List[FileChunk], analyses: List[str]) -> str:
+    return "\n\n".join(
+        f"Part {i + 1}/{len(chunks)} ({chunk.label}):\n{analysis.strip()}"
+        for i, (chunk, analysis) in enumerate(zip(chunks, analyses))
+    )
+
+
+def merge_migrated_parts(chunks: List[FileChunk], parts: List[Tuple[str, str, str]]) -> str:
+    """
+    Merges the migrated parts of a file, every one a header, body and footer, in the order of the chunks. The chunks of
+    a type or root element share the header and footer of their first part, and the imports of all the headers are
+    merged into the file's first one.
+    """
+    groups: List[Tuple[List[str], List[str], str]] = []
+    imports: List[str] = []
+    previous_context: str | None = None
+    for chunk, (header, body, footer) in zip(chunks, parts):
+        header_lines = header.strip("\n").splitlines()
+        for line in header_lines:
+            if _IMPORT_LINE_PATTERN.match(line) and line.strip() not in imports:
+                imports.append(line.strip())
+        if not groups or chunk.context != previous_context:
+            if groups:
+                # The package is only declared once, at the top of the file
+                header_lines = [line for line in header_lines if not _PACKAGE_LINE_PATTERN.match(line)]
+            groups.append(([line for line in header_lines if not _IMPORT_LINE_PATTERN.match(line)], [], footer))
+            previous_context = chunk.context
+        groups[-1][1].append(body.strip("\n"))
+
+    first_header = groups[0][0]
+    # The imports go where the file's first header had them, or after its package declaration
+    position = next(
+        (i for i, line in enumerate(parts[0][0].strip("\n").splitlines()) if _IMPORT_LINE_PATTERN.match(line)), None
+    )
+    if position is None:
+        position = next((i + 1 for i, line in enumerate(first_header) if _PACKAGE_LINE_PATTERN.match(line)), 0)
+    first_header[position:position] = imports
+
+    sections = []
+    for header_lines, bodies, footer in groups:
+        sections.extend(["\n".join(header_lines), *bodies, footer.strip("\n")])
+    return "\n".join(section for section in sections if section) + "\n"
@@ -0,0 +1,239 @@
+import itertools
+import posixpath
+import re
+import xml.etree.ElementTree as ElementTree
+from collections import Counter
+from pathlib import Path
+from typing import List
+
+from util.java_source import JavaMember, JavaType, parse_java
+from util.token_counter import count_tokens
+
+PERSISTENCE_PACKAGES = (
+    "javax.persistence", "jakarta.persistence", "java.sql", "javax.sql", "org.hibernate",
+    "org.springframework.data", "org.springframework.jdbc", "javax.transaction", "jakarta.transaction",
+)  # fmt: skip
+REST_PACKAGES = ("javax.ws.rs", "jakarta.ws.rs", "org.springframework.web.bind.annotation")
+_ACCESSOR_PATTERN = re.compile(r"^(get|set|is)([A-Z]\w*)$")
+_HEADING_PATTERN = re.compile(r"^(#{1,6}|={1,6})\s+\S")
+_GRADLE_DEPENDENCY_PATTERN = re.compile(
+    r"^\s*(implementation|api|compile|compileOnly|runtimeOnly|testImplementation|annotationProcessor|id)\b"
+)
+# Lines of a digest that doesn't fit its share of the budget are dropped from the end
+TRUNCATION_MARKER = "... (truncated)"
+# Digests that don't fit at all are counted per directory on lines starting with this
+OMITTED_MARKER = "... omitted"
+_FILE_LINE_PATTERN = re.compile(r"^File: (.+)$", re.MULTILINE)
+MAX_GENERIC_LINES = 10
+
+
+def _is_accessor(member: JavaMember) -> bool:
+    return member.kind == "method" and not member.annotations and _ACCESSOR_PATTERN.match(member.name) is not None
+
+
+def _is_relevant_member(member: JavaMember) -> bool:
+    if member.kind in ("method", "constructor", "type"):
+        return "private" not in member.modifiers or bool(member.annotations)
+    if member.kind == "field":
+        return bool(member.annotations) or "public" in member.modifiers
+    return False
+
+
+def _declaration_line(member: JavaMember, indent: str) -> str:
+    return indent + " ".join([*(str(annotation) for annotation in member.annotations), member.signature])
+
+
+def _digest_java_type(java_type: JavaType, indent: str) -> List[str]:
+    lines = [_declaration_line(java_type, indent)]
+    accessors = []
+    for member in java_type.members:
+        if _is_accessor(member):
+            # Getters and setters are implied by the fields, listing the properties is enough
+            accessors.append(member.name)
+        elif isinstance(member, JavaType):
+            lines.extend(_digest_java_type(member, indent + "  "))
+        elif _is_relevant_member(member):
+            lines.append(_declaration_line(member, indent + "  "))
+    if accessors:
+        properties = sorted({_ACCESSOR_PATTERN.sub(r"\2", accessor) for accessor in accessors})
+        lines.append(f"{indent}  accessors for: {', '.join(properties)}")
+    return lines
+
+
+def digest_java(content: str) -> List[str]:
+    source = parse_java(content)
+    lines = [f"package {source.package}"] if source.package else []
+    for java_type in source.types:
+        lines.extend(_digest_java_type(java_type, ""))
+    persistence = sorted({i.rsplit(".", 1)[0] for i in source.imports if i.startswith(PERSISTENCE_PACKAGES)})
+    rest = sorted({i.rsplit(".", 1)[0] for i in source.imports if i.startswith(REST_PACKAGES)})
+    if persistence:
+        lines.append(f"persistence touch points: {', '.join(persistence)}")
+    if rest:
+        lines.append(f"REST touch points: {', '.join(rest)}")
+    return lines
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _child_text(element: ElementTree.Element, name: str) -> str:
+    for child in element:
+        if _local_name(child.tag) == name:
+            return (child.text or "").strip()
+    return ""
+
+
+def _digest_pom(root: ElementTree.Element) -> List[str]:
+    lines = [f"maven project {_child_text(root, 'groupId')}:{_child_text(root, 'artifactId')}"]
+    for element in root.iter():
+        name = _local_name(element.tag)
+        if name in ("parent", "dependency", "plugin"):
+            coordinates = ":".join(
+                part
+                for part in (_child_text(element, "groupId"), _child_text(element, "artifactId"))
+                + (_child_text(element, "version"), _child_text(element, "scope"))
+                if part
+            )
+            lines.append(f"{name}: {coordinates}")
+    return lines
+
+
+def _digest_generic_xml(root: ElementTree.Element) -> List[str]:
+    # Namespaced attributes on the root are schema locations, they say nothing about the file's content
+    root_attributes = " ".join(f"{key}={value}" for key, value in root.attrib.items() if not key.startswith("{"))
+    lines = [f"root element: {_local_name(root.tag)} {root_attributes}".strip()]
+    for element in root.iter():
+        name = _local_name(element.tag)
+        text = (element.text or "").strip()
+        attributes = " ".join(f"{_local_name(key)}={value}" for key, value in element.attrib.items())
+        # Leaf values and attributes carry the configuration, e.g. data sources, persistence units and properties
+        if element is not root and (attributes or (text and len(element) == 0)):
+            lines.append(f"{name}: {' '.join(part for part in (attributes, text[:120]) if part)}")
+    return lines
+
+
+def digest_xml(content: str, name: str) -> List[str]:
+    try:
+        root = ElementTree.fromstring(content)
+    except ElementTree.ParseError:
+        return _digest_generic_text(content)
+    if name == "pom.xml":
+        return _digest_pom(root)
+    return _digest_generic_xml(root)
+
+
+def _digest_generic_text(content: str) -> List[str]:
+    return [line.strip() for line in content.splitlines() if line.strip()][:MAX_GENERIC_LINES]
+
+
+def digest_text(content: str, suffix: str) -> List[str]:
+    lines = content.splitlines()
+    if suffix == ".properties":
+        return [line.strip() for line in lines if line.strip() and not line.lstrip().startswith(("#", "!"))]
+    if suffix in (".md", ".adoc"):
+        return [line.strip() for line in lines if _HEADING_PATTERN.match(line)]
+    if suffix in (".gradle", ".kts"):
+        return [line.strip() for line in lines if _GRADLE_DEPENDENCY_PATTERN.match(line)]
+    return _digest_generic_text(content)
+
+
+def digest_file(relative_path: str, content: str) -> str:
+    """
+    Summarizes a file into a compact structural digest: the package, types, annotations and public signatures of
+    Java files, the configuration values of XML and property files, the dependencies of build files and the
+    headings of documentation.
+    """
+    path = Path(relative_path)
+    if path.suffix == ".java":
+        lines = digest_java(content)
+    elif path.suffix == ".xml":
+        lines = digest_xml(content, path.name)
+    else:
+        lines = digest_text(content, path.suffix)
+    return "\n".join([f"File: {relative_path}", *lines])
+
+
+def _omitted_digests_summary(digests: List[str]) -> str:
+    """One line per directory of the digested files, with the number of files it had digests of."""
+    directories: Counter[str] = Counter()
+    for digest in digests:
+        match = _FILE_LINE_PATTERN.search(digest)
+        directories[posixpath.dirname(match.group(1)) or "." if match else "other"] += 1
+    return "\n".join(
+        f"{OMITTED_MARKER} {count} files in {directory}" for directory, count in sorted(directories.items())
+    )
+
+
+def fit_to_token_budget(digests: List[str], token_budget: int, model: str = "gpt-4o-mini") -> List[str]:
+    """
+    Fits the digests, in order of importance, into the token budget, the separators between them included. Every
+    digest gets its first line and a fair share of the rest of the budget: digests smaller than their share leave the
+    rest to the others, and the ones that are still too big lose lines from the end. If even the first lines don't
+    fit, the least important digests are replaced by a count of files per directory.
+    """
+    token_counts = [count_tokens(digest, model) for digest in digests]
+    # Every digest but the last is followed by a separator, counted as a token
+    if sum(token_counts) + len(digests) <= token_budget:
+        return digests
+
+    first_lines = [digest.split("\n", 1)[0] for digest in digests]
+    marker_tokens = count_tokens(TRUNCATION_MARKER, model) + 1
+    minimums = [
+        min(token_count, count_tokens(first_line, model) + 1 + marker_tokens)
+        for token_count, first_line in zip(token_counts, first_lines)
+    ]
+    prefix_minimums = list(itertools.accumulate(minimums, initial=0))
+
+    def summary(kept: int) -> str:
+        return _omitted_digests_summary(digests[kept:]) if kept < len(digests) else ""
+
+    def minimum_cost(kept: int) -> int:
+        return prefix_minimums[kept] + kept + count_tokens(summary(kept), model)
+
+    # The most digests whose first lines fit together with the summary of the omitted ones
+    low, high = 0, len(digests)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if minimum_cost(middle) <= token_budget:
+            low = middle
+        else:
+            high = middle - 1
+    kept = low
+    omitted = summary(kept)
+    if kept == 0 and count_tokens(omitted, model) > token_budget:
+        omitted = f"{OMITTED_MARKER} {len(digests)} files"
+        if count_tokens(omitted, model) > token_budget:
+            return []
+
+    # Water-filling: past their first lines, the smallest digests are kept whole while they fit their share of the
+    # remaining budget
+    allowances = minimums[:kept]
+    remaining_budget = max(token_budget - minimum_cost(kept), 0)
+    extras = [token_counts[i] - minimums[i] for i in range(kept)]
+    order = sorted(range(kept), key=lambda i: extras[i])
+    for position, i in enumerate(order):
+        share = min(extras[i], remaining_budget // (kept - position))
+        allowances[i] += share
+        remaining_budget -= share
+
+    fitted = []
+    for digest, token_count, allowance in zip(digests, token_counts, allowances):
+        if token_count <= allowance:
+            fitted.append(digest)
+            continue
+        first_line, *lines = digest.splitlines()
+        # The first line names the file and always fits, it's part of the minimum
+        kept_lines = [first_line]
+        used_tokens = count_tokens(first_line, model) + 1 + marker_tokens
+        for line in lines:
+            line_tokens = count_tokens(line, model) + 1
+            if used_tokens + line_tokens > allowance:
+                break
+            kept_lines.append(line)
+            used_tokens += line_tokens
+        fitted.append("\n".join(kept_lines) + f"\n{TRUNCATION_MARKER}")
+    if omitted:
+        fitted.append(omitted)
+    return fitted
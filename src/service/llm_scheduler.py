@@ -0,0 +1,230 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, TypeVar
+
+from util.config import AppConfig
+from util.log_manager import LogManager
+from util.metrics import metrics
+
+T = TypeVar("T")
+
+log = LogManager.get_logger()
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class _TokenBucket:
+    """A continuously refilled token bucket. A capacity of 0 disables the limit."""
+
+    def __init__(self, capacity_per_minute: int) -> None:
+        self.capacity = float(capacity_per_minute)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.capacity / 60)
+        self._updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Returns how long to wait until `amount` is available."""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill()
+        # A single request bigger than the whole budget must still be able to go through eventually
+        deficit = min(amount, self.capacity) - self._tokens
+        return max(0.0, deficit * 60 / self.capacity)
+
+    def take(self, amount: float) -> None:
+        if self.capacity > 0:
+            self._tokens -= min(amount, self.capacity)
+
+
+class LLMScheduler:
+    """
+    A central scheduler that every LLM request goes through.
+    It caps the number of requests in flight, enforces request-per-minute and token-per-minute budgets, retries
+    transient failures with jittered exponential backoff, and adapts the concurrency cap AIMD-style: the cap grows
+    additively while requests succeed under the latency target, and shrinks multiplicatively on 429s or slow responses.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        min_concurrency: int = 1,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        max_retries: int = 5,
+        backoff_base_seconds: float = 1.0,
+        backoff_max_seconds: float = 60.0,
+        latency_target_seconds: float = 0.0,
+        decrease_factor: float = 0.5,
+    ) -> None:
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.latency_target_seconds = latency_target_seconds
+        self.decrease_factor = decrease_factor
+        self._limit = float(self.max_concurrency)
+        self._last_decrease_at = 0.0
+        self._in_flight = 0
+        self._request_bucket = _TokenBucket(requests_per_minute)
+        self._token_bucket = _TokenBucket(tokens_per_minute)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._condition: asyncio.Condition | None = None
+        self._rate_lock: asyncio.Lock | None = None
+
+    @classmethod
+    def from_config(cls, config: AppConfig) -> "LLMScheduler":
+        return cls(
+            max_concurrency=config.max_concurrency,
+            min_concurrency=config.min_concurrency,
+            requests_per_minute=config.requests_per_minute,
+            tokens_per_minute=config.tokens_per_minute,
+            max_retries=config.max_retries,
+            backoff_base_seconds=config.backoff_base_seconds,
+            backoff_max_seconds=config.backoff_max_seconds,
+            latency_target_seconds=config.latency_target_seconds,
+        )
+
+    @property
+    def concurrency_limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _primitives(self) -> tuple[asyncio.Condition, asyncio.Lock]:
+        # asyncio primitives are bound to the loop they are first used in, so recreate them if the scheduler
+        # outlives its loop (e.g. several `asyncio.run` calls in one process)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._condition is None or self._rate_lock is None:
+            self._loop = loop
+            self._condition = asyncio.Condition()
+            self._rate_lock = asyncio.Lock()
+            self._in_flight = 0
+        return self._condition, self._rate_lock
+
+    async def _acquire_slot(self) -> None:
+        condition, _ = self._primitives()
+        async with condition:
+            await condition.wait_for(lambda: self._in_flight < int(self._limit))
+            self._in_flight += 1
+
+    async def _release_slot(self) -> None:
+        condition, _ = self._primitives()
+        async with condition:
+            self._in_flight -= 1
+            condition.notify_all()
+
+    async def _acquire_rate(self, estimated_tokens: int) -> None:
+        _, rate_lock = self._primitives()
+        # Requests take their budget in arrival order, so a big request can't be starved by small ones
+        async with rate_lock:
+            while True:
+                wait = max(self._request_bucket.wait_time(1), self._token_bucket.wait_time(estimated_tokens))
+                if wait == 0:
+                    self._request_bucket.take(1)
+                    self._token_bucket.take(estimated_tokens)
+                    return
+                await asyncio.sleep(wait)
+
+    def _on_success(self, latency: float) -> None:
+        if self.latency_target_seconds and latency > self.latency_target_seconds:
+            self._decrease(f"latency {latency:.2f}s is above the {self.latency_target_seconds:.2f}s target")
+        else:
+            self._limit = min(float(self.max_concurrency), self._limit + 1 / max(self._limit, 1.0))
+
+    def _decrease(self, reason: str) -> None:
+        # Requests that were in flight together usually fail together, count them as a single congestion signal
+        now = time.monotonic()
+        if now - self._last_decrease_at < self.backoff_base_seconds:
+            return
+        self._last_decrease_at = now
+        new_limit = max(float(self.min_concurrency), self._limit * self.decrease_factor)
+        if int(new_limit) < int(self._limit):
+            log.warning("Lowering LLM concurrency from %d to %d: %s", int(self._limit), int(new_limit), reason)
+        self._limit = new_limit
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max_seconds)
+        # Full jitter, so retries of requests that failed together don't hit the endpoint together again
+        return random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * 2**attempt))
+
+    async def submit(
+        self, label: str, call: Callable[[], Awaitable[T]], estimated_tokens: int = 0, stage: str = "llm"
+    ) -> T:
+        """
+        Runs `call` under the scheduler's limits. `call` must create a new request every time it's invoked.
+        The queue wait, latency and outcome of every attempt are recorded in the metrics under `stage`.
+        """
+        attempt = 0
+        while True:
+            queued_at = time.perf_counter()
+            await self._acquire_slot()
+            try:
+                await self._acquire_rate(estimated_tokens)
+                start_time = time.perf_counter()
+                metrics.observe("llm_queue_wait_seconds", start_time - queued_at, stage=stage)
+                metrics.set_gauge("llm_in_flight", self._in_flight)
+                try:
+                    result = await call()
+                finally:
+                    metrics.observe("llm_request_seconds", time.perf_counter() - start_time, stage=stage)
+                self._on_success(time.perf_counter() - start_time)
+                metrics.increment("llm_requests_total", stage=stage, outcome="success")
+                return result
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    metrics.increment("llm_requests_total", stage=stage, outcome="error")
+                    raise
+                metrics.increment("llm_requests_total", stage=stage, outcome="retry")
+                if status_code_of(e) == 429:
+                    self._decrease("rate limited by the LLM endpoint")
+                delay = self._backoff(attempt, e)
+                log.warning(
+                    "LLM request for %s failed (%s), retry %d/%d in %.2f seconds",
+                    label,
+                    type(e).__name__,
+                    attempt + 1,
+                    self.max_retries,
+                    delay,
+                )
+            finally:
+                await self._release_slot()
+                metrics.set_gauge("llm_concurrency_limit", self.concurrency_limit)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+
+def status_code_of(error: BaseException) -> int | None:
+    status_code = getattr(error, "status_code", None)
+    return status_code if isinstance(status_code, int) else None
+
+
+def is_retryable(error: BaseException) -> bool:
+    status_code = status_code_of(error)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    # Connection errors and timeouts, including the OpenAI client's own (APIConnectionError, APITimeoutError)
+    return isinstance(error, (TimeoutError, ConnectionError)) or type(error).__name__ in {
+        "APIConnectionError",
+        "APITimeoutError",
+    }
+
+
+def _retry_after_seconds(error: BaseException) -> float | None:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
@@ -1,93 +1,546 @@
 import asyncio
-import dataclasses
 import json
+import re
 from collections import defaultdict
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from concurrent.futures import Executor, ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Any, Dict
+from typing import List, Any, AsyncIterator, Callable, Dict, Iterable, Iterator, Awaitable, Sequence, Type, TypeVar
 
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.documents import Document
+from langchain_core.outputs import LLMResult
 from langchain_core.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
-from pydantic import SecretStr
+from langchain_core.runnables import RunnableConfig
+from pydantic import BaseModel
 
-from model.llm_response_models import CurrentApplication, MongoDBSchema, MigratedFileSchema, ImplementationPlan
-from model.util_data_classes import AnalyzedFileDefinition
+from model.llm_response_models import (
+    ApplicationSummary,
+    CurrentApplication,
+    DBTable,
+    FileAnalyses,
+    MongoDBSchema,
+    MigratedFileSchema,
+    MigratedFilePartSchema,
+    ImplementationPlan,
+)
+from model.util_data_classes import AnalyzedFileDefinition, MigratedFileDefinition
+from service.analysis_batcher import AnalysisBatcher, BatchSlot
+from service.analysis_cache import AnalysisCache, content_hash
+from service.chain_registry import ChainRegistry
+from service.cost_estimator import (
+    ESTIMATED_COMPLETION_TOKENS,
+    MIGRATION_COMPLETION_RATIO,
+    BudgetExceededError,
+    RunEstimate,
+    SpendLimit,
+    expected_completion_tokens,
+    pack_into_batches,
+)
+from service.dependency_graph import DependencyGraph, TypeReferences, extract_type_references
+from service.duplicate_index import DuplicateIndex, DuplicateMatch, FileSketch, file_diff, sketch_file
+from service.file_chunker import FileChunk, chunk_file, merge_analyses, merge_migrated_parts
+from service.file_digest import digest_file, digest_java, fit_to_token_budget
+from service.llm_scheduler import LLMScheduler
+from service.overview_reducer import merge_application_overviews
+from service.pre_analyzer import FileFacts, extract_facts, facts_to_overview, render_facts
+from service.provider_pool import Endpoint, ProviderPool
+from service.record_store import RecordStore
+from service.relevance_index import RelevanceIndex
+from service.run_journal import RunJournal
+from util.artifact_writer import ArtifactWriter, mirrored_path, safe_file_name
 from util.config import get_config
+from util.java_source import strip_comments
 from util.log_manager import LogManager, log_time
+from util.metrics import TOKENS_BUCKETS, metrics
+from util.repo_scanner import ScanStats, scan_repository
+from util.token_counter import batch_by_tokens, count_tokens
+
+T = TypeVar("T")
 
 
 LLM_RESPONSE_OUTPUT_BASE_DIR = "./output/llm_responses"
+JOURNAL_BASE_DIR = "./output/journal"
 
 log = LogManager.get_logger()
 config = get_config()
-doc_and_analysis: List[AnalyzedFileDefinition] = []
 
-llm = ChatOpenAI(model=config.openai_model, api_key=SecretStr(config.openai_key), temperature=config.temperature)
+# The prompt templates, structured output bindings and the LLM client are built once, on first use
+chains = ChainRegistry(config)
+scheduler = LLMScheduler.from_config(config)
+analysis_cache = AnalysisCache.from_config(config) if config.analysis_cache_enabled else None
+metrics.enabled = config.metrics_enabled
+spend_limit = SpendLimit.from_config(config)
+pool = ProviderPool.from_config(config)
 
+# Annotation usages, the `@interface` declarations of annotation types aside
+_ANNOTATION_PATTERN = re.compile(r"@(?!interface\b)[A-Za-z_][\w.]*")
 
-def _load_files() -> List[Document]:
-    input_project_path = f"./input/{config.input_project}"
-    extensions = config.file_extensions_to_analyze.split(",")
-    documents = []
-    for extension in extensions:
-        loader = DirectoryLoader(
-            input_project_path,
-            glob=f"**/*.{extension}",
-            loader_cls=TextLoader,
-            loader_kwargs={"encoding": "utf-8"},
-        )
-        documents.extend(loader.load())
 
-    log.info("Loaded %d files to analyze", len(documents))
-    return documents
+def _project_root(project: str) -> Path:
+    return Path(f"./input/{project}")
 
 
-async def _analyze_file(doc: Document) -> str:
-    with open("./resources/prompts_templates/analyze_java_file.prompt", "r") as f:
-        prompt_template = PromptTemplate(template=f.read(), input_variables=["file_content"])
+def _load_files(project: str) -> Iterator[Document]:
+    stats = ScanStats()
+    yield from scan_repository(
+        _project_root(project),
+        config.file_extensions_to_analyze.split(","),
+        exclude_globs=config.scan_exclude_globs.split(","),
+        respect_gitignore=config.scan_respect_gitignore,
+        max_file_size_bytes=config.scan_max_file_size_kb * 1024,
+        mmap_threshold_bytes=config.scan_mmap_threshold_kb * 1024,
+        stats=stats,
+    )
+    log.info(
+        "Loaded %d files to analyze (skipped %d ignored, %d binary and %d oversized)",
+        stats.files,
+        stats.ignored,
+        stats.binary,
+        stats.too_large,
+    )
 
-    path = Path(str(doc.metadata.get("source")))
-    try:
-        chain = prompt_template | llm
-        response = await chain.ainvoke({"file_content": doc.page_content})
-        log.info("Successfully analyzed file: %s with LLM", path.name)
-        doc_and_analysis.append(
-            AnalyzedFileDefinition(doc, str(response.content), path.name, str(doc.metadata.get("source")), path.suffix)
-        )
+
+class _TokenUsageRecorder(BaseCallbackHandler):
+    """
+    Records the tokens the endpoint reports for every LLM response, including the ones of retried and hedged attempts,
+    in the metrics, the spend limit and the route's usage, priced at the route's model.
+    """
+
+    def __init__(self, stage: str, route: str) -> None:
+        self.stage = stage
+        self.route = route
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = token_usage.get("prompt_tokens") or 0
+        completion_tokens = token_usage.get("completion_tokens") or 0
+        pricing = pool.pricing(self.route)
+        spend_limit.record(prompt_tokens, completion_tokens, pricing)
+        pool.record_usage(self.route, prompt_tokens, completion_tokens)
+        metrics.increment("llm_cost_usd_total", pricing.cost(prompt_tokens, completion_tokens), route=self.route)
+        for kind, key in (("prompt", "prompt_tokens"), ("completion", "completion_tokens")):
+            tokens = token_usage.get(key) or 0
+            metrics.increment("llm_tokens_total", tokens, stage=self.stage, kind=kind)
+            metrics.observe(f"llm_{kind}_tokens", tokens, buckets=TOKENS_BUCKETS, stage=self.stage)
+
+
+def _is_simple_file(content: str) -> bool:
+    return (
+        len(_ANNOTATION_PATTERN.findall(content)) <= config.routing_simple_file_max_annotations
+        and count_tokens(content, config.openai_model) <= config.routing_simple_file_max_tokens
+    )
+
+
+def _route(stage: str, files: Sequence[str] = ()) -> str:
+    """The stage's route, or the simple file route for a request about `files`, the contents, if they're all simple."""
+    simple_files = pool.simple_file_route is not None and bool(files) and all(map(_is_simple_file, files))
+    return pool.route(stage, simple_files)
+
+
+async def _invoke(
+    stage: str,
+    label: str,
+    prompt_template: PromptTemplate,
+    response_model: Type[BaseModel] | None,
+    inputs: Dict[str, Any],
+    route: str | None = None,
+) -> Any:
+    """
+    Sends the request to `route`, the stage's route by default. Every attempt picks its endpoint, so retries and
+    hedges may go to another one.
+    """
+    route = route or pool.route(stage)
+    pricing = pool.pricing(route)
+    estimated_tokens = count_tokens(prompt_template.format(**inputs), config.openai_model)
+    estimated_completion_tokens = expected_completion_tokens(stage, estimated_tokens)
+    # Always recorded, the routes' report needs the tokens even without metrics or a spend limit
+    run_config: RunnableConfig = {"callbacks": [_TokenUsageRecorder(stage, route)]}
+
+    def attempt(endpoint: Endpoint) -> Awaitable[Any]:
+        chain = prompt_template | chains.model(response_model, endpoint)
+        return chain.ainvoke(inputs, config=run_config)
+
+    async def submit(request: Callable[[], Awaitable[Any]]) -> Any:
+        # A hedge is sent like the first attempt: under the scheduler's limits, with its own spend reservation
+        reservation = spend_limit.reserve(stage, estimated_tokens, estimated_completion_tokens, pricing)
+        try:
+            return await scheduler.submit(label, request, estimated_tokens, stage)
+        finally:
+            spend_limit.release(reservation)
+
+    if not metrics.enabled:
+        return await pool.run(route, attempt, submit)
+    metrics.observe("llm_estimated_prompt_tokens", estimated_tokens, buckets=TOKENS_BUCKETS, stage=stage)
+    with metrics.span(label, stage=stage):
+        return await pool.run(route, attempt, submit)
+
+
+def _cache_key(stage: str, route: str, template: str, *inputs: str) -> str | None:
+    """The cache key of a request sent to `route`, whose model answers it."""
+    if analysis_cache is None:
+        return None
+    return AnalysisCache.compute_key(stage, template, f"{pool.model(route)}:{config.temperature}", *inputs)
+
+
+def _get_cached(stage: str, cache_key: str | None) -> Any | None:
+    if analysis_cache is None or cache_key is None:
+        return None
+    value = analysis_cache.get(cache_key)
+    metrics.increment("cache_lookups_total", stage=stage, result="miss" if value is None else "hit")
+    return value
+
+
+def _put_cached(cache_key: str | None, value: Any) -> None:
+    if analysis_cache is not None and cache_key is not None:
+        analysis_cache.put(cache_key, value)
+
+
+async def _journaled(journal: RunJournal, kind: str, key: str, work: Callable[[], Awaitable[Any]]) -> Any:
+    """Returns the journaled result of a unit of work, or does the work and journals its JSON serializable result."""
+    value = journal.get(kind, key)
+    if value is None:
+        value = await work()
+        # The append and fsync block, they run in a thread so the requests in flight aren't held up
+        await asyncio.to_thread(journal.record, kind, key, value)
+    else:
+        metrics.increment("journal_resumed_units_total", stage=kind)
+    return value
+
+
+async def _gather_successful(label: str, coroutines: Iterable[Awaitable[T]]) -> List[T]:
+    """Like `asyncio.gather`, but a failed unit of work is logged and dropped instead of discarding all the others."""
+    results = await asyncio.gather(*coroutines, return_exceptions=True)
+    if spend_limit.on_exceed == "fail":
+        # Going over the spend limit aborts the whole run
+        for result in results:
+            if isinstance(result, BudgetExceededError):
+                raise result
+    successful = [result for result in results if not isinstance(result, BaseException)]
+    if len(successful) < len(results):
+        log.error("%s: %d out of %d requests failed", label, len(results) - len(successful), len(results))
+    return successful  # type: ignore
+
+
+async def _extract_facts(doc: Document, executor: Executor | None) -> FileFacts:
+    # Without a process pool the extraction runs in the default thread pool, off the event loop either way
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, extract_facts, str(doc.metadata.get("source")), doc.page_content
+    )
+
+
+def _analysis_inputs(doc: Document, facts: FileFacts | None) -> tuple[str, Dict[str, str]]:
+    """Returns the name of the prompt template to analyze a file with, and its inputs."""
+    inputs = {"file_content": doc.page_content}
+    template_name = "analyze_java_file"
+    if facts is not None:
+        if Path(str(doc.metadata.get("source"))).suffix == ".java":
+            inputs["file_content"] = strip_comments(doc.page_content)
+        if facts.kind != "unknown":
+            # The LLM only has to cover what the extracted facts don't
+            template_name = "analyze_java_file_with_facts"
+            inputs["facts"] = render_facts(facts)
+    return template_name, inputs
+
+
+def _batch_section(relative_path: str, inputs: Dict[str, str]) -> str:
+    lines = [f"===== File: {relative_path} ====="]
+    if "facts" in inputs:
+        lines.append(f"Extracted facts:\n{inputs['facts']}\nFile content (comments removed):")
+    lines.append(inputs["file_content"])
+    return "\n".join(lines)
+
+
+def _analysis_route(doc: Document, facts: FileFacts | None) -> str:
+    """The route of the file's own analysis request, routed on the content its prompt carries, e.g. without comments."""
+    if pool.simple_file_route is None:
+        return pool.route("analysis")
+    return _route("analysis", [_analysis_inputs(doc, facts)[1]["file_content"]])
+
+
+async def _analyze_file_batch(batch: List[tuple[str, Dict[str, str]]]) -> List[str | None]:
+    """Analyzes several small files in a single request. Files missing from the answer are analyzed on their own."""
+    if len(batch) == 1:
+        # The batch preamble isn't worth it for a single file
+        return [None]
+    prompt_template = chains.prompt("analyze_java_files_batch", ["files"])
+    files = "\n\n".join(_batch_section(relative_path, inputs) for relative_path, inputs in batch)
+    response = await _invoke(
+        "analysis",
+        f"batch of {len(batch)} files",
+        prompt_template,
+        FileAnalyses,
+        {"files": files},
+        _route("analysis", [inputs["file_content"] for _, inputs in batch]),
+    )
+    analyses = {
+        analysis.file_path.strip(): analysis.analysis for analysis in response.analyses if analysis.analysis.strip()
+    }
+    results = [analyses.get(relative_path) for relative_path, _ in batch]
+    missing = [relative_path for (relative_path, _), result in zip(batch, results) if result is None]
+    metrics.observe("analysis_batch_files", len(batch), buckets=(2, 5, 10, 20, 50))
+    if missing:
+        metrics.increment("analysis_batch_missing_files_total", len(missing))
+        log.warning("The batch analysis is missing %d out of %d files: %s", len(missing), len(batch), missing)
+    return results
+
+
+def _chunk(relative_path: str, content: str, max_tokens: int) -> List[FileChunk]:
+    """Returns the chunks of a file over `max_tokens`, or a single chunk if it's within the limit."""
+    if not config.chunking_enabled:
+        return [FileChunk("", content, 1, content.count("\n") + 1)]
+    return chunk_file(relative_path, content, max_tokens, config.openai_model)
+
+
+def _part_inputs(relative_path: str, chunks: List[FileChunk], i: int) -> Dict[str, str]:
+    return {
+        "file_path": relative_path,
+        "part": str(i + 1),
+        "parts": str(len(chunks)),
+        "lines": chunks[i].label,
+        "context": chunks[i].context,
+        "file_content": chunks[i].content,
+    }
+
+
+async def _analyze_file_chunks(relative_path: str, chunks: List[FileChunk]) -> str:
+    """Analyzes the chunks of a file too big for a single request concurrently, and merges the analyses in order."""
+    prompt_template = chains.prompt("analyze_file_part", _part_inputs(relative_path, chunks, 0))
+
+    async def analyze(i: int) -> str:
+        inputs = _part_inputs(relative_path, chunks, i)
+        response = await _invoke("analysis", f"{relative_path} ({chunks[i].label})", prompt_template, None, inputs)
         return str(response.content)
+
+    metrics.observe("file_chunks", len(chunks), buckets=(2, 5, 10, 20, 50), stage="analysis")
+    analyses = await asyncio.gather(*(analyze(i) for i in range(len(chunks))))
+    return merge_analyses(chunks, list(analyses))
+
+
+async def _analyze_file(doc: Document, facts: FileFacts | None = None, batch_slot: BatchSlot | None = None) -> str:
+    """
+    Analyzes a file with the LLM, unless its facts already describe it. Small files are submitted to the batch slot,
+    if given, to be analyzed together with other small files.
+    """
+    relative_path = str(doc.metadata.get("source"))
+    path = Path(relative_path)
+    if facts is not None and facts.trivial and config.pre_analysis_skip_trivial:
+        metrics.increment("files_analyzed_total", source="facts")
+        log.info("Analyzed file: %s from its extracted facts without LLM", path.name)
+        return render_facts(facts)
+
+    template_name, inputs = _analysis_inputs(doc, facts)
+    template = chains.template(template_name)
+    prompt_template = chains.prompt(template_name, inputs)
+    route = _analysis_route(doc, facts)
+    # A batched analysis answers the same questions, so it's cached the same way as a single file's
+    cache_key = _cache_key("analysis", route, template, *inputs.values())
+    try:
+        analysis = _get_cached("analysis", cache_key)
+        source = "cache"
+        batched_analysis = None
+        if batch_slot is not None and analysis is None:
+            section_tokens = count_tokens(_batch_section(relative_path, inputs), config.openai_model)
+            if section_tokens <= config.batch_small_file_tokens:
+                batched_analysis = batch_slot.submit((relative_path, inputs), section_tokens)
+        if batch_slot is not None:
+            batch_slot.skip()
+        if batched_analysis is not None:
+            analysis = await batched_analysis
+            if analysis is not None:
+                source = "batch"
+                _put_cached(cache_key, analysis)
+                log.info("Successfully analyzed file: %s with LLM in a batch", path.name)
+        if analysis is None:
+            chunks = _chunk(relative_path, inputs["file_content"], config.chunk_analysis_max_tokens)
+            if len(chunks) > 1:
+                analysis = await _analyze_file_chunks(relative_path, chunks)
+                source = "chunks"
+                log.info("Successfully analyzed file: %s with LLM in %d parts", path.name, len(chunks))
+            else:
+                response = await _invoke("analysis", path.name, prompt_template, None, inputs, route)
+                source = "single"
+                analysis = str(response.content)
+                log.info("Successfully analyzed file: %s with LLM", path.name)
+            _put_cached(cache_key, analysis)
+        metrics.increment("files_analyzed_total", source=source)
+        if "facts" in inputs:
+            analysis = f"{inputs['facts']}\n{analysis}"
+        return str(analysis)
     except Exception as e:
         log.exception("Failed to analyze the input repository file: %s", path.name)
         raise e
 
 
-async def _create_application_overview(analyses: List[str]) -> CurrentApplication:
-    json_structured_llm = llm.with_structured_output(CurrentApplication)
-    with open("./resources/prompts_templates/create_application_overview.prompt", "r") as f:
-        prompt_template = PromptTemplate(
-            template=f.read(),
-            input_variables=["analyses"],
-        )
+def _duplicate_diff(match: DuplicateMatch, store: RecordStore, relative_path: str, content: str) -> str | None:
+    """
+    Returns the diff from the file's representative to the file, or None if it's too big for adapting the
+    representative's results to be cheaper than producing the file's own.
+    """
+    diff = file_diff(match.representative, store.content(match.representative), relative_path, content)
+    if count_tokens(diff, config.openai_model) > count_tokens(content, config.openai_model) // 2:
+        return None
+    return diff
+
+
+def _record_reuse(duplicates: DuplicateIndex, stage: str, match: DuplicateMatch) -> None:
+    kind = "exact" if match.exact else "near"
+    duplicates.reused[stage, kind] += 1
+    metrics.increment("duplicate_reuse_total", stage=stage, kind=kind)
+
+
+async def _adapt_analysis(relative_path: str, original_path: str, original_analysis: str, diff: str) -> str:
+    template = chains.template("adapt_analysis")
+    inputs = {
+        "file_path": relative_path,
+        "original_path": original_path,
+        "original_analysis": original_analysis,
+        "diff": diff,
+    }
+    cache_key = _cache_key("analysis", pool.route("analysis"), template, *inputs.values())
+    analysis = _get_cached("analysis", cache_key)
+    if analysis is None:
+        prompt_template = chains.prompt("adapt_analysis", inputs)
+        response = await _invoke("analysis", f"{relative_path} (adapted)", prompt_template, None, inputs)
+        analysis = str(response.content)
+        _put_cached(cache_key, analysis)
+        log.info("Successfully adapted the analysis of %s to %s with LLM", original_path, relative_path)
+    return str(analysis)
+
+
+async def _reuse_analysis(
+    relative_path: str,
+    content: str,
+    match: DuplicateMatch,
+    original: "asyncio.Future[AnalyzedFileDefinition]",
+    store: RecordStore,
+) -> str | None:
+    """
+    Returns the analysis of the file's representative for an exact duplicate, or adapted to the file for a near
+    duplicate. None if the representative's analysis failed or the files differ too much, the file is analyzed on its
+    own then.
+    """
     try:
-        chain = prompt_template | json_structured_llm
-        response = await chain.ainvoke({"analyses": analyses})
-        log.info("Successfully generated an application overview")
+        # Shielded, a duplicate that's cancelled mustn't cancel its representative
+        original_file = await asyncio.shield(original)
+    except Exception:
+        return None
+    if match.exact:
+        return original_file.analysis
+    diff = _duplicate_diff(match, store, relative_path, content)
+    if diff is None:
+        return None
+    return await _adapt_analysis(relative_path, match.representative, original_file.analysis, diff)
+
+
+async def _create_partial_overview(analyses: List[str], batch_label: str) -> CurrentApplication:
+    prompt_template = chains.prompt("create_application_overview", ["analyses"])
+    try:
+        response = await _invoke("overview", batch_label, prompt_template, CurrentApplication, {"analyses": analyses})
+        log.info("Successfully generated an %s", batch_label)
         return response  # type: ignore
     except Exception as e:
-        log.exception("Failed to generate application summary")
+        log.exception("Failed to generate an %s", batch_label)
         raise e
 
 
-async def _create_mongo_db_schema(analyses: List[str], schema: str) -> MongoDBSchema:
-    json_structured_llm = llm.with_structured_output(MongoDBSchema)
-    with open("./resources/prompts_templates/create_mongodb_schema.prompt", "r") as f:
-        prompt_template = PromptTemplate(
-            template=f.read(),
-            input_variables=["analyses", "schema"],
+async def _merge_application_summaries(summaries: List[str]) -> str:
+    prompt_template = chains.prompt("merge_application_summaries", ["summaries"])
+    token_budget = config.overview_token_budget - chains.template_tokens("merge_application_summaries")
+
+    async def merge_batch(batch: List[str]) -> str:
+        if len(batch) == 1:
+            return batch[0]
+        response = await _invoke(
+            "overview",
+            "application summary merge",
+            prompt_template,
+            ApplicationSummary,
+            {"summaries": batch},
+        )
+        return response.application_summary
+
+    # Merge the summaries in rounds, each round merges as many summaries per request as the budget allows
+    while len(summaries) > 1:
+        batches = batch_by_tokens(summaries, token_budget, config.openai_model, min_batch_size=2)
+        summaries = list(await asyncio.gather(*(merge_batch(batch) for batch in batches)))
+    return summaries[0]
+
+
+async def _create_application_overview(analyses: List[str]) -> CurrentApplication:
+    """
+    Generates the overview in a single request when all the analyses fit the token budget. Otherwise, the analyses
+    are split into batches that fit the budget, a partial overview is generated for every batch concurrently,
+    and the partials are reduced into one: the lists are merged and deduplicated, and the summaries are merged
+    hierarchically by the LLM.
+    """
+    token_budget = config.overview_token_budget - chains.template_tokens("create_application_overview")
+    batches = batch_by_tokens(analyses, token_budget, config.openai_model)
+    if len(batches) == 1:
+        return await _create_partial_overview(analyses, "application overview")
+
+    log.info("Analyses exceed the overview token budget, generating the overview from %d batches", len(batches))
+    partials = await _gather_successful(
+        "Partial application overview generation",
+        (
+            _create_partial_overview(batch, f"application overview for batch {i + 1}/{len(batches)}")
+            for i, batch in enumerate(batches)
+        ),
+    )
+    if not partials:
+        raise Exception("Couldn't generate an application overview")
+    try:
+        application_summary = await _merge_application_summaries([partial.application_summary for partial in partials])
+        log.info("Successfully merged %d partial application overviews", len(partials))
+        return merge_application_overviews(partials, application_summary)
+    except Exception as e:
+        log.exception("Failed to merge the partial application overviews")
+        raise e
+
+
+def _build_relevance_index(analyzed_files: List[AnalyzedFileDefinition]) -> RelevanceIndex:
+    index = RelevanceIndex()
+    for analyzed_file in analyzed_files:
+        index.add(
+            analyzed_file.relative_path,
+            f"{analyzed_file.name}\n{analyzed_file.analysis}\n{analyzed_file.content}",
         )
+    return index
+
+
+def _select_relevant_analyses(index: RelevanceIndex, store: RecordStore, db_table: DBTable) -> List[str]:
+    """Picks the analyses of the files that mention the table the most, as many as fit the schema token budget."""
+    selected: List[str] = []
+    selected_log: List[str] = []
+    remaining_tokens = config.schema_token_budget
+    for relative_path, score in index.search(f"{db_table.name}\n{db_table.db_schema}", config.schema_top_k):
+        analysis = store.analysis(relative_path)
+        analysis_tokens = count_tokens(analysis, config.openai_model)
+        if analysis_tokens > remaining_tokens:
+            continue
+        remaining_tokens -= analysis_tokens
+        selected.append(analysis)
+        selected_log.append(f"{relative_path} ({score:.2f})")
+    log.info(
+        "Selected %d analyses for the MongoDB schema of table %s: %s",
+        len(selected),
+        db_table.name,
+        ", ".join(selected_log) or "none matched",
+    )
+    return selected
+
+
+async def _create_mongo_db_schema(analyses: List[str], schema: str) -> MongoDBSchema:
+    prompt_template = chains.prompt("create_mongodb_schema", ["analyses", "schema"])
     try:
-        chain = prompt_template | json_structured_llm
-        response = await chain.ainvoke({"analyses": analyses, "schema": schema})
+        response = await _invoke(
+            "schema",
+            "MongoDB schema",
+            prompt_template,
+            MongoDBSchema,
+            {"analyses": analyses, "schema": schema},
+        )
         log.info("Successfully generated a MongoDB schema.")
         return response  # type: ignore
     except Exception as e:
@@ -95,38 +548,132 @@ async def _create_mongo_db_schema(analyses: List[str], schema: str) -> MongoDBSc
         raise e
 
 
-async def _migrate_file(file_description: AnalyzedFileDefinition) -> Dict[str, Any]:
-    json_structured_llm = llm.with_structured_output(MigratedFileSchema)
-    with open("./resources/prompts_templates/migrate_file.prompt", "r") as f:
-        prompt_template = PromptTemplate(
-            template=f.read(),
-            input_variables=["analysis", "file_content"],
-        )
+def _migration_part_inputs(
+    relative_path: str, analysis: str, dependencies: str, chunks: List[FileChunk], i: int
+) -> Dict[str, str]:
+    return {"analysis": analysis, "dependencies": dependencies or "None"} | _part_inputs(relative_path, chunks, i)
+
+
+async def _migrate_file_chunks(
+    relative_path: str, analysis: str, dependencies: str, chunks: List[FileChunk]
+) -> Dict[str, Any]:
+    """
+    Migrates the chunks of a file too big for a single response concurrently. Every part comes with the header and
+    footer of the migrated file around it, they're merged in order into one file.
+    """
+    prompt_template = chains.prompt(
+        "migrate_file_part", _migration_part_inputs(relative_path, analysis, dependencies, chunks, 0)
+    )
+
+    async def migrate(i: int) -> MigratedFilePartSchema:
+        inputs = _migration_part_inputs(relative_path, analysis, dependencies, chunks, i)
+        label = f"{relative_path} ({chunks[i].label})"
+        return await _invoke("migration", label, prompt_template, MigratedFilePartSchema, inputs)  # type: ignore
+
+    metrics.observe("file_chunks", len(chunks), buckets=(2, 5, 10, 20, 50), stage="migration")
+    parts = await asyncio.gather(*(migrate(i) for i in range(len(chunks))))
+    return {
+        "new_file": merge_migrated_parts(chunks, [(part.header, part.body, part.footer) for part in parts]),
+        "file_category": parts[0].file_category,
+    }
+
+
+async def _migrate_file(file_description: AnalyzedFileDefinition, dependencies: str = "") -> Dict[str, Any]:
+    """
+    Returns the LLM's migration of the file, the fields of `MigratedFileSchema`. The migrated signatures of the files
+    it depends on, if any, are sent along so the file uses them as they are.
+    """
+    analysis, content = file_description.analysis, file_description.content
+    inputs = {"analysis": analysis, "file_content": content}
+    template_name = "migrate_file"
+    if dependencies:
+        template_name = "migrate_file_with_dependencies"
+        inputs["dependencies"] = dependencies
+    template = chains.template(template_name)
+    prompt_template = chains.prompt(template_name, inputs)
+    route = _route("migration", [content])
+    cache_key = _cache_key("migration", route, template, *inputs.values())
     try:
-        chain = prompt_template | json_structured_llm
-        response = await chain.ainvoke(
-            {"analysis": file_description.analysis, "file_content": file_description.doc.page_content}
-        )
-        log.info("Successfully generated a new migrated file to replace: %s", file_description.relative_path)
-        return response.model_dump() | dataclasses.asdict(file_description)  # type: ignore
+        migrated_file = _get_cached("migration", cache_key)
+        if migrated_file is None:
+            # The migrated file is about as big as the original, a big file is migrated in parts that fit the output
+            chunks = _chunk(file_description.relative_path, content, config.chunk_migration_max_tokens)
+            if len(chunks) > 1:
+                migrated_file = await _migrate_file_chunks(
+                    file_description.relative_path, analysis, dependencies, chunks
+                )
+            else:
+                response = await _invoke(
+                    "migration",
+                    file_description.relative_path,
+                    prompt_template,
+                    MigratedFileSchema,
+                    inputs,
+                    route,
+                )
+                migrated_file = response.model_dump()
+            _put_cached(cache_key, migrated_file)
+            log.info("Successfully generated a new migrated file to replace: %s", file_description.relative_path)
+        return {field: migrated_file[field] for field in MigratedFileSchema.model_fields}
+    except BudgetExceededError:
+        log.warning("Skipped the migration of %s, the spend limit is reached", file_description.relative_path)
+        raise
     except Exception as e:
         log.exception("Failed to generate a new migrated file for: %s", file_description.relative_path)
         raise e
 
 
+async def _adapt_migration(relative_path: str, original_path: str, migrated_file: str, diff: str) -> Dict[str, Any]:
+    template = chains.template("adapt_migration")
+    inputs = {"file_path": relative_path, "original_path": original_path, "migrated_file": migrated_file, "diff": diff}
+    cache_key = _cache_key("migration", pool.route("migration"), template, *inputs.values())
+    adapted_file = _get_cached("migration", cache_key)
+    if adapted_file is None:
+        prompt_template = chains.prompt("adapt_migration", inputs)
+        response = await _invoke("migration", f"{relative_path} (adapted)", prompt_template, MigratedFileSchema, inputs)
+        adapted_file = response.model_dump()
+        _put_cached(cache_key, adapted_file)
+        log.info("Successfully adapted the migration of %s to %s with LLM", original_path, relative_path)
+    return {field: adapted_file[field] for field in MigratedFileSchema.model_fields}
+
+
+async def _reuse_migration(
+    analyzed_file: AnalyzedFileDefinition,
+    match: DuplicateMatch,
+    original: "asyncio.Future[MigratedFileDefinition]",
+    store: RecordStore,
+) -> Dict[str, Any] | None:
+    """
+    Returns the migration of the file's representative for an exact duplicate, or adapted to the file for a near
+    duplicate. None if the representative's migration failed, the files differ too much, or the file is migrated in
+    parts, the file is migrated on its own then.
+    """
+    try:
+        original_file = await asyncio.shield(original)
+    except Exception:
+        return None
+    if match.exact:
+        return {"new_file": original_file.new_file, "file_category": original_file.file_category}
+    relative_path, content = analyzed_file.relative_path, analyzed_file.content
+    if len(_chunk(relative_path, content, config.chunk_migration_max_tokens)) > 1:
+        return None
+    diff = _duplicate_diff(match, store, relative_path, content)
+    if diff is None:
+        return None
+    return await _adapt_migration(relative_path, match.representative, original_file.new_file, diff)
+
+
 async def _create_implementation_plan(
     existing_files: List[str], new_files: List[str], mongo_db_schemas: List[str]
 ) -> ImplementationPlan:
-    json_structured_llm = llm.with_structured_output(ImplementationPlan)
-    with open("./resources/prompts_templates/create_implementation_plan.prompt", "r") as f:
-        prompt_template = PromptTemplate(
-            template=f.read(),
-            input_variables=["existing_files", "analyses", "new_files", "mongo_db_schemas"],
-        )
+    prompt_template = chains.prompt("create_implementation_plan", ["existing_files", "new_files", "mongo_db_schemas"])
     try:
-        chain = prompt_template | json_structured_llm
-        response = await chain.ainvoke(
-            {"existing_files": existing_files, "new_files": new_files, "mongo_db_schemas": mongo_db_schemas}
+        response = await _invoke(
+            "plan",
+            "implementation plan",
+            prompt_template,
+            ImplementationPlan,
+            {"existing_files": existing_files, "new_files": new_files, "mongo_db_schemas": mongo_db_schemas},
         )
         log.info("Successfully generated an implementation plan")
         return response  # type: ignore
@@ -135,7 +682,32 @@ async def _create_implementation_plan(
         raise e
 
 
-def _categorize_migrated_files(migrated_files: List[Dict[str, Any]]) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+def _create_plan_digests(
+    store: RecordStore, migrated_files: List[MigratedFileDefinition], mongo_db_schemas: List[str]
+) -> tuple[List[str], List[str]]:
+    """
+    Digests the existing and migrated files for the implementation plan, fitted into its token budget. The budget left
+    after the prompt template and the MongoDB schemas is split evenly between the existing and the migrated files.
+    """
+    template_tokens = chains.template_tokens("create_implementation_plan")
+    schema_tokens = sum(count_tokens(schema, config.openai_model) for schema in mongo_db_schemas)
+    files_budget = (config.implementation_plan_token_budget - template_tokens - schema_tokens) // 2
+
+    # The contents are read from the store one at a time, only the digests are kept
+    existing_digests = [digest_file(relative_path, content) for relative_path, content in store.iter_contents()]
+    new_digests = [
+        f"Category: {migrated_file.file_category}\n" + digest_file(migrated_file.relative_path, migrated_file.new_file)
+        for migrated_file in migrated_files
+    ]
+    return (
+        fit_to_token_budget(existing_digests, files_budget, config.openai_model),
+        fit_to_token_budget(new_digests, files_budget, config.openai_model),
+    )
+
+
+def _categorize_migrated_files(
+    migrated_files: List[MigratedFileDefinition],
+) -> Dict[str, Dict[str, List[MigratedFileDefinition]]]:
     result = defaultdict(list)
 
     for migrated_file in migrated_files:
@@ -143,60 +715,686 @@ def _categorize_migrated_files(migrated_files: List[Dict[str, Any]]) -> Dict[str
     return {"migrated_files": dict(result)}
 
 
-def _log_llm_responses(
+def _report_incremental_changes(cache: AnalysisCache, store: RecordStore, project: str) -> Dict[str, str]:
+    """Logs what changed since the project's last run, and returns the content hashes of its files."""
+    file_hashes = store.file_hashes()
+    diff = cache.diff_manifest(project, file_hashes)
+    log.info(
+        "Incremental run: %d added, %d modified, %d unchanged and %d removed files since the last run",
+        len(diff.added),
+        len(diff.modified),
+        len(diff.unchanged),
+        len(diff.removed),
+    )
+    return file_hashes
+
+
+def _type_references(content: str) -> TypeReferences:
+    """The types a Java file declares and uses, cached by the file's content hash."""
+    cache_key = AnalysisCache.compute_key("dependencies", content) if analysis_cache is not None else None
+    cached = _get_cached("dependencies", cache_key)
+    if cached is not None:
+        return TypeReferences.from_json(cached)
+    references = extract_type_references(content)
+    _put_cached(cache_key, references.to_json())
+    return references
+
+
+def _in_dependency_graph(relative_path: str) -> bool:
+    return (
+        config.dependency_graph_enabled
+        and relative_path.endswith(".java")
+        and ".java" in config.file_extensions_to_migrate
+    )
+
+
+def _migrated_signatures(relative_path: str, new_file: str) -> str:
+    return "\n".join(digest_java(new_file)) if relative_path.endswith(".java") else ""
+
+
+def _report_dependency_graph(graph: DependencyGraph, artifacts: ArtifactWriter) -> None:
+    report = graph.report()
+    log.info(
+        "Dependency graph: %d dependencies between %d Java files, migrated in %d waves (largest %d files), "
+        "%d cycles (largest %d files)",
+        report["dependencies"],
+        report["files"],
+        report["waves"],
+        report["largest_wave"],
+        report["cycles"],
+        report["largest_cycle"],
+    )
+    cycles = [component for component in graph.components if len(component) > 1]
+    artifacts.write_json("dependency_graph.json", report | {"waves": graph.waves(), "cycles": cycles})
+
+
+def _report_duplicates(duplicates: DuplicateIndex, artifacts: ArtifactWriter) -> None:
+    report = duplicates.report()
+    log.info(
+        "Duplicate files: %d exact and %d near duplicates of %d files in %d clusters (largest %d files), "
+        "%d LLM requests saved and %d adapted",
+        report["exact_duplicates"],
+        report["near_duplicates"],
+        report["files"],
+        report["clusters"],
+        report["largest_cluster"],
+        report["requests_saved"],
+        report["requests_adapted"],
+    )
+    artifacts.write_json(
+        "duplicate_files.json",
+        report | {"matches": {path: asdict(match) for path, match in sorted(duplicates.matches.items())}},
+    )
+
+
+async def _run_analysis_stage(
+    project: str,
+    executor: Executor | None,
+    store: RecordStore,
+    file_facts: List[FileFacts],
+    migration_queue: "asyncio.Queue[AnalyzedFileDefinition | None]",
+    journal: RunJournal,
+    duplicates: DuplicateIndex | None,
+    dependency_graph: "asyncio.Future[DependencyGraph | None]",
+) -> List[AnalyzedFileDefinition]:
+    batcher = None
+    if config.batch_analysis_enabled:
+        batch_budget = config.batch_tokens - chains.template_tokens("analyze_java_files_batch")
+        batcher = AnalysisBatcher(
+            _analyze_file_batch, batch_budget, config.batch_small_file_tokens, config.batch_max_files
+        )
+
+    analysis_tasks: Dict[str, asyncio.Future[AnalyzedFileDefinition]] = {}
+
+    graph = DependencyGraph() if config.dependency_graph_enabled else None
+    if graph is None:
+        # Files are migrated as soon as they're analyzed
+        dependency_graph.set_result(None)
+
+    def read_files() -> Iterator[tuple[Document, FileSketch | None, TypeReferences | None]]:
+        for doc in _load_files(project):
+            relative_path = str(doc.metadata.get("source"))
+            # Sketched and parsed in the scan's worker thread as well
+            sketch = sketch_file(relative_path, doc.page_content) if duplicates is not None else None
+            references = _type_references(doc.page_content) if _in_dependency_graph(relative_path) else None
+            yield doc, sketch, references
+
+    async def analyze_and_forward(
+        relative_path: str, batch_slot: BatchSlot | None, match: DuplicateMatch | None
+    ) -> AnalyzedFileDefinition:
+        try:
+            doc = Document(page_content=store.content(relative_path), metadata={"source": relative_path})
+            facts = None
+            if config.pre_analysis_enabled:
+                facts = await _extract_facts(doc, executor)
+                file_facts.append(facts)
+
+            async def analyze() -> str:
+                # A file described by its facts costs no request anyway
+                if (
+                    duplicates is not None
+                    and match is not None
+                    and not (facts is not None and facts.trivial and config.pre_analysis_skip_trivial)
+                ):
+                    # The representative may be waiting for this file's slot to fill its batch
+                    if batch_slot is not None:
+                        batch_slot.skip()
+                    original = analysis_tasks[match.representative]
+                    analysis = await _reuse_analysis(relative_path, doc.page_content, match, original, store)
+                    if analysis is not None:
+                        _record_reuse(duplicates, "analysis", match)
+                        return analysis
+                    return await _analyze_file(doc, facts)
+                return await _analyze_file(doc, facts, batch_slot)
+
+            key = AnalysisCache.compute_key(
+                "analysis", pool.model(_analysis_route(doc, facts)), relative_path, doc.page_content
+            )
+            analysis = await _journaled(journal, "analysis", key, analyze)
+            analyzed_file = store.set_analysis(relative_path, analysis)
+        finally:
+            # A file that failed before its slot was decided mustn't hold back the open batches
+            if batch_slot is not None:
+                batch_slot.skip()
+        # A file's migration only needs its own analysis, so it's handed over without waiting for the other files
+        if analyzed_file.file_extension in config.file_extensions_to_migrate:
+            migration_queue.put_nowait(analyzed_file)
+        return analyzed_file
+
+    try:
+        async with log_time("Loading and analyzing repository files with LLM", log):
+            files = read_files()
+            # The scan runs in a worker thread and every file is analyzed as soon as it's read, so the LLM requests
+            # start flowing before the scan is done. It waits while too many files are in flight, so only their
+            # contents are held in memory, the others are in the store or not read yet.
+            files_in_flight = asyncio.Semaphore(max(1, config.scan_max_files_in_flight))
+            while (item := await asyncio.to_thread(next, files, None)) is not None:
+                doc, sketch, references = item
+                relative_path = str(doc.metadata.get("source"))
+                # The content goes to the store, the analysis reads it back
+                store.add_file(relative_path, doc.page_content)
+                del item, doc
+                # Files are matched in scan order, a duplicate's representative is always an earlier file
+                match = duplicates.add(relative_path, sketch) if duplicates is not None and sketch is not None else None
+                if graph is not None and references is not None:
+                    graph.add_file(relative_path, references)
+                    if match is not None:
+                        # A duplicate waits for its representative's migration, so the representative mustn't wait
+                        # for the duplicate's: this edge puts the two in a cycle if it would
+                        graph.add_edge(relative_path, match.representative)
+                if files_in_flight.locked() and batcher is not None:
+                    # The files in flight may all be waiting for their batches to fill up
+                    batcher.pause()
+                await files_in_flight.acquire()
+                if batcher is not None:
+                    batcher.resume()
+                batch_slot = batcher.expect() if batcher is not None else None
+                task = asyncio.ensure_future(analyze_and_forward(relative_path, batch_slot, match))
+                task.add_done_callback(lambda _: files_in_flight.release())
+                analysis_tasks[relative_path] = task
+            # The migrations waiting for the graph are released before the last batch of analyses is sent
+            if graph is not None:
+                await asyncio.to_thread(graph.resolve)
+                dependency_graph.set_result(graph)
+            if batcher is not None:
+                batcher.close()
+            analyzed_files = await _gather_successful("File analysis", analysis_tasks.values())
+            if batcher is not None:
+                log.info("Sent %d multi-file analysis requests", batcher.batches_sent)
+            # Files are analyzed in completion order, sort them so the following stages get the same input every run
+            return sorted(analyzed_files, key=lambda analyzed_file: analyzed_file.relative_path)
+    finally:
+        if not dependency_graph.done():
+            dependency_graph.set_result(None)
+        migration_queue.put_nowait(None)
+
+
+async def _run_migration_stage(
+    migration_queue: "asyncio.Queue[AnalyzedFileDefinition | None]",
+    journal: RunJournal,
+    artifacts: ArtifactWriter,
+    store: RecordStore,
+    project: str,
+    duplicates: DuplicateIndex | None,
+    dependency_graph: "asyncio.Future[DependencyGraph | None]",
+) -> List[MigratedFileDefinition]:
+    migration_tasks: Dict[str, asyncio.Future[MigratedFileDefinition]] = {}
+    # The migrated signatures of every Java file, empty if its migration failed
+    signatures: Dict[str, asyncio.Future[str]] = {}
+    queue_closed = asyncio.Event()
+
+    def signature_future(relative_path: str) -> asyncio.Future[str]:
+        return signatures.setdefault(relative_path, asyncio.get_running_loop().create_future())
+
+    async def migrated_signatures(relative_path: str) -> str:
+        if queue_closed.is_set() and relative_path not in migration_tasks:
+            # Its analysis failed, it's never migrated
+            return ""
+        # Shielded, a dependent that's cancelled mustn't cancel the future its other dependents wait for
+        return await asyncio.shield(signature_future(relative_path))
+
+    async def dependency_context(graph: DependencyGraph | None, relative_path: str) -> str:
+        """The migrated signatures of the file's direct dependencies, once they're migrated, fitted into the budget."""
+        if graph is None or relative_path not in graph:
+            return ""
+        prerequisites = graph.prerequisites(relative_path)
+        digests = []
+        for dependency in prerequisites:
+            migrated = await migrated_signatures(dependency)
+            if migrated:
+                digests.append(f"{dependency}:\n{migrated}")
+        if prerequisites:
+            metrics.observe("migration_dependencies", len(prerequisites), buckets=(1, 2, 5, 10, 20, 50))
+        budget = config.dependency_context_token_budget
+        return "\n\n".join(fit_to_token_budget(digests, budget, config.openai_model))
+
+    async def migrate(analyzed_file: AnalyzedFileDefinition) -> MigratedFileDefinition:
+        signature = signature_future(analyzed_file.relative_path)
+        try:
+            migrated_file = await migrate_after_dependencies(analyzed_file)
+            if not signature.done():
+                signature.set_result(_migrated_signatures(analyzed_file.relative_path, migrated_file.new_file))
+            return migrated_file
+        finally:
+            # The dependents of a file that failed are migrated without its signatures
+            if not signature.done():
+                signature.set_result("")
+
+    async def migrate_after_dependencies(analyzed_file: AnalyzedFileDefinition) -> MigratedFileDefinition:
+        graph = await asyncio.shield(dependency_graph)
+        dependencies = await dependency_context(graph, analyzed_file.relative_path)
+
+        async def work() -> Dict[str, Any]:
+            match = duplicates.matches.get(analyzed_file.relative_path) if duplicates is not None else None
+            # The representative was analyzed first, and so queued for its migration first, unless its analysis failed.
+            # In a cycle with its representative, they're migrated concurrently and it can't wait for it.
+            if (
+                duplicates is not None
+                and match is not None
+                and match.representative in migration_tasks
+                and not (graph is not None and graph.in_same_cycle(analyzed_file.relative_path, match.representative))
+            ):
+                original = migration_tasks[match.representative]
+                migrated_file = await _reuse_migration(analyzed_file, match, original, store)
+                if migrated_file is not None:
+                    _record_reuse(duplicates, "migration", match)
+                    return migrated_file
+            return await _migrate_file(analyzed_file, dependencies)
+
+        key = AnalysisCache.compute_key(
+            "migration",
+            pool.model(_route("migration", [analyzed_file.content])),
+            analyzed_file.relative_path,
+            analyzed_file.analysis,
+            analyzed_file.content,
+            dependencies,
+        )
+        migrated_file = await _journaled(journal, "migration", key, work)
+        artifacts.write_text(
+            Path("migrated_files") / mirrored_path(analyzed_file.relative_path, str(_project_root(project))),
+            migrated_file["new_file"],
+        )
+        # The new file goes to the store, the record only reads it back when it's rendered
+        return store.set_migration(
+            analyzed_file.relative_path, migrated_file["new_file"], migrated_file["file_category"]
+        )
+
+    try:
+        async with log_time("Generating migrated files with LLM", log):
+            while (analyzed_file := await migration_queue.get()) is not None:
+                migration_tasks[analyzed_file.relative_path] = asyncio.ensure_future(migrate(analyzed_file))
+            queue_closed.set()
+            for relative_path, signature in signatures.items():
+                if relative_path not in migration_tasks and not signature.done():
+                    signature.set_result("")
+            migrated_files = await _gather_successful("File migration", migration_tasks.values())
+    except asyncio.CancelledError:
+        for task in migration_tasks.values():
+            task.cancel()
+        raise
+    # Files are migrated in completion order, sort them so the output doesn't change between runs
+    return sorted(migrated_files, key=lambda migrated_file: migrated_file.relative_path)
+
+
+async def _run_overview_stage(
+    analyzed_files: List[AnalyzedFileDefinition],
     analyses: List[str],
-    overview: CurrentApplication,
-    mongo_db_schemas: List[MongoDBSchema],
-    migrated_files: List[Dict[str, Any]],
-    implementation_plan: ImplementationPlan,
-) -> None:
-    with open(f"{LLM_RESPONSE_OUTPUT_BASE_DIR}/file_analyses.txt", "w") as f:
-        text = "\n".join(analyses)
-        f.write(text)
-    with open(f"{LLM_RESPONSE_OUTPUT_BASE_DIR}/application_overview.json", "w") as f:
-        json.dump(overview.model_dump(), f, indent=2)
-    for mongo_db_schema in mongo_db_schemas:
-        with open(f"{LLM_RESPONSE_OUTPUT_BASE_DIR}/{mongo_db_schema.collection_name}.json", "w") as f:
-            json.dump(mongo_db_schema.model_dump(), f, indent=2)
-    for migrated_file in migrated_files:
-        with open(f"{LLM_RESPONSE_OUTPUT_BASE_DIR}/{migrated_file['name']}", "w") as f:
-            f.write(migrated_file["new_file"])
-    with open(f"{LLM_RESPONSE_OUTPUT_BASE_DIR}/implementation_plan.json", "w") as f:
-        json.dump(implementation_plan.model_dump(), f, indent=2)
-
-
-async def create_migration_plan() -> Dict[str, Any]:
-    async with log_time("Repository file loading", log):
-        existing_files = _load_files()
-    async with log_time(f"Analyzing {len(existing_files)} repository files with LLM", log):
-        analyses = await asyncio.gather(*(_analyze_file(file) for file in existing_files))
-    if not analyses:
-        raise Exception("Couldn't analyze requested files")
-    async with log_time("Generating an application overview with LLM", log):
+    file_facts: List[FileFacts],
+    store: RecordStore,
+    journal: RunJournal,
+) -> tuple[CurrentApplication, List[MongoDBSchema]]:
+    async def create_overview() -> Dict[str, Any]:
         overview = await _create_application_overview(analyses)
+        if file_facts:
+            # The extracted entities, tables, endpoints and data sources come first, so they win over the LLM's
+            # duplicates
+            overview = merge_application_overviews(
+                [facts_to_overview(file_facts), overview], overview.application_summary
+            )
+        return overview.model_dump()
+
+    async def create_schema(db_table: DBTable) -> MongoDBSchema:
+        async def work() -> Dict[str, Any]:
+            analyses = _select_relevant_analyses(index, store, db_table)
+            return (await _create_mongo_db_schema(analyses, db_table.db_schema)).model_dump()
+
+        key = AnalysisCache.compute_key("schema", pool.model(pool.route("schema")), db_table.name, db_table.db_schema)
+        return MongoDBSchema.model_validate(await _journaled(journal, "schema", key, work))
+
+    async with log_time("Generating an application overview with LLM", log):
+        overview = CurrentApplication.model_validate(
+            await _journaled(
+                journal,
+                "overview",
+                AnalysisCache.compute_key("overview", pool.model(pool.route("overview")), *analyses),
+                create_overview,
+            )
+        )
+    mongo_db_schemas: List[MongoDBSchema] = []
     if len(overview.database_tables) > 0:
         async with log_time("Generating a MongoDB schemas with LLM", log):
-            mongo_db_schemas = await asyncio.gather(
-                *(_create_mongo_db_schema(analyses, db_table.db_schema) for db_table in overview.database_tables)
+            # Every schema request only gets the analyses relevant to its table instead of the whole repository
+            index = await asyncio.to_thread(_build_relevance_index, analyzed_files)
+            mongo_db_schemas = await _gather_successful(
+                "MongoDB schema generation", (create_schema(db_table) for db_table in overview.database_tables)
             )
-    async with log_time("Generating migrated files with LLM", log):
-        migrated_files = await asyncio.gather(
-            *(
-                _migrate_file(file)
-                for file in doc_and_analysis
-                if file.file_extension in config.file_extensions_to_migrate
+    return overview, mongo_db_schemas
+
+
+def _prompt_tokens(template_name: str, inputs: Dict[str, Any]) -> int:
+    return count_tokens(chains.prompt(template_name, inputs).format(**inputs), config.openai_model)
+
+
+def _estimate_run(project: str) -> RunEstimate:
+    """
+    Renders the prompts of every request the pipeline would send, with the LLM outputs they depend on replaced by
+    their expected sizes, and prices them at the models of their routes. Files described by their facts, or whose
+    results are cached, cost no request, and neither do exact duplicates of earlier files. Near duplicates are
+    estimated at the cost of their own results, an upper bound.
+    The migrated signatures of a Java file's dependencies are estimated at the size of the original files' digests.
+    """
+    estimate = RunEstimate.from_config(config)
+    model = config.openai_model
+    migration_template = chains.template("migrate_file")
+    batch_template_tokens = chains.template_tokens("analyze_java_files_batch")
+    analysis_tokens: List[int] = []
+    small_file_tokens: List[int] = []
+    db_schemas: Dict[str, str] = {}
+    # The analysis tokens of the first file of every content
+    duplicate_analysis_tokens: Dict[str, int] = {}
+    graph = DependencyGraph() if config.dependency_graph_enabled else None
+    file_digest_tokens: Dict[str, int] = {}
+    # The migration requests wait for the dependency graph: the path, route, prompt and completion tokens, and if it's
+    # a part
+    migration_requests: List[tuple[str, str, int, int, bool]] = []
+    digest_tokens = 0
+    for doc in _load_files(project):
+        relative_path = str(doc.metadata.get("source"))
+        estimate.files += 1
+        all_facts = extract_facts(relative_path, doc.page_content)
+        # Only the tables the pre-analyzer finds are known before the overview, the LLM may add more
+        db_schemas.update((entity.table, entity.ddl()) for entity in all_facts.entities)
+        file_digest_tokens[relative_path] = count_tokens(digest_file(relative_path, doc.page_content), model)
+        digest_tokens += file_digest_tokens[relative_path]
+        if graph is not None and _in_dependency_graph(relative_path):
+            graph.add_file(relative_path, extract_type_references(doc.page_content))
+        file_hash = content_hash(doc.page_content)
+        if config.dedup_enabled and file_hash in duplicate_analysis_tokens:
+            # The representative's analysis still goes to the overview
+            estimate.files_without_analysis_request += 1
+            analysis_tokens.append(duplicate_analysis_tokens[file_hash])
+            continue
+        facts = all_facts if config.pre_analysis_enabled else None
+
+        analysis: str | None = None
+        if facts is not None and facts.trivial and config.pre_analysis_skip_trivial:
+            analysis = render_facts(facts)
+        else:
+            template_name, inputs = _analysis_inputs(doc, facts)
+            analysis_route = _route("analysis", [inputs["file_content"]])
+            cache_key = _cache_key("analysis", analysis_route, chains.template(template_name), *inputs.values())
+            if analysis_cache is not None and cache_key is not None:
+                analysis = analysis_cache.peek(cache_key)
+            if analysis is not None and "facts" in inputs:
+                analysis = f"{inputs['facts']}\n{analysis}"
+        if analysis is not None:
+            estimate.files_without_analysis_request += 1
+            file_analysis_tokens = count_tokens(analysis, model)
+        else:
+            chunks = _chunk(relative_path, inputs["file_content"], config.chunk_analysis_max_tokens)
+            file_analysis_tokens = ESTIMATED_COMPLETION_TOKENS["analysis"] * len(chunks) + count_tokens(
+                inputs.get("facts", ""), model
             )
+            section_tokens = count_tokens(_batch_section(relative_path, inputs), model)
+            if len(chunks) > 1:
+                for i in range(len(chunks)):
+                    part_inputs = _part_inputs(relative_path, chunks, i)
+                    estimate.add_request(
+                        "analysis",
+                        _prompt_tokens("analyze_file_part", part_inputs),
+                        ESTIMATED_COMPLETION_TOKENS["analysis"],
+                        pool.pricing(pool.route("analysis")),
+                    )
+            elif config.batch_analysis_enabled and section_tokens <= config.batch_small_file_tokens:
+                small_file_tokens.append(section_tokens)
+            else:
+                estimate.add_request(
+                    "analysis",
+                    _prompt_tokens(template_name, inputs),
+                    ESTIMATED_COMPLETION_TOKENS["analysis"],
+                    pool.pricing(analysis_route),
+                )
+        analysis_tokens.append(file_analysis_tokens)
+        duplicate_analysis_tokens[file_hash] = file_analysis_tokens
+
+        if Path(relative_path).suffix in config.file_extensions_to_migrate:
+            migration_inputs = {"analysis": analysis or "", "file_content": doc.page_content}
+            # A file with dependencies misses the cache, its migrated dependencies' signatures aren't known yet
+            migration_route = _route("migration", [doc.page_content])
+            cache_key = _cache_key("migration", migration_route, migration_template, *migration_inputs.values())
+            if (
+                analysis is None
+                or analysis_cache is None
+                or cache_key is None
+                or analysis_cache.peek(cache_key) is None
+            ):
+                # Without a cached analysis, every request also gets the analysis the run will have generated
+                pending_analysis_tokens = file_analysis_tokens if analysis is None else 0
+                chunks = _chunk(relative_path, doc.page_content, config.chunk_migration_max_tokens)
+                if len(chunks) > 1:
+                    for i, chunk in enumerate(chunks):
+                        part_inputs = _migration_part_inputs(relative_path, analysis or "", "", chunks, i)
+                        migration_requests.append(
+                            (
+                                relative_path,
+                                pool.route("migration"),
+                                _prompt_tokens("migrate_file_part", part_inputs) + pending_analysis_tokens,
+                                int(count_tokens(chunk.content, model) * MIGRATION_COMPLETION_RATIO),
+                                True,
+                            )
+                        )
+                else:
+                    prompt_tokens = _prompt_tokens("migrate_file", migration_inputs) + pending_analysis_tokens
+                    completion_tokens = int(count_tokens(doc.page_content, model) * MIGRATION_COMPLETION_RATIO)
+                    migration_requests.append((relative_path, migration_route, prompt_tokens, completion_tokens, False))
+
+    if graph is not None:
+        graph.resolve()
+    dependencies_template_tokens = chains.template_tokens("migrate_file_with_dependencies") - chains.template_tokens(
+        "migrate_file"
+    )
+    for relative_path, route, prompt_tokens, completion_tokens, is_part in migration_requests:
+        prerequisites = graph.prerequisites(relative_path) if graph is not None else []
+        dependency_tokens = min(
+            config.dependency_context_token_budget, sum(file_digest_tokens[path] for path in prerequisites)
+        )
+        if dependency_tokens and not is_part:
+            dependency_tokens += dependencies_template_tokens
+        estimate.add_request("migration", prompt_tokens + dependency_tokens, completion_tokens, pool.pricing(route))
+
+    for batch in pack_into_batches(
+        small_file_tokens, config.batch_tokens - batch_template_tokens, config.batch_max_files
+    ):
+        completion_tokens = ESTIMATED_COMPLETION_TOKENS["analysis"] * len(batch)
+        # Priced at the stage's route, a batch only goes to the simple file route if all of its files are simple
+        estimate.add_request(
+            "analysis",
+            batch_template_tokens * (len(batch) > 1) + sum(batch),
+            completion_tokens,
+            pool.pricing(pool.route("analysis")),
         )
+
+    overview_template_tokens = chains.template_tokens("create_application_overview")
+    overview_batches = pack_into_batches(analysis_tokens, config.overview_token_budget - overview_template_tokens)
+    for batch in overview_batches:
+        estimate.add_request(
+            "overview",
+            overview_template_tokens + sum(batch),
+            ESTIMATED_COMPLETION_TOKENS["overview"],
+            pool.pricing(pool.route("overview")),
+        )
+    merge_template_tokens = chains.template_tokens("merge_application_summaries")
+    summaries = len(overview_batches)
+    while summaries > 1:
+        merge_batches = pack_into_batches(
+            [ESTIMATED_COMPLETION_TOKENS["summary"]] * summaries,
+            config.overview_token_budget - merge_template_tokens,
+            min_items=2,
+        )
+        for batch in merge_batches:
+            if len(batch) > 1:
+                estimate.add_request(
+                    "overview",
+                    merge_template_tokens + sum(batch),
+                    ESTIMATED_COMPLETION_TOKENS["summary"],
+                    pool.pricing(pool.route("overview")),
+                )
+        summaries = len(merge_batches)
+
+    schema_template_tokens = chains.template_tokens("create_mongodb_schema")
+    mean_analysis_tokens = sum(analysis_tokens) // max(1, len(analysis_tokens))
+    relevant_analyses_tokens = min(config.schema_token_budget, config.schema_top_k * mean_analysis_tokens)
+    for db_schema in db_schemas.values():
+        prompt_tokens = schema_template_tokens + count_tokens(db_schema, model) + relevant_analyses_tokens
+        estimate.add_request(
+            "schema", prompt_tokens, ESTIMATED_COMPLETION_TOKENS["schema"], pool.pricing(pool.route("schema"))
+        )
+
+    plan_template_tokens = chains.template_tokens("create_implementation_plan")
+    schema_tokens = len(db_schemas) * ESTIMATED_COMPLETION_TOKENS["schema"]
+    files_budget = (config.implementation_plan_token_budget - plan_template_tokens - schema_tokens) // 2
+    # The migrated files' digests are about as big as the digests of the files they replace
+    plan_prompt_tokens = plan_template_tokens + schema_tokens + 2 * min(files_budget, digest_tokens)
+    estimate.add_request(
+        "plan", plan_prompt_tokens, ESTIMATED_COMPLETION_TOKENS["plan"], pool.pricing(pool.route("plan"))
+    )
+    return estimate
+
+
+async def estimate_migration_plan(project: str | None = None) -> RunEstimate:
+    """
+    Projects the requests, tokens, cost and wall time of migrating a project, the configured one by default, without
+    sending anything to the LLM.
+    """
+    project = project or config.input_project
+    async with log_time(f"Estimating the migration run of {project}", log):
+        return await asyncio.to_thread(_estimate_run, project)
+
+
+def _report_routes() -> None:
+    for route, report in pool.report().items():
+        if report["requests"]:
+            log.info(
+                "Route %s (%s): %d requests, %d failed, %d hedged (%d won by the hedge), p50 %.2fs, p95 %.2fs, "
+                "%d prompt and %d completion tokens, $%.4f",
+                route,
+                report["model"],
+                report["requests"],
+                report["failures"],
+                report["hedged"],
+                report["hedges_won"],
+                report["p50_seconds"],
+                report["p95_seconds"],
+                report["prompt_tokens"],
+                report["completion_tokens"],
+                report["cost_usd"],
+            )
+
+
+@asynccontextmanager
+async def migration_run(name: str) -> AsyncIterator[None]:
+    """
+    The run wide bookkeeping around the migration of one or several projects: resets the metrics, the spend limit and
+    the route statistics, garbage collects the analysis cache after a successful run, and logs the routes' usage and
+    exports the metrics as `name`, also if it fails.
+    """
+    metrics.reset()
+    spend_limit.reset()
+    pool.reset()
+    try:
+        yield
+        if analysis_cache is not None:
+            log.info("Analysis cache: %d hits, %d misses", analysis_cache.hits, analysis_cache.misses)
+            analysis_cache.collect_garbage()
+    finally:
+        _report_routes()
+        if metrics.enabled:
+            metrics.export(Path(config.metrics_dir), name, config.metrics_chrome_trace)
+            log.info("Exported the run metrics to %s", config.metrics_dir)
+
+
+async def create_migration_plan(resume: bool = False) -> Dict[str, Any]:
+    """
+    Migrates the configured project. With a spend limit, the run is estimated first and fails before the first request
+    if it's projected over the limit.
+    """
+    async with migration_run(config.input_project):
+        if spend_limit.enabled:
+            spend_limit.check_projection(await estimate_migration_plan())
+        return await migrate_project(config.input_project, resume)
+
+
+async def migrate_project(
+    project: str, resume: bool = False, llm_responses_dir: str | None = None, executor: Executor | None = None
+) -> Dict[str, Any]:
+    """
+    Runs the migration pipeline of a project in `./input/<project>`. Projects migrated concurrently share the LLM
+    client, the scheduler's concurrency and rate budget, the caches and the spend limit. The process pool for the
+    CPU-bound fact extraction can be shared as well, otherwise one is created for the run if configured.
+    """
+    owned_executor = None
+    if executor is None and config.pre_analysis_workers > 0:
+        executor = owned_executor = ProcessPoolExecutor(config.pre_analysis_workers)
+    artifacts = ArtifactWriter(Path(llm_responses_dir or LLM_RESPONSE_OUTPUT_BASE_DIR), config.log_llm_responses)
+    try:
+        return await _run_pipeline(project, resume, artifacts, RecordStore(), executor)
+    finally:
+        await artifacts.close()
+        if owned_executor is not None:
+            owned_executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def _run_pipeline(
+    project: str, resume: bool, artifacts: ArtifactWriter, store: RecordStore, executor: Executor | None
+) -> Dict[str, Any]:
+    """Runs the analysis, migration, overview, schema and plan stages of a project, journaling every unit of work."""
+    journal = RunJournal(Path(JOURNAL_BASE_DIR) / f"{project}.jsonl", resume)
+    file_facts: List[FileFacts] = []
+    migration_queue: asyncio.Queue[AnalyzedFileDefinition | None] = asyncio.Queue()
+    duplicates = DuplicateIndex(config.dedup_similarity_threshold) if config.dedup_enabled else None
+    # Resolved by the analysis stage once all the files are read
+    dependency_graph: asyncio.Future[DependencyGraph | None] = asyncio.get_running_loop().create_future()
+    migration_task = asyncio.ensure_future(
+        _run_migration_stage(migration_queue, journal, artifacts, store, project, duplicates, dependency_graph)
+    )
+    try:
+        analyzed_files = await _run_analysis_stage(
+            project, executor, store, file_facts, migration_queue, journal, duplicates, dependency_graph
+        )
+        analyses = [analyzed_file.analysis for analyzed_file in analyzed_files]
+        artifacts.write_text("file_analyses.txt", "\n".join(analyses))
+        file_hashes = {}
+        if analysis_cache is not None:
+            file_hashes = _report_incremental_changes(analysis_cache, store, project)
+        if not analyses:
+            raise Exception("Couldn't analyze requested files")
+        overview, mongo_db_schemas = await _run_overview_stage(analyzed_files, analyses, file_facts, store, journal)
+        artifacts.write_json("application_overview.json", overview.model_dump())
+        for i, mongo_db_schema in enumerate(mongo_db_schemas):
+            # Collections are numbered, the LLM may give two tables the same collection name
+            artifacts.write_json(
+                Path("mongodb_schemas") / f"{i + 1:03d}_{safe_file_name(mongo_db_schema.collection_name)}.json",
+                mongo_db_schema.model_dump(),
+            )
+        migrated_files = await migration_task
+    except BaseException:
+        migration_task.cancel()
+        raise
+    if duplicates is not None:
+        _report_duplicates(duplicates, artifacts)
+    graph = dependency_graph.result()
+    if graph is not None:
+        _report_dependency_graph(graph, artifacts)
+
+    schemas = list(map(lambda schema: schema.mongo_db_schema, mongo_db_schemas))
+    async with log_time("Creating file digests for the implementation plan", log):
+        existing_digests, new_digests = await asyncio.to_thread(_create_plan_digests, store, migrated_files, schemas)
+
+    async def create_plan() -> Dict[str, Any]:
+        return (await _create_implementation_plan(existing_digests, new_digests, schemas)).model_dump()
+
     async with log_time("Generating an implementation plan with LLM", log):
-        implementation_plan = await _create_implementation_plan(
-            list(map(lambda file: file.page_content, existing_files)),
-            list(map(lambda file: file["new_file"], migrated_files)),
-            list(map(lambda schema: schema.schema, mongo_db_schemas)),
+        plan_key = AnalysisCache.compute_key(
+            "plan", pool.model(pool.route("plan")), json.dumps([existing_digests, new_digests, schemas])
+        )
+        implementation_plan = ImplementationPlan.model_validate(
+            await _journaled(journal, "plan", plan_key, create_plan)
         )
 
-    if config.log_llm_responses:
-        _log_llm_responses(analyses, overview, mongo_db_schemas, migrated_files, implementation_plan)
+    if analysis_cache is not None:
+        analysis_cache.save_manifest(project, file_hashes)
 
+    artifacts.write_json("implementation_plan.json", implementation_plan.model_dump())
     return (
         overview.model_dump()
         | {"mongo_db_schemas": list(map(lambda schema: schema.model_dump(), mongo_db_schemas))}
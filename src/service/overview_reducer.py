@@ -0,0 +1,55 @@
+from typing import Callable, Dict, Iterable, List, TypeVar
+
+from model.llm_response_models import CurrentApplication, DBTable
+
+T = TypeVar("T")
+
+
+def _deduplicate(items: Iterable[T], key: Callable[[T], object], prefer: Callable[[T, T], T] | None = None) -> List[T]:
+    unique: Dict[object, T] = {}
+    for item in items:
+        item_key = key(item)
+        if item_key not in unique:
+            unique[item_key] = item
+        elif prefer is not None:
+            unique[item_key] = prefer(unique[item_key], item)
+    return list(unique.values())
+
+
+def _normalize(name: str) -> str:
+    return name.strip().strip("`").lower()
+
+
+def _more_complete_table(first: DBTable, second: DBTable) -> DBTable:
+    # Every batch only sees the analyses of some files, the longest schema is the one that saw the most columns
+    return second if len(second.db_schema) > len(first.db_schema) else first
+
+
+def merge_application_overviews(partials: List[CurrentApplication], application_summary: str) -> CurrentApplication:
+    """
+    Merges partial overviews, each generated from a batch of file analyses, into the overview of the whole
+    application. The lists are merged deterministically and deduplicated, the summary is merged by the caller.
+    """
+    return CurrentApplication(
+        application_summary=application_summary,
+        db_entities=_deduplicate(
+            (entity for partial in partials for entity in partial.db_entities),
+            key=lambda entity: _normalize(entity.entity_name),
+        ),
+        database_tables=_deduplicate(
+            (table for partial in partials for table in partial.database_tables),
+            key=lambda table: _normalize(table.name),
+            prefer=_more_complete_table,
+        ),
+        repositories=_deduplicate(
+            (repository for partial in partials for repository in partial.repositories), key=str.strip
+        ),
+        database_configurations=_deduplicate(
+            (configuration for partial in partials for configuration in partial.database_configurations),
+            key=str.strip,
+        ),
+        api_definitions=_deduplicate(
+            (api for partial in partials for api in partial.api_definitions),
+            key=lambda api: (_normalize(api.api_name), api.api_path.strip().rstrip("/")),
+        ),
+    )
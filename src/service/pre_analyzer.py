@@ -0,0 +1,441 @@
+import re
+import xml.etree.ElementTree as ElementTree
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List
+
+from model.llm_response_models import APIDefinition, CurrentApplication, DBEntity, DBTable
+from util.java_source import JavaAnnotation, JavaMember, JavaType, parse_java
+
+HTTP_METHOD_ANNOTATIONS = {"GET", "POST", "PUT", "DELETE", "PATCH", "HEAD", "OPTIONS"}
+SPRING_MAPPING_ANNOTATIONS = {
+    "GetMapping": "GET",
+    "PostMapping": "POST",
+    "PutMapping": "PUT",
+    "DeleteMapping": "DELETE",
+    "PatchMapping": "PATCH",
+    "RequestMapping": "ANY",
+}
+NOT_NULL_ANNOTATIONS = {"NotNull", "NotEmpty", "NotBlank", "Id"}
+RELATION_ANNOTATIONS = {"OneToMany", "ManyToMany"}
+JOIN_ANNOTATIONS = {"ManyToOne", "OneToOne"}
+SQL_TYPES = {
+    "long": "BIGINT", "Long": "BIGINT", "int": "INTEGER", "Integer": "INTEGER", "short": "SMALLINT",
+    "Short": "SMALLINT", "boolean": "BOOLEAN", "Boolean": "BOOLEAN", "double": "DOUBLE", "Double": "DOUBLE",
+    "float": "REAL", "Float": "REAL", "BigDecimal": "DECIMAL", "BigInteger": "NUMERIC", "Date": "DATE",
+    "LocalDate": "DATE", "LocalDateTime": "TIMESTAMP", "Instant": "TIMESTAMP", "Timestamp": "TIMESTAMP",
+    "UUID": "UUID", "byte[]": "BLOB",
+}  # fmt: skip
+DEFAULT_VARCHAR_LENGTH = 255
+
+JAVA_EE_NAMESPACES = {
+    "http://xmlns.jcp.org/xml/ns/javaee", "http://java.sun.com/xml/ns/javaee", "https://jakarta.ee/xml/ns/jakartaee",
+}  # fmt: skip
+PERSISTENCE_NAMESPACES = {
+    "http://xmlns.jcp.org/xml/ns/persistence", "http://java.sun.com/xml/ns/persistence",
+    "https://jakarta.ee/xml/ns/persistence",
+}  # fmt: skip
+MAVEN_POM_NAMESPACE = "http://maven.apache.org/POM/4.0.0"
+# The child elements the extracted facts fully describe, a file with any other is left to the LLM
+POM_DESCRIBED_ELEMENTS = {
+    "modelVersion", "groupId", "artifactId", "version", "packaging", "name", "description", "url", "dependencies",
+}  # fmt: skip
+PERSISTENCE_UNIT_DESCRIBED_ELEMENTS = {
+    "description", "provider", "jta-data-source", "non-jta-data-source", "exclude-unlisted-classes", "properties",
+}  # fmt: skip
+
+_QUOTED_PATTERN = re.compile(r'"((?:\\.|[^"\\])*)"')
+_GENERIC_PATTERN = re.compile(r"<.*>")
+
+
+@dataclass
+class ColumnRecord:
+    name: str
+    java_name: str
+    sql_type: str
+    nullable: bool = True
+    unique: bool = False
+    primary_key: bool = False
+    generated: bool = False
+
+    def ddl(self) -> str:
+        parts = [self.name, self.sql_type]
+        if self.primary_key:
+            parts.append("PRIMARY KEY")
+        elif not self.nullable:
+            parts.append("NOT NULL")
+        if self.unique:
+            parts.append("UNIQUE")
+        if self.generated:
+            parts.append("GENERATED BY DEFAULT AS IDENTITY")
+        return " ".join(parts)
+
+
+@dataclass
+class EntityRecord:
+    name: str
+    table: str
+    columns: List[ColumnRecord] = field(default_factory=list)
+
+    def ddl(self) -> str:
+        columns = ",\n".join(f"  {column.ddl()}" for column in self.columns)
+        return f"CREATE TABLE {self.table} (\n{columns}\n);"
+
+
+@dataclass
+class EndpointRecord:
+    http_method: str
+    path: str
+    handler: str
+    produces: str = ""
+    consumes: str = ""
+
+
+@dataclass
+class DataSourceRecord:
+    name: str
+    connection_url: str = ""
+    driver: str = ""
+
+
+@dataclass
+class PersistenceUnitRecord:
+    name: str
+    data_source: str = ""
+    provider: str = ""
+    properties: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class DependencyRecord:
+    group_id: str
+    artifact_id: str
+    version: str = ""
+    scope: str = ""
+
+    def __str__(self) -> str:
+        return ":".join(part for part in (self.group_id, self.artifact_id, self.version, self.scope) if part)
+
+
+@dataclass
+class FileFacts:
+    relative_path: str
+    kind: str = "unknown"
+    entities: List[EntityRecord] = field(default_factory=list)
+    endpoints: List[EndpointRecord] = field(default_factory=list)
+    # The `@ApplicationPath` of a JAX-RS application class, the prefix of all the JAX-RS endpoints
+    application_path: str = ""
+    data_sources: List[DataSourceRecord] = field(default_factory=list)
+    persistence_units: List[PersistenceUnitRecord] = field(default_factory=list)
+    dependencies: List[DependencyRecord] = field(default_factory=list)
+    # The facts describe everything an LLM analysis would, so the file doesn't need one
+    trivial: bool = False
+
+
+def _annotation_value(annotation: JavaAnnotation | None, *keys: str) -> str:
+    """Returns the first string value of the annotation's `value` (or one of `keys`) element, if it has one."""
+    if annotation is None or not annotation.arguments:
+        return ""
+    arguments = annotation.arguments
+    for key in keys:
+        match = re.search(rf"\b{key}\s*=\s*\{{?\s*\"((?:\\.|[^\"\\])*)\"", arguments)
+        if match is not None:
+            return match.group(1)
+    if "=" not in arguments.split('"')[0]:
+        match = _QUOTED_PATTERN.search(arguments)
+        if match is not None:
+            return match.group(1)
+    return ""
+
+
+def _annotation_flag(annotation: JavaAnnotation | None, key: str) -> str:
+    if annotation is None:
+        return ""
+    match = re.search(rf"\b{key}\s*=\s*(\w+)", annotation.arguments)
+    return match.group(1) if match else ""
+
+
+def _join_paths(*paths: str) -> str:
+    joined = "/".join(path.strip("/") for path in paths if path and path.strip("/"))
+    return f"/{joined}"
+
+
+def _field_java_type(member: JavaMember) -> str:
+    words = [word for word in _GENERIC_PATTERN.sub("", member.signature.partition("=")[0]).split() if word]
+    declaration = [word for word in words if word not in member.modifiers]
+    return declaration[-2] if len(declaration) >= 2 else ""
+
+
+def _column(member: JavaMember, unique_columns: set[str]) -> ColumnRecord | None:
+    if "static" in member.modifiers or "transient" in member.modifiers or member.has_annotation("Transient"):
+        return None
+    if member.has_annotation(*RELATION_ANNOTATIONS):
+        # The other side owns the foreign key
+        return None
+    column_annotation = member.annotation("Column")
+    java_type = _field_java_type(member)
+    if member.has_annotation(*JOIN_ANNOTATIONS):
+        join_column = member.annotation("JoinColumn")
+        name = _annotation_value(join_column, "name") or f"{member.name}_id"
+        return ColumnRecord(name, member.name, "BIGINT", nullable=_annotation_flag(join_column, "nullable") != "false")
+
+    name = _annotation_value(column_annotation, "name") or member.name
+    sql_type = SQL_TYPES.get(java_type.split(".")[-1], "")
+    if java_type == "String" or java_type.endswith(".String"):
+        length = _annotation_flag(column_annotation, "length") or _annotation_flag(member.annotation("Size"), "max")
+        sql_type = f"VARCHAR({length or DEFAULT_VARCHAR_LENGTH})"
+    elif not sql_type:
+        # Enums and embedded types, without resolving them the best guess is their name
+        sql_type = "VARCHAR(255)" if member.has_annotation("Enumerated") else java_type.upper() or "UNKNOWN"
+    return ColumnRecord(
+        name=name,
+        java_name=member.name,
+        sql_type=sql_type,
+        nullable=not member.has_annotation(*NOT_NULL_ANNOTATIONS)
+        and _annotation_flag(column_annotation, "nullable") != "false",
+        unique=_annotation_flag(column_annotation, "unique") == "true" or name in unique_columns,
+        primary_key=member.has_annotation("Id"),
+        generated=member.has_annotation("GeneratedValue"),
+    )
+
+
+def _entity(java_type: JavaType) -> EntityRecord:
+    table_annotation = java_type.annotation("Table")
+    unique_columns = set()
+    if table_annotation is not None and "UniqueConstraint" in table_annotation.arguments:
+        constraints = table_annotation.arguments.partition("UniqueConstraint")[2]
+        unique_columns = set(_QUOTED_PATTERN.findall(constraints))
+    entity = EntityRecord(java_type.name, _annotation_value(table_annotation, "name") or java_type.name)
+    for member in java_type.members:
+        if member.kind == "field":
+            column = _column(member, unique_columns)
+            if column is not None:
+                entity.columns.append(column)
+    return entity
+
+
+def _endpoints(java_type: JavaType) -> List[EndpointRecord]:
+    base_path = _annotation_value(java_type.annotation("Path"), "value") or _annotation_value(
+        java_type.annotation("RequestMapping"), "value", "path"
+    )
+    endpoints = []
+    for member in java_type.members:
+        if member.kind != "method":
+            continue
+        for annotation in member.annotations:
+            if annotation.name in HTTP_METHOD_ANNOTATIONS:
+                http_method = annotation.name
+                path = _annotation_value(member.annotation("Path"), "value")
+            elif annotation.name in SPRING_MAPPING_ANNOTATIONS:
+                http_method = SPRING_MAPPING_ANNOTATIONS[annotation.name]
+                if annotation.name == "RequestMapping":
+                    http_method = _annotation_flag(annotation, "method").rsplit(".", 1)[-1] or http_method
+                path = _annotation_value(annotation, "value", "path")
+            else:
+                continue
+            endpoints.append(
+                EndpointRecord(
+                    http_method=http_method,
+                    path=_join_paths(base_path, path),
+                    handler=f"{java_type.name}.{member.name}",
+                    produces=(member.annotation("Produces") or JavaAnnotation("")).arguments,
+                    consumes=(member.annotation("Consumes") or JavaAnnotation("")).arguments,
+                )
+            )
+    return endpoints
+
+
+def _has_logic(java_type: JavaType) -> bool:
+    for member in java_type.members:
+        if isinstance(member, JavaType):
+            if _has_logic(member):
+                return True
+        elif member.kind in ("method", "initializer") and not re.match(r"^(get|set|is)[A-Z]", member.name):
+            return True
+    return False
+
+
+def _extract_java(facts: FileFacts, content: str) -> None:
+    source = parse_java(content)
+    for java_type in source.types:
+        if java_type.has_annotation("Entity"):
+            facts.kind = "entity"
+            facts.entities.append(_entity(java_type))
+        endpoints = _endpoints(java_type)
+        if endpoints:
+            facts.kind = "rest resource"
+            facts.endpoints.extend(endpoints)
+        if java_type.has_annotation("ApplicationPath"):
+            facts.kind = "jax-rs application"
+            facts.application_path = _annotation_value(java_type.annotation("ApplicationPath"), "value")
+    # Entities and application classes without any logic are fully described by their facts
+    facts.trivial = facts.kind in ("entity", "jax-rs application") and not any(
+        _has_logic(java_type) for java_type in source.types
+    )
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _namespace(tag: str) -> str:
+    return tag[1:].split("}", 1)[0] if tag.startswith("{") else ""
+
+
+def _only_has_children(element: ElementTree.Element, names: set[str]) -> bool:
+    return all(_local_name(child.tag) in names for child in element)
+
+
+def _children(element: ElementTree.Element, name: str) -> List[ElementTree.Element]:
+    return [child for child in element.iter() if _local_name(child.tag) == name]
+
+
+def _text(element: ElementTree.Element, name: str) -> str:
+    for child in element:
+        if _local_name(child.tag) == name:
+            return (child.text or "").strip()
+    return ""
+
+
+def _extract_xml(facts: FileFacts, content: str) -> None:
+    """
+    Recognizes the JPA, datasource, Maven and CDI descriptors by their root element and namespace, and for Maven and
+    CDI by their file name too, so e.g. a Spring `<beans>` context or an Ant `<project>` build isn't mistaken for one.
+    """
+    try:
+        root = ElementTree.fromstring(content)
+    except ElementTree.ParseError:
+        return
+    root_name, namespace = _local_name(root.tag), _namespace(root.tag)
+    file_name = Path(facts.relative_path).name
+    if root_name == "persistence" and namespace in PERSISTENCE_NAMESPACES:
+        facts.kind = "persistence config"
+        units = _children(root, "persistence-unit")
+        facts.trivial = all(_only_has_children(unit, PERSISTENCE_UNIT_DESCRIBED_ELEMENTS) for unit in units)
+        for unit in units:
+            facts.persistence_units.append(
+                PersistenceUnitRecord(
+                    name=unit.get("name", ""),
+                    data_source=_text(unit, "jta-data-source") or _text(unit, "non-jta-data-source"),
+                    provider=_text(unit, "provider"),
+                    properties={prop.get("name", ""): prop.get("value", "") for prop in _children(unit, "property")},
+                )
+            )
+    elif root_name == "datasources":
+        facts.kind = "datasource config"
+        facts.trivial = True
+        for data_source in _children(root, "datasource") + _children(root, "xa-datasource"):
+            # Credentials are left out on purpose, they aren't needed for a migration plan
+            facts.data_sources.append(
+                DataSourceRecord(
+                    name=data_source.get("jndi-name", data_source.get("pool-name", "")),
+                    connection_url=_text(data_source, "connection-url"),
+                    driver=_text(data_source, "driver") or _text(data_source, "driver-class"),
+                )
+            )
+    elif root_name == "project" and namespace == MAVEN_POM_NAMESPACE and file_name == "pom.xml":
+        facts.kind = "maven build"
+        # Plugins, profiles, modules and the like matter for the migration, only a plain dependency list is trivial
+        facts.trivial = _only_has_children(root, POM_DESCRIBED_ELEMENTS)
+        for dependency in _children(root, "dependency"):
+            facts.dependencies.append(
+                DependencyRecord(
+                    _text(dependency, "groupId"),
+                    _text(dependency, "artifactId"),
+                    _text(dependency, "version"),
+                    _text(dependency, "scope"),
+                )
+            )
+    elif root_name == "beans" and namespace in JAVA_EE_NAMESPACES and file_name == "beans.xml":
+        facts.kind = "cdi config"
+        # Interceptors, decorators and alternatives aren't extracted
+        facts.trivial = len(root) == 0
+
+
+def extract_facts(relative_path: str, content: str) -> FileFacts:
+    """
+    Extracts the facts that can be read straight from a file without an LLM: JPA entities and their table schemas,
+    JAX-RS and Spring REST endpoints, data sources, persistence units and Maven dependencies. It's a pure function
+    of its arguments, so it can run in a process pool.
+    """
+    facts = FileFacts(relative_path)
+    suffix = Path(relative_path).suffix
+    if suffix == ".java":
+        _extract_java(facts, content)
+    elif suffix == ".xml":
+        _extract_xml(facts, content)
+    return facts
+
+
+def render_facts(facts: FileFacts) -> str:
+    """Renders the facts as a plain text analysis, following the structure of the LLM file analyses."""
+    lines = [f"File: {facts.relative_path}", f"Purpose: {facts.kind} (extracted without an LLM)."]
+    for entity in facts.entities:
+        lines.append(f"Database entity {entity.name} mapped to table {entity.table}:")
+        lines.append(entity.ddl())
+    for endpoint in facts.endpoints:
+        details = ", ".join(
+            part
+            for part in (
+                f"produces {endpoint.produces}" if endpoint.produces else "",
+                f"consumes {endpoint.consumes}" if endpoint.consumes else "",
+            )
+            if part
+        )
+        lines.append(
+            f"API endpoint: {endpoint.http_method} {endpoint.path} handled by {endpoint.handler}. {details}".rstrip(
+                ". "
+            )
+            + "."
+        )
+    if facts.application_path:
+        lines.append(f"JAX-RS application path: {facts.application_path}")
+    for unit in facts.persistence_units:
+        properties = ", ".join(f"{key}={value}" for key, value in unit.properties.items())
+        lines.append(
+            f"Persistence unit {unit.name} using data source {unit.data_source or 'default'}. {properties}".strip()
+        )
+    for data_source in facts.data_sources:
+        lines.append(
+            f"Data source {data_source.name}: {data_source.connection_url} (driver {data_source.driver or 'unknown'})"
+        )
+    if facts.dependencies:
+        lines.append("Build dependencies:")
+        lines.extend(f"- {dependency}" for dependency in facts.dependencies)
+    return "\n".join(lines)
+
+
+def facts_to_overview(all_facts: List[FileFacts]) -> CurrentApplication:
+    """Builds the parts of the application overview the facts already determine, to merge with the LLM's overview."""
+    # Facts are collected in completion order, sort them so the overview doesn't change between runs
+    all_facts = sorted(all_facts, key=lambda facts: facts.relative_path)
+    application_path = next((facts.application_path for facts in all_facts if facts.application_path), "")
+    entities = [entity for facts in all_facts for entity in facts.entities]
+    endpoints = [endpoint for facts in all_facts for endpoint in facts.endpoints]
+    return CurrentApplication(
+        application_summary="",
+        db_entities=[
+            DBEntity(entity_name=entity.name, summary=f"JPA entity mapped to the {entity.table} table.")
+            for entity in entities
+        ],
+        database_tables=[DBTable(name=entity.table, db_schema=entity.ddl()) for entity in entities],
+        repositories=[],
+        database_configurations=[
+            f"Data source {data_source.name}: {data_source.connection_url}"
+            for facts in all_facts
+            for data_source in facts.data_sources
+        ]
+        + [
+            f"Persistence unit {unit.name} using data source {unit.data_source or 'default'}"
+            for facts in all_facts
+            for unit in facts.persistence_units
+        ],
+        api_definitions=[
+            APIDefinition(
+                api_name=endpoint.handler,
+                api_path=f"{endpoint.http_method} {_join_paths(application_path, endpoint.path)}",
+                api_summary=f"Handled by {endpoint.handler}.",
+            )
+            for endpoint in endpoints
+        ],
+    )
@@ -0,0 +1,133 @@
+import asyncio
+import fnmatch
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List
+
+from service import migration_planner
+from service.cost_estimator import RunEstimate
+from util.config import get_config
+from util.log_manager import LogManager, log_time
+
+INPUT_DIR = Path("./input")
+BATCH_SUMMARY_FILE_NAME = "batch_summary.json"
+# The process pool of a batch with `[pre_analysis] workers=0` is capped at this many processes
+DEFAULT_WORKERS = 4
+
+log = LogManager.get_logger()
+config = get_config()
+
+
+@dataclass
+class ProjectOutcome:
+    project: str
+    succeeded: bool
+    seconds: float
+    migrated_files: int = 0
+    plan_path: str | None = None
+    error: str | None = None
+
+
+def resolve_projects(patterns: Iterable[str], input_dir: Path = INPUT_DIR) -> List[str]:
+    """Returns the project directories of `input_dir` matching any of the names or glob patterns, sorted."""
+    available = sorted(path.name for path in input_dir.iterdir() if path.is_dir()) if input_dir.is_dir() else []
+    projects: List[str] = []
+    for pattern in patterns:
+        matches = fnmatch.filter(available, pattern)
+        if not matches:
+            log.warning("No project in %s matches %s", input_dir, pattern)
+        projects.extend(match for match in matches if match not in projects)
+    return sorted(projects)
+
+
+async def _migrate_one(
+    project: str,
+    output_dir: Path,
+    resume: bool,
+    render_plan: Callable[..., None],
+    executor: ProcessPoolExecutor | None,
+    semaphore: asyncio.Semaphore,
+) -> ProjectOutcome:
+    async with semaphore:
+        start_time = time.perf_counter()
+        project_dir = output_dir / project
+        try:
+            async with log_time(f"Migration of {project}", log):
+                plan = await migration_planner.migrate_project(
+                    project, resume, llm_responses_dir=str(project_dir / "llm_responses"), executor=executor
+                )
+                plan["application_name"] = project
+                plan_path = project_dir / "migration_plan.md"
+                project_dir.mkdir(parents=True, exist_ok=True)
+                # The template rendering is CPU-bound, it goes to the process pool with the fact extraction
+                await asyncio.get_running_loop().run_in_executor(
+                    executor, partial(render_plan, plan, output_path=plan_path)
+                )
+        except Exception as e:
+            log.exception("Failed to migrate %s", project)
+            return ProjectOutcome(project, False, time.perf_counter() - start_time, error=f"{type(e).__name__}: {e}")
+        migrated_files = sum(len(files) for files in plan["migrated_files"].values())
+        return ProjectOutcome(project, True, time.perf_counter() - start_time, migrated_files, str(plan_path))
+
+
+async def estimate_projects(projects: List[str]) -> RunEstimate:
+    """Projects the run of several projects in one batch, which share the concurrency and rate budget."""
+    estimates = await asyncio.gather(*(migration_planner.estimate_migration_plan(project) for project in projects))
+    estimate = RunEstimate.from_config(config)
+    for project_estimate in estimates:
+        estimate.merge(project_estimate)
+    return estimate
+
+
+async def migrate_projects(
+    projects: List[str], render_plan: Callable[..., None], output_dir: Path, resume: bool = False
+) -> List[ProjectOutcome]:
+    """
+    Migrates several projects concurrently in one process, `max_parallel_projects` at a time. They share the LLM
+    client, the scheduler's concurrency and rate budget, the caches, the spend limit and one process pool. Every
+    project's plan is rendered by `render_plan(plan, output_path=...)` into `output_dir/<project>/`, and a summary of
+    the outcomes is saved to `output_dir/batch_summary.json`. A failed project doesn't stop the others.
+    """
+    # The projects share the event loop, so their CPU-bound work always goes to a process pool, where it can't hold up
+    # the LLM requests of the other projects
+    executor = ProcessPoolExecutor(config.pre_analysis_workers or min(DEFAULT_WORKERS, os.cpu_count() or 1))
+    semaphore = asyncio.Semaphore(max(1, config.max_parallel_projects))
+    try:
+        async with migration_planner.migration_run("batch"):
+            if migration_planner.spend_limit.enabled:
+                # The limit applies to the batch as a whole
+                migration_planner.spend_limit.check_projection(await estimate_projects(projects))
+            outcomes = await asyncio.gather(
+                *(_migrate_one(project, output_dir, resume, render_plan, executor, semaphore) for project in projects)
+            )
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    _save_summary(list(outcomes), output_dir)
+    return list(outcomes)
+
+
+def _save_summary(outcomes: List[ProjectOutcome], output_dir: Path) -> None:
+    summary: Dict[str, Any] = {
+        "projects": len(outcomes),
+        "succeeded": sum(outcome.succeeded for outcome in outcomes),
+        "failed": [outcome.project for outcome in outcomes if not outcome.succeeded],
+        "outcomes": [asdict(outcome) for outcome in outcomes],
+    }
+    output_dir.mkdir(parents=True, exist_ok=True)
+    (output_dir / BATCH_SUMMARY_FILE_NAME).write_text(json.dumps(summary, indent=2))
+    for outcome in outcomes:
+        log.info(
+            "%s: %s in %.1f seconds, %d migrated files%s",
+            outcome.project,
+            "succeeded" if outcome.succeeded else "failed",
+            outcome.seconds,
+            outcome.migrated_files,
+            f" ({outcome.error})" if outcome.error else "",
+        )
+    log.info("Migrated %d out of %d projects", summary["succeeded"], len(outcomes))
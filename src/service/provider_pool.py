@@ -0,0 +1,275 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Sequence, TypeVar
+
+from service.cost_estimator import ModelPricing
+from util.config import AppConfig, RouteConfig
+from util.metrics import metrics
+
+T = TypeVar("T")
+
+# The recent latencies of a route the hedging percentile is taken from
+LATENCY_WINDOW = 500
+# The latency an endpoint is assumed to have before its first answer, and the weight of every later one
+_INITIAL_LATENCY_SECONDS = 1.0
+_LATENCY_SMOOTHING = 0.2
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    route: str
+    model: str
+    base_url: str | None
+    api_key: str = field(repr=False)
+
+
+@dataclass
+class RouteStats:
+    requests: int = 0
+    failures: int = 0
+    hedged: int = 0
+    hedges_won: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # The attempts' latencies, a cancelled attempt's time until it was cancelled included
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+
+    def percentile(self, q: float) -> float | None:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _EndpointState:
+    def __init__(self, endpoint: Endpoint) -> None:
+        self.endpoint = endpoint
+        self.in_flight = 0
+        self.latency = _INITIAL_LATENCY_SECONDS
+        self.answered = False
+
+
+class ProviderPool:
+    """
+    The routes LLM requests go to: a route is a model served by one or more OpenAI compatible endpoints, e.g. several
+    keys or deployments of it. Requests go to the stage's route, or to the simple file route for small and plain
+    files, and within a route to the endpoint with the least load weighted by its recent latency, so a slow or failing
+    endpoint gets fewer of them.
+    A request slower than the hedge percentile of its route's recent latencies is hedged, if its route has another
+    endpoint and hedges are still within their fraction of the route's requests: a duplicate goes to another endpoint,
+    the first successful answer wins and the other request is cancelled.
+    """
+
+    def __init__(
+        self,
+        routes: Sequence[RouteConfig],
+        stage_routes: Dict[str, str] | None = None,
+        simple_file_route: str | None = None,
+        hedge_percentile: float = 0.0,
+        hedge_min_samples: int = 20,
+        hedge_min_delay_seconds: float = 1.0,
+        hedge_max_fraction: float = 0.1,
+    ) -> None:
+        if not routes:
+            raise ValueError("The provider pool needs at least one route")
+        self.default_route = routes[0].name
+        self.stage_routes = dict(stage_routes or {})
+        self.simple_file_route = simple_file_route or None
+        for route in [*self.stage_routes.values(), self.simple_file_route]:
+            if route is not None and route not in {route_config.name for route_config in routes}:
+                raise ValueError(f"Unknown route: {route}")
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = max(1, hedge_min_samples)
+        self.hedge_min_delay_seconds = hedge_min_delay_seconds
+        self.hedge_max_fraction = hedge_max_fraction
+        self._configs = {route.name: route for route in routes}
+        self._endpoints: Dict[str, List[_EndpointState]] = {
+            route.name: [
+                _EndpointState(Endpoint(route.name, route.model, base_url, route.api_keys[i % len(route.api_keys)]))
+                for i, base_url in enumerate(route.base_urls)
+            ]
+            for route in routes
+        }
+        self._states = {state.endpoint: state for states in self._endpoints.values() for state in states}
+        self._turn = itertools.count()
+        self.stats: Dict[str, RouteStats] = {route.name: RouteStats() for route in routes}
+
+    @classmethod
+    def from_config(cls, config: AppConfig) -> "ProviderPool":
+        routes = config.routes or (
+            RouteConfig(
+                "default",
+                config.openai_model,
+                (config.openai_base_url,),
+                (config.openai_key,),
+                config.input_price_per_million,
+                config.output_price_per_million,
+            ),
+        )
+        stage_routes = dict(
+            pair.split(":", 1) for pair in (item.strip() for item in config.routing_stage_routes.split(",")) if pair
+        )
+        return cls(
+            routes,
+            stage_routes={stage.strip(): route.strip() for stage, route in stage_routes.items()},
+            simple_file_route=config.routing_simple_file_route.strip(),
+            hedge_percentile=config.hedge_percentile,
+            hedge_min_samples=config.hedge_min_samples,
+            hedge_min_delay_seconds=config.hedge_min_delay_seconds,
+            hedge_max_fraction=config.hedge_max_fraction,
+        )
+
+    def route(self, stage: str, simple_file: bool = False) -> str:
+        if simple_file and self.simple_file_route is not None:
+            return self.simple_file_route
+        return self.stage_routes.get(stage, self.default_route)
+
+    def model(self, route: str) -> str:
+        return self._configs[route].model
+
+    def pricing(self, route: str) -> ModelPricing:
+        route_config = self._configs[route]
+        return ModelPricing(route_config.input_price_per_million, route_config.output_price_per_million)
+
+    def pick(self, route: str, exclude: Endpoint | None = None) -> Endpoint:
+        """The endpoint with the least requests in flight weighted by its latency, ties taking turns."""
+        states = self._endpoints[route]
+        start = next(self._turn) % len(states)
+        candidates = [state for state in states[start:] + states[:start] if state.endpoint != exclude] or states
+        return min(candidates, key=lambda state: (state.in_flight + 1) * state.latency).endpoint
+
+    def hedge_delay(self, route: str) -> float | None:
+        """How long to wait for an answer before hedging, None if the route doesn't hedge (yet)."""
+        stats = self.stats[route]
+        if (
+            self.hedge_percentile <= 0
+            or self.hedge_max_fraction <= 0
+            or len(self._endpoints[route]) < 2
+            or len(stats.latencies) < self.hedge_min_samples
+        ):
+            return None
+        return max(self.hedge_min_delay_seconds, stats.percentile(self.hedge_percentile) or 0.0)
+
+    async def run(
+        self,
+        route: str,
+        call: Callable[[Endpoint], Awaitable[T]],
+        submit: Callable[[Callable[[], Awaitable[T]]], Awaitable[T]] | None = None,
+    ) -> T:
+        """
+        Runs `call` with an endpoint of the route, hedged with another one if it's slow. Every attempt is sent through
+        `submit`, e.g. the scheduler, which may run it again on a retry: the endpoint is picked every time.
+        A failure is raised once no attempt is left, the first attempt's if both failed.
+        """
+        send = submit or (lambda request: request())
+        stats = self.stats[route]
+        stats.requests += 1
+        delay = self.hedge_delay(route)
+        if delay is None:
+            # Awaited in place, without a task to race
+            try:
+                return await send(lambda: self._attempt(self.pick(route), call))
+            except Exception:
+                stats.failures += 1
+                raise
+        first_endpoints: List[Endpoint] = []
+        started = asyncio.Event()
+
+        def first_request() -> Awaitable[T]:
+            first_endpoints.append(self.pick(route))
+            started.set()
+            return self._attempt(first_endpoints[-1], call)
+
+        first = asyncio.ensure_future(send(first_request))
+        attempts = [first]
+        try:
+            # The hedge delay runs from when the first attempt is sent, not while it waits for its turn
+            waiting = asyncio.ensure_future(started.wait())
+            try:
+                await asyncio.wait([first, waiting], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiting.cancel()
+            await asyncio.wait(attempts, timeout=delay)
+            if not first.done() and stats.hedged + 1 <= self.hedge_max_fraction * stats.requests:
+                stats.hedged += 1
+                attempts.append(
+                    asyncio.ensure_future(send(lambda: self._attempt(self.pick(route, first_endpoints[-1]), call)))
+                )
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((attempt for attempt in attempts if attempt in done and not attempt.exception()), None)
+                if winner is not None:
+                    if winner is not first:
+                        stats.hedges_won += 1
+                    if len(attempts) > 1:
+                        metrics.increment(
+                            "llm_hedged_requests_total", route=route, winner="first" if winner is first else "hedge"
+                        )
+                    return winner.result()
+            stats.failures += 1
+            return first.result()
+        finally:
+            for attempt in attempts:
+                if not attempt.done():
+                    attempt.cancel()
+                elif not attempt.cancelled():
+                    # Retrieved, so a losing attempt's failure isn't reported as never retrieved
+                    attempt.exception()
+
+    async def _attempt(self, endpoint: Endpoint, call: Callable[[Endpoint], Awaitable[T]]) -> T:
+        state = self._states[endpoint]
+        stats = self.stats[endpoint.route]
+        state.in_flight += 1
+        start_time = time.perf_counter()
+        try:
+            result = await call(endpoint)
+        except asyncio.CancelledError:
+            # A lower bound of the latency, leaving the slow attempts out would make the percentile ever shorter
+            stats.latencies.append(time.perf_counter() - start_time)
+            raise
+        except Exception:
+            # A failing endpoint looks slow, so it gets fewer requests until it answers again
+            state.latency *= 2
+            raise
+        finally:
+            state.in_flight -= 1
+        latency = time.perf_counter() - start_time
+        # The first answer replaces the assumed latency instead of averaging with it
+        state.latency = (
+            latency if not state.answered else state.latency + _LATENCY_SMOOTHING * (latency - state.latency)
+        )
+        state.answered = True
+        stats.latencies.append(latency)
+        metrics.observe("llm_route_seconds", latency, route=endpoint.route)
+        return result
+
+    def record_usage(self, route: str, prompt_tokens: int, completion_tokens: int) -> None:
+        stats = self.stats[route]
+        stats.prompt_tokens += prompt_tokens
+        stats.completion_tokens += completion_tokens
+
+    def reset(self) -> None:
+        """Forgets the statistics of the previous run, the endpoints' latencies are kept for balancing."""
+        self.stats = {route: RouteStats() for route in self._configs}
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        report = {}
+        for route, stats in self.stats.items():
+            report[route] = {
+                "model": self.model(route),
+                "endpoints": len(self._endpoints[route]),
+                "requests": stats.requests,
+                "failures": stats.failures,
+                "hedged": stats.hedged,
+                "hedges_won": stats.hedges_won,
+                "p50_seconds": round(stats.percentile(0.5) or 0.0, 3),
+                "p95_seconds": round(stats.percentile(0.95) or 0.0, 3),
+                "prompt_tokens": stats.prompt_tokens,
+                "completion_tokens": stats.completion_tokens,
+                "cost_usd": round(self.pricing(route).cost(stats.prompt_tokens, stats.completion_tokens), 6),
+            }
+        return report
@@ -0,0 +1,108 @@
+import shutil
+import sqlite3
+import tempfile
+import threading
+import weakref
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+from model.util_data_classes import AnalyzedFileDefinition, MigratedFileDefinition
+from service.analysis_cache import content_hash
+
+# Rows read per query when iterating over all the files, so the lock isn't held while the caller works on them
+PAGE_SIZE = 256
+
+
+class RecordStore:
+    """
+    The per-file data of a run, in a SQLite database on disk instead of memory: the content of every file, its
+    analysis and its migrated version. The pipeline passes around slotted records that only hold a file's metadata,
+    and the contents are read back on access, so the memory of a run doesn't grow with the size of the repository.
+    Without a path the database is a temporary file, deleted once the store and all its records are gone.
+    The store is shared by the event loop and worker threads, every access is serialized by a lock.
+    """
+
+    def __init__(self, path: Path | None = None) -> None:
+        temp_dir = None
+        if path is None:
+            temp_dir = tempfile.mkdtemp(prefix="code-migrator-records-")
+            path = Path(temp_dir) / "records.sqlite"
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # Scratch data of a single run, it doesn't need to survive a crash
+        self._connection.execute("PRAGMA journal_mode=OFF")
+        self._connection.execute("PRAGMA synchronous=OFF")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS files (relative_path TEXT PRIMARY KEY, content_hash TEXT NOT NULL, "
+            "content TEXT NOT NULL, analysis TEXT, new_file TEXT, file_category TEXT)"
+        )
+        self._finalizer = weakref.finalize(self, _close, self._connection, temp_dir)
+
+    def close(self) -> None:
+        self._finalizer()
+
+    def add_file(self, relative_path: str, content: str) -> None:
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO files (relative_path, content_hash, content) VALUES (?, ?, ?)",
+                (relative_path, content_hash(content), content),
+            )
+
+    def set_analysis(self, relative_path: str, analysis: str) -> AnalyzedFileDefinition:
+        with self._lock:
+            self._connection.execute("UPDATE files SET analysis = ? WHERE relative_path = ?", (analysis, relative_path))
+        return AnalyzedFileDefinition(self, relative_path)
+
+    def set_migration(self, relative_path: str, new_file: str, file_category: str) -> MigratedFileDefinition:
+        with self._lock:
+            self._connection.execute(
+                "UPDATE files SET new_file = ?, file_category = ? WHERE relative_path = ?",
+                (new_file, file_category, relative_path),
+            )
+        return MigratedFileDefinition(self, relative_path, file_category)
+
+    def _column(self, column: str, relative_path: str) -> str:
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT {column} FROM files WHERE relative_path = ?", (relative_path,)
+            ).fetchone()
+        if row is None or row[0] is None:
+            raise KeyError(f"No {column} recorded for {relative_path}")
+        return str(row[0])
+
+    def content(self, relative_path: str) -> str:
+        return self._column("content", relative_path)
+
+    def analysis(self, relative_path: str) -> str:
+        return self._column("analysis", relative_path)
+
+    def new_file(self, relative_path: str) -> str:
+        return self._column("new_file", relative_path)
+
+    def file_hashes(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._connection.execute("SELECT relative_path, content_hash FROM files").fetchall())
+
+    def iter_contents(self) -> Iterator[Tuple[str, str]]:
+        """Yields the path and content of every file, ordered by path, a page at a time."""
+        last_path = ""
+        while True:
+            with self._lock:
+                rows: List[Tuple[str, str]] = self._connection.execute(
+                    "SELECT relative_path, content FROM files WHERE relative_path > ? ORDER BY relative_path LIMIT ?",
+                    (last_path, PAGE_SIZE),
+                ).fetchall()
+            yield from rows
+            if len(rows) < PAGE_SIZE:
+                return
+            last_path = rows[-1][0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._connection.execute("SELECT COUNT(*) FROM files").fetchone()[0])
+
+
+def _close(connection: sqlite3.Connection, temp_dir: str | None) -> None:
+    connection.close()
+    if temp_dir is not None:
+        shutil.rmtree(temp_dir, ignore_errors=True)
@@ -0,0 +1,67 @@
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+# Words that appear in almost every DDL statement or Java file and say nothing about which table a file is about
+STOPWORDS = {
+    "add", "and", "as", "bigint", "boolean", "by", "char", "class", "constraint", "create", "date", "default", "file",
+    "for", "foreign", "from", "if", "import", "in", "int", "integer", "is", "java", "key", "not", "null", "of", "on",
+    "or", "primary", "private", "public", "references", "return", "serial", "string", "table", "text", "that", "the",
+    "this", "timestamp", "to", "unique", "varchar", "void", "with",
+}  # fmt: skip
+
+_WORD_PATTERN = re.compile(r"[A-Za-z][A-Za-z0-9]*")
+_CAMEL_CASE_PATTERN = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+
+def tokenize_identifiers(text: str) -> List[str]:
+    """
+    Splits text into lowercase terms. Identifiers are indexed both whole and split into their camelCase and
+    snake_case parts, so `MemberRepository` matches `member` and `member_id` matches `member`.
+    """
+    tokens = []
+    for word in _WORD_PATTERN.findall(text):
+        parts = _CAMEL_CASE_PATTERN.findall(word)
+        for token in [word, *parts] if len(parts) > 1 else [word]:
+            token = token.lower()
+            if len(token) > 1 and token not in STOPWORDS:
+                tokens.append(token)
+    return tokens
+
+
+class RelevanceIndex:
+    """An in-memory BM25 index over the identifiers of the analyzed files, built locally without any services."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        # An inverted index, so a query only scores the documents that contain one of its terms
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._document_lengths: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._document_lengths)
+
+    def add(self, document_id: str, text: str) -> None:
+        tokens = tokenize_identifiers(text)
+        for term, frequency in Counter(tokens).items():
+            self._postings[term][document_id] = frequency
+        self._document_lengths[document_id] = len(tokens)
+
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        """Returns up to `top_k` (document id, score) pairs of the documents matching the query, best first."""
+        if not self._document_lengths:
+            return []
+        document_count = len(self._document_lengths)
+        average_length = max(sum(self._document_lengths.values()) / document_count, 1)
+        scores: Dict[str, float] = defaultdict(float)
+        for term in set(tokenize_identifiers(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for document_id, frequency in postings.items():
+                length_norm = 1 - self.b + self.b * self._document_lengths[document_id] / average_length
+                scores[document_id] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
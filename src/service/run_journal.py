@@ -0,0 +1,77 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+from util.log_manager import LogManager
+
+try:
+    import fcntl
+except ImportError:  # Windows, where only the writers of this process are coordinated
+    fcntl = None  # type: ignore
+
+log = LogManager.get_logger()
+
+
+class RunJournal:
+    """
+    An append-only journal of the units of work a run completed, so an interrupted run can resume where it stopped.
+    Every record is a single JSON line `{"kind", "key", "value"}`, written with one append and flushed to disk
+    before `record` returns. Appends are serialized by a lock, and a file lock on POSIX, so concurrent writers never
+    interleave lines. A torn last line, from a crash in the middle of a write, is dropped on load.
+    """
+
+    def __init__(self, path: Path, resume: bool = False) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._records: Dict[Tuple[str, str], Any] = {}
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if resume:
+            self._load()
+        else:
+            path.unlink(missing_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        valid_end = 0
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+                self._records[(record["kind"], record["key"])] = record["value"]
+            except (ValueError, KeyError, TypeError):
+                break
+            valid_end += len(line)
+        if valid_end < len(data):
+            log.warning("Dropping %d bytes of an incomplete record at the end of %s", len(data) - valid_end, self.path)
+            # The next append has to start on a fresh line
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_end)
+        log.info("Resuming from %d journaled units of work in %s", len(self._records), self.path)
+
+    def get(self, kind: str, key: str) -> Any | None:
+        return self._records.get((kind, key))
+
+    def record(self, kind: str, key: str, value: Any) -> None:
+        line = (json.dumps({"kind": kind, "key": key, "value": value}, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                written = 0
+                while written < len(line):
+                    written += os.write(fd, line[written:])
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self._records[(kind, key)] = value
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import re
+from pathlib import Path, PurePosixPath
+from typing import Any, Set
+
+from util.log_manager import LogManager
+
+log = LogManager.get_logger()
+
+
+def safe_file_name(name: str) -> str:
+    """A file name made of `name`'s word characters, dots and dashes, e.g. for names chosen by the LLM."""
+    return re.sub(r"[^\w.-]+", "_", name).strip("._") or "_"
+
+
+def mirrored_path(relative_path: str, source_root: str) -> Path:
+    """
+    The path of a source file relative to its project root, e.g. `src/main/java/org/acme/Member.java`, so artifacts
+    of files with the same name in different packages don't collide. Parent references are dropped, so the artifact
+    can't escape the output directory.
+    """
+    path = PurePosixPath(relative_path.replace("\\", "/"))
+    root = PurePosixPath(source_root.replace("\\", "/"))
+    if path.is_relative_to(root):
+        path = path.relative_to(root)
+    return Path(*(part for part in path.parts if part not in ("", ".", "..", "/")))
+
+
+class ArtifactWriter:
+    """
+    Writes the artifacts of a run under `output_dir` in worker threads as soon as they're produced, so the pipeline
+    never waits for the disk. `close` waits for the pending writes. A disabled writer ignores everything.
+    """
+
+    def __init__(self, output_dir: Path, enabled: bool = True) -> None:
+        self.output_dir = output_dir
+        self.enabled = enabled
+        self.written = 0
+        self._pending: Set[asyncio.Future[None]] = set()
+
+    def write_text(self, relative_path: Path | str, text: str) -> None:
+        if not self.enabled:
+            return
+        path = self.output_dir / relative_path
+        write = asyncio.ensure_future(asyncio.to_thread(_write, path, text))
+        self._pending.add(write)
+        write.add_done_callback(self._on_written)
+
+    def write_json(self, relative_path: Path | str, value: Any) -> None:
+        self.write_text(relative_path, json.dumps(value, indent=2))
+
+    def _on_written(self, write: "asyncio.Future[None]") -> None:
+        self._pending.discard(write)
+        if write.cancelled():
+            return
+        if write.exception() is not None:
+            log.error("Failed to write an artifact to %s: %s", self.output_dir, write.exception())
+        else:
+            self.written += 1
+
+    async def close(self) -> None:
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+
+def _write(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
@@ -2,16 +2,31 @@ import os
 from configparser import ConfigParser
 from dataclasses import dataclass
 from functools import lru_cache
+from typing import Tuple
 
 
 class ConfigError(Exception):
     pass
 
 
+@dataclass(frozen=True)
+class RouteConfig:
+    name: str
+    model: str
+    # The OpenAI compatible endpoints serving the model, None for the default one. Requests are balanced between them.
+    base_urls: Tuple[str | None, ...]
+    # One key per endpoint, or one for all of them
+    api_keys: Tuple[str, ...]
+    input_price_per_million: float
+    output_price_per_million: float
+
+
 @dataclass(frozen=True)
 class AppConfig:
     openai_key: str
     openai_model: str
+    # An OpenAI compatible endpoint to send requests to instead of the default one, e.g. a local fake server
+    openai_base_url: str | None
     temperature: float
     cache_llm_responses: bool
     # The name of the project to migrate. Must be the directory name of the project inside the `input` directory.
@@ -21,6 +36,127 @@ class AppConfig:
     file_extensions_to_migrate: str
     # Output all the LLM responses to a file for debugging/auditing
     log_llm_responses: bool
+    # LLM request scheduling. A limit of 0 disables the respective per-minute budget.
+    max_concurrency: int
+    min_concurrency: int
+    requests_per_minute: int
+    tokens_per_minute: int
+    max_retries: int
+    backoff_base_seconds: float
+    backoff_max_seconds: float
+    # Responses slower than this shrink the concurrency cap. 0 only adapts to rate limiting.
+    latency_target_seconds: float
+    # Content-addressed cache of per-file analyses and migrations, reused across runs. 0 disables a GC limit.
+    analysis_cache_enabled: bool
+    analysis_cache_dir: str
+    analysis_cache_max_entries: int
+    analysis_cache_max_size_mb: int
+    analysis_cache_max_age_days: int
+    # Repository scanning. Exclude globs are comma separated `.gitignore` style patterns. 0 disables the size cap.
+    scan_exclude_globs: str
+    scan_respect_gitignore: bool
+    scan_max_file_size_kb: int
+    scan_mmap_threshold_kb: int
+    scan_max_files_in_flight: int
+    # Max prompt tokens of a single application overview request. Bigger inputs are reduced hierarchically.
+    overview_token_budget: int
+    # Max tokens of file analyses sent with a MongoDB schema request, picked from the top k most relevant files
+    schema_token_budget: int
+    schema_top_k: int
+    # Max prompt tokens of the implementation plan request, the file digests are fitted into it
+    implementation_plan_token_budget: int
+    # Local extraction of entities, endpoints, data sources and dependencies before the LLM analysis. Files the
+    # extracted facts fully describe skip the LLM. 0 workers extracts in a thread instead of a process pool.
+    pre_analysis_enabled: bool
+    pre_analysis_workers: int
+    pre_analysis_skip_trivial: bool
+    # Files up to `batch_small_file_tokens` are packed into multi-file analysis requests of up to `batch_tokens`
+    batch_analysis_enabled: bool
+    batch_small_file_tokens: int
+    batch_tokens: int
+    batch_max_files: int
+    # Files whose content is over a stage's token limit are split along type, member and element boundaries into
+    # chunks of up to that limit, processed concurrently and merged back into one analysis or migrated file
+    chunking_enabled: bool
+    chunk_analysis_max_tokens: int
+    chunk_migration_max_tokens: int
+    # Files identical to an earlier file reuse its analysis and migration, files similar to one get them adapted
+    dedup_enabled: bool
+    dedup_similarity_threshold: float
+    # Java files are migrated after the files they depend on, with the migrated signatures of their direct
+    # dependencies fitted into the token budget
+    dependency_graph_enabled: bool
+    dependency_context_token_budget: int
+    # Named routes from the `[route.<name>]` sections, the first is the default one. Without any, every request goes
+    # to the `[openai]` endpoint.
+    routes: Tuple[RouteConfig, ...]
+    # Comma separated `stage:route` pairs. Per-file requests of files within both limits go to the simple file route.
+    routing_stage_routes: str
+    routing_simple_file_route: str
+    routing_simple_file_max_tokens: int
+    routing_simple_file_max_annotations: int
+    # A request slower than this percentile of its route's recent latencies gets a duplicate sent to another endpoint,
+    # the first answer wins. 0 disables hedging.
+    hedge_percentile: float
+    hedge_min_samples: int
+    hedge_min_delay_seconds: float
+    hedge_max_fraction: float
+    # Per-run telemetry, exported as JSON and Prometheus text, plus a Chrome trace of the spans if enabled
+    metrics_enabled: bool
+    metrics_dir: str
+    metrics_chrome_trace: bool
+    # Hard limits on the tokens and cost of a run, 0 disables a limit. `on_exceed` is either `fail` or `degrade`.
+    spend_max_tokens: int
+    spend_max_cost_usd: float
+    spend_on_exceed: str
+    # USD per million tokens, for the cost estimate and limit
+    input_price_per_million: float
+    output_price_per_million: float
+    # The latency model of the dry-run estimate: a fixed overhead per request plus the output at a constant speed
+    estimate_request_latency_seconds: float
+    estimate_output_tokens_per_second: float
+    # How many projects of a multi-project run are migrated at the same time, all under the one scheduler budget
+    max_parallel_projects: int
+    # Split the migrated files out of the migration plan into a document per `category` or `package`, or `none`
+    output_shard_by: str
+
+
+def _split(value: str) -> Tuple[str, ...]:
+    return tuple(item.strip() for item in value.split(",") if item.strip())
+
+
+def _routes(parser: ConfigParser) -> Tuple[RouteConfig, ...]:
+    routes = []
+    for section in parser.sections():
+        if not section.startswith("route."):
+            continue
+        base_urls = _split(parser.get(section, "base_urls", fallback="")) or (
+            parser.get("openai", "base_url", fallback="") or None,
+        )
+        api_keys = _split(parser.get(section, "api_keys", fallback="")) or (
+            parser.get("openai", "api_key", fallback="development"),
+        )
+        if len(api_keys) not in (1, len(base_urls)):
+            raise ValueError(f"[{section}] needs one api key, or one per base url")
+        routes.append(
+            RouteConfig(
+                name=section.removeprefix("route."),
+                model=parser.get(section, "model", fallback=parser.get("openai", "model", fallback="gpt-4o-mini")),
+                base_urls=base_urls,
+                api_keys=api_keys,
+                input_price_per_million=parser.getfloat(
+                    section,
+                    "input_price_per_million",
+                    fallback=parser.getfloat("spend", "input_price_per_million", fallback=0.15),
+                ),
+                output_price_per_million=parser.getfloat(
+                    section,
+                    "output_price_per_million",
+                    fallback=parser.getfloat("spend", "output_price_per_million", fallback=0.6),
+                ),
+            )
+        )
+    return tuple(routes)
 
 
 @lru_cache(maxsize=1)
@@ -37,12 +173,70 @@ def get_config() -> AppConfig:
         return AppConfig(
             openai_key=parser.get("openai", "api_key", fallback="development"),
             openai_model=parser.get("openai", "model", fallback="gpt-4o-mini"),
+            openai_base_url=parser.get("openai", "base_url", fallback=None) or None,
             temperature=parser.getfloat("openai", "temperature", fallback=0.0),
             cache_llm_responses=parser.getboolean("general", "cache_llm_responses", fallback=False),
             input_project=parser.get("general", "input_project"),
             file_extensions_to_analyze=parser.get("general", "file_extensions_to_analyze"),
             file_extensions_to_migrate=parser.get("general", "file_extensions_to_migrate"),
             log_llm_responses=parser.getboolean("general", "log_llm_responses", fallback=False),
+            max_concurrency=parser.getint("scheduler", "max_concurrency", fallback=8),
+            min_concurrency=parser.getint("scheduler", "min_concurrency", fallback=1),
+            requests_per_minute=parser.getint("scheduler", "requests_per_minute", fallback=0),
+            tokens_per_minute=parser.getint("scheduler", "tokens_per_minute", fallback=0),
+            max_retries=parser.getint("scheduler", "max_retries", fallback=5),
+            backoff_base_seconds=parser.getfloat("scheduler", "backoff_base_seconds", fallback=1.0),
+            backoff_max_seconds=parser.getfloat("scheduler", "backoff_max_seconds", fallback=60.0),
+            latency_target_seconds=parser.getfloat("scheduler", "latency_target_seconds", fallback=0.0),
+            analysis_cache_enabled=parser.getboolean("cache", "enabled", fallback=False),
+            analysis_cache_dir=parser.get("cache", "dir", fallback="./cache/analysis"),
+            analysis_cache_max_entries=parser.getint("cache", "max_entries", fallback=0),
+            analysis_cache_max_size_mb=parser.getint("cache", "max_size_mb", fallback=0),
+            analysis_cache_max_age_days=parser.getint("cache", "max_age_days", fallback=0),
+            scan_exclude_globs=parser.get("scanner", "exclude_globs", fallback=""),
+            scan_respect_gitignore=parser.getboolean("scanner", "respect_gitignore", fallback=True),
+            scan_max_file_size_kb=parser.getint("scanner", "max_file_size_kb", fallback=0),
+            scan_mmap_threshold_kb=parser.getint("scanner", "mmap_threshold_kb", fallback=1024),
+            scan_max_files_in_flight=parser.getint("scanner", "max_files_in_flight", fallback=100),
+            overview_token_budget=parser.getint("budgets", "overview_tokens", fallback=60000),
+            schema_token_budget=parser.getint("budgets", "schema_tokens", fallback=12000),
+            schema_top_k=parser.getint("budgets", "schema_top_k", fallback=10),
+            implementation_plan_token_budget=parser.getint("budgets", "implementation_plan_tokens", fallback=60000),
+            pre_analysis_enabled=parser.getboolean("pre_analysis", "enabled", fallback=True),
+            pre_analysis_workers=parser.getint("pre_analysis", "workers", fallback=0),
+            pre_analysis_skip_trivial=parser.getboolean("pre_analysis", "skip_trivial", fallback=True),
+            batch_analysis_enabled=parser.getboolean("batching", "enabled", fallback=True),
+            batch_small_file_tokens=parser.getint("batching", "small_file_tokens", fallback=1500),
+            batch_tokens=parser.getint("batching", "batch_tokens", fallback=8000),
+            batch_max_files=parser.getint("batching", "max_files", fallback=20),
+            chunking_enabled=parser.getboolean("chunking", "enabled", fallback=True),
+            chunk_analysis_max_tokens=parser.getint("chunking", "analysis_max_tokens", fallback=50000),
+            chunk_migration_max_tokens=parser.getint("chunking", "migration_max_tokens", fallback=8000),
+            dedup_enabled=parser.getboolean("dedup", "enabled", fallback=True),
+            dedup_similarity_threshold=parser.getfloat("dedup", "similarity_threshold", fallback=0.85),
+            dependency_graph_enabled=parser.getboolean("dependency_graph", "enabled", fallback=True),
+            dependency_context_token_budget=parser.getint("dependency_graph", "context_token_budget", fallback=2000),
+            routes=_routes(parser),
+            routing_stage_routes=parser.get("routing", "stage_routes", fallback=""),
+            routing_simple_file_route=parser.get("routing", "simple_file_route", fallback=""),
+            routing_simple_file_max_tokens=parser.getint("routing", "simple_file_max_tokens", fallback=1000),
+            routing_simple_file_max_annotations=parser.getint("routing", "simple_file_max_annotations", fallback=5),
+            hedge_percentile=parser.getfloat("routing", "hedge_percentile", fallback=0.0),
+            hedge_min_samples=parser.getint("routing", "hedge_min_samples", fallback=20),
+            hedge_min_delay_seconds=parser.getfloat("routing", "hedge_min_delay_seconds", fallback=1.0),
+            hedge_max_fraction=parser.getfloat("routing", "hedge_max_fraction", fallback=0.1),
+            metrics_enabled=parser.getboolean("metrics", "enabled", fallback=False),
+            metrics_dir=parser.get("metrics", "dir", fallback="./output/metrics"),
+            metrics_chrome_trace=parser.getboolean("metrics", "chrome_trace", fallback=False),
+            spend_max_tokens=parser.getint("spend", "max_tokens", fallback=0),
+            spend_max_cost_usd=parser.getfloat("spend", "max_cost_usd", fallback=0.0),
+            spend_on_exceed=parser.get("spend", "on_exceed", fallback="fail"),
+            input_price_per_million=parser.getfloat("spend", "input_price_per_million", fallback=0.15),
+            output_price_per_million=parser.getfloat("spend", "output_price_per_million", fallback=0.6),
+            estimate_request_latency_seconds=parser.getfloat("spend", "request_latency_seconds", fallback=2.0),
+            estimate_output_tokens_per_second=parser.getfloat("spend", "output_tokens_per_second", fallback=60.0),
+            max_parallel_projects=parser.getint("projects", "max_parallel_projects", fallback=4),
+            output_shard_by=parser.get("output", "shard_by", fallback="none"),
         )
     except Exception as e:
         raise ConfigError(f"Invalid config: {e}")
@@ -0,0 +1,237 @@
+import re
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+MODIFIERS = {
+    "public", "protected", "private", "static", "final", "abstract", "synchronized", "native", "transient",
+    "volatile", "strictfp", "default", "sealed", "non-sealed",
+}  # fmt: skip
+
+_PACKAGE_PATTERN = re.compile(r"^\s*package\s+([\w.]+)\s*;", re.MULTILINE)
+_IMPORT_PATTERN = re.compile(r"^\s*import\s+(static\s+)?([\w.]+(?:\.\*)?)\s*;", re.MULTILINE)
+_TYPE_DECLARATION_PATTERN = re.compile(r"(?:^|\s)(class|interface|enum|record|@interface)\s+(\w+)")
+_ANNOTATION_NAME_PATTERN = re.compile(r"@\s*([\w.]+)")
+_IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_$][\w$]*")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+_NON_NEWLINE_PATTERN = re.compile(r"[^\n]")
+_BLANK_LINES_PATTERN = re.compile(r"\n(?:[ \t]*\n)+")
+_STRUCTURE_PATTERN = re.compile(r"[(){};]")
+_BRACKET_PATTERNS = {"(": re.compile(r"[()]"), "{": re.compile(r"[{}]")}
+_NEW_PATTERN = re.compile(r"\bnew\b")
+# Comments, text blocks, and string and char literals, the unterminated ones end at the end of the line (or file)
+_COMMENT_OR_LITERAL_PATTERN = re.compile(
+    r'//[^\n]*|/\*.*?(?:\*/|\Z)|"""(?:\\.|.)*?(?:"""|\Z)|"(?:\\.|[^"\\\n])*"?|\'(?:\\.|[^\'\\\n])*\'?',
+    re.DOTALL,
+)
+
+
+@dataclass
+class JavaAnnotation:
+    name: str
+    # The raw text between the annotation's parentheses, empty if it has none
+    arguments: str = ""
+
+    def __str__(self) -> str:
+        return f"@{self.name}({self.arguments})" if self.arguments else f"@{self.name}"
+
+
+@dataclass
+class JavaMember:
+    # One of "field", "method", "constructor", "initializer" or "type" for nested types
+    kind: str
+    name: str
+    annotations: List[JavaAnnotation]
+    modifiers: List[str]
+    # The declaration without its annotations and body, with normalized whitespace
+    signature: str
+    # Offsets of the whole member in the source, including its annotations and body
+    start: int
+    end: int
+
+    def has_annotation(self, *names: str) -> bool:
+        return any(annotation.name in names for annotation in self.annotations)
+
+    def annotation(self, name: str) -> JavaAnnotation | None:
+        return next((annotation for annotation in self.annotations if annotation.name == name), None)
+
+
+@dataclass
+class JavaType(JavaMember):
+    members: List[JavaMember] = field(default_factory=list)
+    # Offset right after the opening brace of the type's body
+    body_start: int = 0
+
+
+@dataclass
+class JavaSource:
+    package: str | None
+    imports: List[str]
+    types: List[JavaType]
+    # Offset where the first type declaration starts, everything before it is the package, imports and comments
+    header_end: int
+
+
+def _blank(text: str) -> str:
+    # Newlines are kept, so line numbers stay intact too
+    return _NON_NEWLINE_PATTERN.sub(" ", text)
+
+
+def mask_comments_and_literals(source: str) -> str:
+    """
+    Replaces comments and the contents of string and char literals with spaces, keeping every offset intact.
+    Braces, semicolons and parentheses left in the masked text are all structural.
+    """
+    pieces = []
+    position = 0
+    for match in _COMMENT_OR_LITERAL_PATTERN.finditer(source):
+        pieces.append(source[position : match.start()])
+        text = match.group()
+        if text.startswith(("//", "/*")):
+            pieces.append(_blank(text))
+        else:
+            # Keep the quotes, so the masked literal is still recognizable as one
+            quote_length = 3 if text.startswith('"""') else 1
+            closed = len(text) > quote_length and text.endswith(text[:quote_length])
+            closing_length = quote_length if closed else 0
+            pieces.append(
+                text[:quote_length]
+                + _blank(text[quote_length : len(text) - closing_length])
+                + text[len(text) - closing_length :]
+            )
+        position = match.end()
+    pieces.append(source[position:])
+    return "".join(pieces)
+
+
+def strip_comments(source: str) -> str:
+    """Removes comments and collapses the blank lines they leave behind, leaving string literals untouched."""
+    stripped = _COMMENT_OR_LITERAL_PATTERN.sub(
+        lambda match: "" if match.group().startswith(("//", "/*")) else match.group(), source
+    )
+    return _BLANK_LINES_PATTERN.sub("\n", stripped).strip() + "\n"
+
+
+def _find_closing(masked: str, start: int, opening: str, closing: str) -> int:
+    """Returns the offset of the bracket closing the one at `start`, or the end of the text if it isn't closed."""
+    depth = 0
+    for match in _BRACKET_PATTERNS[opening].finditer(masked, start):
+        depth += 1 if match.group() == opening else -1
+        if depth == 0:
+            return match.start()
+    return len(masked)
+
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE_PATTERN.sub(" ", text).strip()
+
+
+def _split_annotations(source: str, masked: str, start: int, end: int) -> Tuple[List[JavaAnnotation], int]:
+    annotations: List[JavaAnnotation] = []
+    i = start
+    while True:
+        while i < end and masked[i].isspace():
+            i += 1
+        if i >= end or masked[i] != "@" or masked.startswith("@interface", i):
+            return annotations, i
+        name_match = _ANNOTATION_NAME_PATTERN.match(masked, i)
+        if name_match is None:
+            return annotations, i
+        i = name_match.end()
+        arguments = ""
+        j = i
+        while j < end and masked[j].isspace():
+            j += 1
+        if j < end and masked[j] == "(":
+            closing = _find_closing(masked, j, "(", ")")
+            arguments = _normalize(source[j + 1 : closing])
+            i = closing + 1
+        annotations.append(JavaAnnotation(name_match.group(1).split(".")[-1], arguments))
+
+
+def _declaration(
+    source: str, masked: str, start: int, header_end: int, end: int, enclosing_type: str | None
+) -> JavaMember:
+    annotations, declaration_start = _split_annotations(source, masked, start, header_end)
+    words = masked[declaration_start:header_end].split()
+    modifiers = []
+    for word in words:
+        if word not in MODIFIERS:
+            break
+        modifiers.append(word)
+    signature = _normalize(source[declaration_start:header_end])
+    masked_signature = _normalize(masked[declaration_start:header_end])
+
+    type_match = _TYPE_DECLARATION_PATTERN.search(" " + masked_signature)
+    if type_match is not None and "(" not in masked_signature.split(type_match.group(2))[0]:
+        return JavaType("type", type_match.group(2), annotations, modifiers, signature, start, end)
+    if not masked_signature or masked_signature == "static":
+        return JavaMember("initializer", "", annotations, modifiers, signature, start, end)
+    before_parameters, has_parameters, _ = masked_signature.partition("(")
+    if has_parameters and "=" not in before_parameters:
+        names = _IDENTIFIER_PATTERN.findall(before_parameters)
+        name = names[-1] if names else ""
+        kind = "constructor" if name == enclosing_type else "method"
+        return JavaMember(kind, name, annotations, modifiers, signature, start, end)
+    names = _IDENTIFIER_PATTERN.findall(masked_signature.partition("=")[0])
+    return JavaMember("field", names[-1] if names else "", annotations, modifiers, signature, start, end)
+
+
+def _parse_members(source: str, masked: str, start: int, end: int, enclosing_type: str | None) -> List[JavaMember]:
+    """Splits the text between `start` and `end` into declarations and parses them, recursing into types."""
+    members: List[JavaMember] = []
+    segment_start = start
+    paren_depth = 0
+    # Only jump between the structural characters, everything else is part of the current declaration
+    position = start
+    while (match := _STRUCTURE_PATTERN.search(masked, position, end)) is not None:
+        i = match.start()
+        position = i + 1
+        char = match.group()
+        if char == "(":
+            paren_depth += 1
+        elif char == ")":
+            paren_depth -= 1
+        elif paren_depth == 0 and char == ";":
+            if masked[segment_start:i].strip():
+                members.append(_declaration(source, masked, segment_start, i, i + 1, enclosing_type))
+            segment_start = i + 1
+        elif paren_depth == 0 and char == "{":
+            closing = _find_closing(masked, i, "{", "}")
+            position = closing + 1
+            header = masked[segment_start:i]
+            if "=" in header.split("(")[0] or _NEW_PATTERN.search(header):
+                # An array initializer or anonymous class in a field initializer, the declaration ends at the `;`
+                continue
+            member = _declaration(source, masked, segment_start, i, closing + 1, enclosing_type)
+            if isinstance(member, JavaType):
+                member.body_start = i + 1
+                member.members = _parse_members(source, masked, i + 1, closing, member.name)
+            members.append(member)
+            segment_start = position
+    # Shift the starts past the whitespace and comments between declarations
+    for member in members:
+        while member.start < member.end and masked[member.start].isspace():
+            member.start += 1
+    return members
+
+
+def parse_java(source: str) -> JavaSource:
+    """
+    A lightweight structural parser for Java sources. It doesn't build a full syntax tree, only the package, imports,
+    and the declarations of every type with their annotations, signatures and offsets, which is what the planner
+    needs. It tolerates code it doesn't understand, so it never fails on a file.
+    """
+    masked = mask_comments_and_literals(source)
+    package_match = _PACKAGE_PATTERN.search(masked)
+    imports = [match.group(2) for match in _IMPORT_PATTERN.finditer(masked)]
+    header_end = max([match.end() for match in _IMPORT_PATTERN.finditer(masked)] + [0])
+    if package_match is not None:
+        header_end = max(header_end, package_match.end())
+    members = _parse_members(source, masked, header_end, len(source), None)
+    types = [member for member in members if isinstance(member, JavaType)]
+    return JavaSource(
+        package=package_match.group(1) if package_match else None,
+        imports=imports,
+        types=types,
+        header_end=types[0].start if types else len(source),
+    )
@@ -4,7 +4,12 @@ from contextlib import asynccontextmanager
 import time
 from logging import Logger
 from pathlib import Path
-from typing import Any, AsyncGenerator
+from typing import Any, AsyncGenerator, Dict
+
+from util.metrics import metrics
+
+# Total seconds spent in every `log_time` label of the process, e.g. for reporting the stage timings of a benchmark
+stage_timings: Dict[str, float] = {}
 
 
 class LogManager:
@@ -29,5 +34,8 @@ class LogManager:
 async def log_time(label: str, log: Logger) -> AsyncGenerator[None, Any]:
     start_time = time.perf_counter()
     log.info("%s started.", label)
-    yield
-    log.info("%s finished in %f seconds.", label, time.perf_counter() - start_time)
+    with metrics.span(label, stage="pipeline"):
+        yield
+    duration = time.perf_counter() - start_time
+    stage_timings[label] = stage_timings.get(label, 0.0) + duration
+    log.info("%s finished in %f seconds.", label, duration)
@@ -1,10 +1,51 @@
-from pathlib import Path
-from typing import Any
+from collections import defaultdict
+from pathlib import Path, PurePosixPath
+from typing import Any, Dict, Iterator, List, Tuple
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, Template
 
+from util.artifact_writer import safe_file_name
 
-def generate_markdown_from_json(json_dict: dict[str, Any], template_path: Path, output_path: Path) -> None:
+SHARD_BY_OPTIONS = ("none", "category", "package")
+SHARD_TEMPLATE_NAME = "migrated_files_shard.md.j2"
+# Rendered chunks are buffered before they're written, so the file isn't written a few bytes at a time
+STREAM_BUFFER_SIZE = 64
+
+
+def _render_to_file(template: Template, context: Dict[str, Any], output_path: Path) -> None:
+    # The template is streamed to disk, the whole document is never held in memory
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    stream = template.stream(**context)
+    stream.enable_buffering(STREAM_BUFFER_SIZE)
+    stream.dump(str(output_path), encoding="utf-8")
+
+
+def _shards(
+    migrated_files: Dict[str, List[Dict[str, Any]]], shard_by: str
+) -> Iterator[Tuple[str, Dict[str, List[Dict[str, Any]]]]]:
+    """Yields the title and the migrated files, by category, of every shard."""
+    if shard_by == "category":
+        for category, files in migrated_files.items():
+            yield category, {category: files}
+        return
+    by_package: Dict[str, Dict[str, List[Dict[str, Any]]]] = defaultdict(lambda: defaultdict(list))
+    for category, files in migrated_files.items():
+        for file in files:
+            by_package[PurePosixPath(file["relative_path"].replace("\\", "/")).parent.as_posix()][category].append(file)
+    for package in sorted(by_package):
+        yield package, dict(by_package[package])
+
+
+def generate_markdown_from_json(
+    json_dict: dict[str, Any], template_path: Path, output_path: Path, shard_by: str = "none"
+) -> None:
+    """
+    Renders the template straight to `output_path`. With `shard_by` set to `category` or `package`, the migrated
+    files are rendered into a document per shard in `<output name>_files/`, and the main document is an index
+    linking to them.
+    """
+    if shard_by not in SHARD_BY_OPTIONS:
+        raise ValueError(f"shard_by must be one of {', '.join(SHARD_BY_OPTIONS)}, got {shard_by!r}")
     env = Environment(
         loader=FileSystemLoader(template_path.parent),
         autoescape=False,
@@ -12,7 +53,24 @@ def generate_markdown_from_json(json_dict: dict[str, Any], template_path: Path,
         lstrip_blocks=True,
     )
 
-    template = env.get_template(template_path.name)
+    context = dict(json_dict)
+    if shard_by != "none":
+        shard_template = env.get_template(SHARD_TEMPLATE_NAME)
+        shards_dir = output_path.parent / f"{output_path.stem}_files"
+        file_shards = []
+        for i, (title, migrated_files) in enumerate(_shards(json_dict.get("migrated_files", {}), shard_by)):
+            # Numbered, so titles that make the same file name don't overwrite each other
+            shard_path = shards_dir / f"{i + 1:03d}_{safe_file_name(title)}.md"
+            shard_context = {"application_name": json_dict.get("application_name"), "title": title}
+            _render_to_file(shard_template, shard_context | {"migrated_files": migrated_files}, shard_path)
+            file_shards.append(
+                {
+                    "title": title,
+                    "path": shard_path.relative_to(output_path.parent).as_posix(),
+                    "files": sum(len(files) for files in migrated_files.values()),
+                }
+            )
+        context["file_shards"] = file_shards
+
     # This only works assuming the template is aware of the JSON format
-    markdown = template.render(**json_dict)
-    output_path.write_text(markdown, encoding="utf-8")
+    _render_to_file(env.get_template(template_path.name), context, output_path)
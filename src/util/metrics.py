@@ -0,0 +1,194 @@
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, ContextManager, Dict, Iterator, List, Tuple
+
+SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKENS_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+PROMETHEUS_PREFIX = "code_migrator_"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _quantile(sorted_values: List[float], quantile: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, math.ceil(quantile * len(sorted_values)) - 1)]
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.values: List[float] = []
+
+    def summary(self) -> Dict[str, float]:
+        values = sorted(self.values)
+        return {
+            "count": len(values),
+            "sum": sum(values),
+            "min": values[0],
+            "max": values[-1],
+            "p50": _quantile(values, 0.5),
+            "p90": _quantile(values, 0.9),
+            "p99": _quantile(values, 0.99),
+        }
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges, histograms and spans of a run, tagged with labels like the stage and the file.
+    Everything is a no-op while the registry is disabled, so the instrumentation can stay in the hot paths.
+    Spans are laid out in lanes, a span takes the lowest lane free when it starts, so the Chrome trace shows one
+    row per concurrent unit of work and the gaps in concurrency are visible.
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], _Histogram] = {}
+        self._trace_events: List[Dict[str, Any]] = []
+        self._busy_lanes: set[int] = set()
+        self._started_at = time.perf_counter()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+            self._trace_events.clear()
+            self._busy_lanes.clear()
+            self._started_at = time.perf_counter()
+
+    def increment(self, name: str, value: float = 1, **labels: Any) -> None:
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[(name, _labels(labels))] = value
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = SECONDS_BUCKETS, **labels: Any) -> None:
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.values.append(value)
+
+    def span(self, name: str, **labels: Any) -> ContextManager[None]:
+        """Times a unit of work into the `span_seconds` histogram and the trace, labeled by its `stage` if given."""
+        if not self.enabled:
+            return nullcontext()
+        return self._span(name, labels)
+
+    @contextmanager
+    def _span(self, name: str, labels: Dict[str, Any]) -> Iterator[None]:
+        with self._lock:
+            lane = next(lane for lane in range(len(self._busy_lanes) + 1) if lane not in self._busy_lanes)
+            self._busy_lanes.add(lane)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.observe(
+                "span_seconds", end - start, span=name, **({"stage": labels["stage"]} if "stage" in labels else {})
+            )
+            with self._lock:
+                self._busy_lanes.discard(lane)
+                self._trace_events.append(
+                    {
+                        "name": name,
+                        "cat": str(labels.get("stage", name)),
+                        "ph": "X",
+                        "ts": (start - self._started_at) * 1e6,
+                        "dur": (end - start) * 1e6,
+                        "pid": os.getpid(),
+                        "tid": lane,
+                        "args": {key: str(value) for key, value in labels.items()},
+                    }
+                )
+
+    def report(self) -> Dict[str, Any]:
+        """A JSON serializable summary of all the metrics."""
+        with self._lock:
+            return {
+                "duration_seconds": time.perf_counter() - self._started_at,
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self._counters.items())
+                ],
+                "gauges": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self._gauges.items())
+                ],
+                "histograms": [
+                    {"name": name, "labels": dict(labels), **histogram.summary()}
+                    for (name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0])
+                ],
+            }
+
+    def to_prometheus(self) -> str:
+        """Renders the metrics in the Prometheus text format, e.g. for the node exporter's textfile collector."""
+
+        def series(name: str, labels: Labels, extra: Labels = ()) -> str:
+            all_labels = ",".join(f'{key}="{_escape(value)}"' for key, value in labels + extra)
+            return f"{PROMETHEUS_PREFIX}{name}{{{all_labels}}}" if all_labels else f"{PROMETHEUS_PREFIX}{name}"
+
+        lines: List[str] = []
+        with self._lock:
+            for kind, values in (("counter", self._counters), ("gauge", self._gauges)):
+                declared = set()
+                for (name, labels), value in sorted(values.items()):
+                    if name not in declared:
+                        declared.add(name)
+                        lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name} {kind}")
+                    lines.append(f"{series(name, labels)} {value:g}")
+            declared = set()
+            for (name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+                if name not in declared:
+                    declared.add(name)
+                    lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name} histogram")
+                for bound in histogram.buckets:
+                    count = sum(1 for value in histogram.values if value <= bound)
+                    lines.append(f"{series(name + '_bucket', labels, (('le', f'{bound:g}'),))} {count}")
+                lines.append(f"{series(name + '_bucket', labels, (('le', '+Inf'),))} {len(histogram.values)}")
+                lines.append(f"{series(name + '_sum', labels)} {sum(histogram.values):g}")
+                lines.append(f"{series(name + '_count', labels)} {len(histogram.values)}")
+        return "\n".join(lines) + "\n"
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """The spans in the Trace Event Format, to open in chrome://tracing or ui.perfetto.dev."""
+        with self._lock:
+            return {"traceEvents": list(self._trace_events), "displayTimeUnit": "ms"}
+
+    def export(self, directory: Path, name: str, chrome_trace: bool = False) -> None:
+        """Writes `<name>.json`, `<name>.prom` and optionally `<name>.trace.json` into `directory`."""
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"{name}.json").write_text(json.dumps(self.report(), indent=2))
+        (directory / f"{name}.prom").write_text(self.to_prometheus())
+        if chrome_trace:
+            (directory / f"{name}.trace.json").write_text(json.dumps(self.to_chrome_trace()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# The process wide registry, enabled by the planner according to its config
+metrics = MetricsRegistry()
@@ -0,0 +1,206 @@
+import codecs
+import mmap
+import os
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple
+
+from langchain_core.documents import Document
+
+from util.log_manager import LogManager
+
+log = LogManager.get_logger()
+
+# Enough to find the NUL bytes of practically any binary format, while keeping the check cheap
+BINARY_SNIFF_BYTES = 8192
+ALWAYS_EXCLUDED_DIRS = {".git", ".hg", ".svn"}
+# UTF-8 is tried first, the last fallback can decode any byte sequence
+FALLBACK_ENCODINGS = ("utf-8", "cp1252", "latin-1")
+
+
+@dataclass(frozen=True)
+class _IgnoreRule:
+    regex: re.Pattern[str]
+    negated: bool
+    directory_only: bool
+
+
+@dataclass
+class ScanStats:
+    files: int = 0
+    ignored: int = 0
+    binary: int = 0
+    too_large: int = 0
+    bytes_read: int = 0
+    encodings: dict[str, int] = field(default_factory=dict)
+
+
+def _glob_to_regex(pattern: str) -> str:
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+            continue
+        if char == "*":
+            regex += "[^/]*"
+        elif char == "?":
+            regex += "[^/]"
+        elif char == "[" and "]" in pattern[i + 1 :]:
+            end = pattern.index("]", i + 1)
+            regex += "[" + pattern[i + 1 : end].replace("!", "^", 1) + "]"
+            i = end
+        else:
+            regex += re.escape(char)
+        i += 1
+    return regex
+
+
+def parse_ignore_patterns(patterns: Iterable[str]) -> List[_IgnoreRule]:
+    """Parses `.gitignore` style patterns, matched against '/' separated paths relative to the pattern's directory."""
+    rules = []
+    for line in patterns:
+        pattern = line.rstrip("\n").rstrip()
+        if not pattern or pattern.startswith("#"):
+            continue
+        negated = pattern.startswith("!")
+        pattern = pattern[1:] if negated else pattern
+        directory_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        # A pattern with a slash anywhere but the end is relative to its directory, otherwise it matches at any depth
+        anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+        prefix = "" if anchored else "(?:.*/)?"
+        rules.append(_IgnoreRule(re.compile(f"^{prefix}{_glob_to_regex(pattern)}$"), negated, directory_only))
+    return rules
+
+
+def _is_ignored(rule_sets: List[Tuple[str, List[_IgnoreRule]]], relative_path: str, is_dir: bool) -> bool:
+    ignored = False
+    # Later rules, and rules of deeper `.gitignore` files, take precedence
+    for base, rules in rule_sets:
+        if base and not relative_path.startswith(base + "/"):
+            continue
+        path = relative_path[len(base) + 1 :] if base else relative_path
+        for rule in rules:
+            if rule.directory_only and not is_dir:
+                continue
+            if rule.regex.match(path):
+                ignored = not rule.negated
+    return ignored
+
+
+def _decode(data: bytes | mmap.mmap) -> Tuple[str, str]:
+    # Decoded from a view, so a mapped file isn't copied into a bytes object first. The view is released before the
+    # mapping is closed.
+    with memoryview(data) as view:
+        if view[:3] == codecs.BOM_UTF8:
+            return str(view[3:], "utf-8"), "utf-8-sig"
+        if view[:2] in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE):
+            return str(view, "utf-16"), "utf-16"
+        for encoding in FALLBACK_ENCODINGS:
+            try:
+                return str(view, encoding), encoding
+            except UnicodeDecodeError:
+                continue
+    raise AssertionError("latin-1 decodes any byte sequence")
+
+
+def _is_binary(head: bytes) -> bool:
+    # UTF-16 text has NUL bytes too, but always starts with a BOM in the files we care about
+    return b"\x00" in head and head[:2] not in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+
+
+def _read_text(path: str, size: int, mmap_threshold_bytes: int, stats: ScanStats) -> str | None:
+    with open(path, "rb") as f:
+        if size == 0:
+            return ""
+        if size < mmap_threshold_bytes:
+            head = f.read(BINARY_SNIFF_BYTES)
+            if _is_binary(head):
+                return None
+            data = head + f.read()
+            text, encoding = _decode(data)
+        else:
+            # Large files are mapped instead of read, so the sniffing and decoding work on the page cache directly
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if _is_binary(mapped[:BINARY_SNIFF_BYTES]):
+                    return None
+                text, encoding = _decode(mapped)
+    stats.bytes_read += size
+    stats.encodings[encoding] = stats.encodings.get(encoding, 0) + 1
+    return text
+
+
+def scan_repository(
+    root: Path,
+    extensions: Iterable[str],
+    exclude_globs: Iterable[str] = (),
+    respect_gitignore: bool = True,
+    max_file_size_bytes: int = 0,
+    mmap_threshold_bytes: int = 1024 * 1024,
+    stats: ScanStats | None = None,
+) -> Iterator[Document]:
+    """
+    Walks the repository once and lazily yields a `Document` for every text file with one of the given extensions.
+    Files matching `.gitignore` files or the exclude globs, binaries and files over the size cap (0 for no cap)
+    are skipped. Directories are visited in sorted order so runs are reproducible.
+    """
+    stats = stats if stats is not None else ScanStats()
+    suffixes = tuple(f".{extension.strip().lstrip('.')}" for extension in extensions if extension.strip())
+    root_rules = [("", parse_ignore_patterns(exclude_globs))]
+    # A stack of directories to visit, with the ignore rules in effect for each of them
+    pending: List[Tuple[str, str, List[Tuple[str, List[_IgnoreRule]]]]] = [(str(root), "", root_rules)]
+
+    while pending:
+        directory, relative_directory, rule_sets = pending.pop()
+        gitignore_path = os.path.join(directory, ".gitignore")
+        if respect_gitignore and os.path.isfile(gitignore_path):
+            with open(gitignore_path, "r", encoding="utf-8", errors="replace") as f:
+                rule_sets = rule_sets + [(relative_directory, parse_ignore_patterns(f))]
+        try:
+            with os.scandir(directory) as scanned:
+                entries = sorted(scanned, key=lambda entry: entry.name)
+        except OSError:
+            log.warning("Failed to list directory: %s", directory)
+            continue
+
+        subdirectories = []
+        for entry in entries:
+            relative_path = f"{relative_directory}/{entry.name}" if relative_directory else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name in ALWAYS_EXCLUDED_DIRS or _is_ignored(rule_sets, relative_path, True):
+                    stats.ignored += 1
+                else:
+                    subdirectories.append((entry.path, relative_path, rule_sets))
+                continue
+            if not entry.name.endswith(suffixes) or not entry.is_file():
+                continue
+            if _is_ignored(rule_sets, relative_path, False):
+                stats.ignored += 1
+                continue
+            size = entry.stat().st_size
+            if max_file_size_bytes and size > max_file_size_bytes:
+                stats.too_large += 1
+                log.info("Skipping %s: %d bytes is over the file size cap", relative_path, size)
+                continue
+            try:
+                text = _read_text(entry.path, size, mmap_threshold_bytes, stats)
+            except OSError:
+                log.warning("Failed to read file: %s", entry.path)
+                continue
+            if text is None:
+                stats.binary += 1
+                continue
+            stats.files += 1
+            yield Document(page_content=text, metadata={"source": str(Path(entry.path))})
+
+        # Reversed, so the stack pops the subdirectories in sorted order
+        pending.extend(reversed(subdirectories))
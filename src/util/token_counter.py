@@ -0,0 +1,50 @@
+from functools import lru_cache
+from typing import Any, List
+
+# Rough average for source code and English prose, used when no tokenizer is available (e.g. offline runs).
+_CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(model: str) -> Any:
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # tiktoken downloads its BPE files on first use, fall back to the heuristic when that isn't possible
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return len(text) // _CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def batch_by_tokens(
+    items: List[str], token_budget: int, model: str = "gpt-4o-mini", min_batch_size: int = 1
+) -> List[List[str]]:
+    """
+    Greedily groups consecutive items into batches whose total token count fits the budget.
+    An item that is bigger than the budget on its own still gets a batch, unless `min_batch_size` forces company.
+    """
+    batches: List[List[str]] = []
+    batch: List[str] = []
+    batch_tokens = 0
+    for item in items:
+        item_tokens = count_tokens(item, model)
+        if batch and batch_tokens + item_tokens > token_budget and len(batch) >= min_batch_size:
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(item)
+        batch_tokens += item_tokens
+    if batch:
+        batches.append(batch)
+    return batches
@@ -1,8 +1,11 @@
+from pathlib import Path
 from typing import Any, Generator
 
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 
+from service.analysis_cache import AnalysisCache
+
 
 @pytest.fixture
 def mock_ainvoke_pipeline() -> Generator[AsyncMock, Any, None]:
@@ -11,3 +14,16 @@ def mock_ainvoke_pipeline() -> Generator[AsyncMock, Any, None]:
         mock_chain.ainvoke = AsyncMock()
         mock_pipe.return_value = mock_chain
         yield mock_chain.ainvoke
+
+
+@pytest.fixture(autouse=True)
+def isolated_planner_state(tmp_path: Path) -> Generator[AnalysisCache, Any, None]:
+    # Keep the planner's on-disk state out of the repository and independent between tests
+    (tmp_path / "llm_responses").mkdir()
+    analysis_cache = AnalysisCache(tmp_path / "analysis_cache")
+    with (
+        patch("service.migration_planner.analysis_cache", analysis_cache),
+        patch("service.migration_planner.LLM_RESPONSE_OUTPUT_BASE_DIR", str(tmp_path / "llm_responses")),
+        patch("service.migration_planner.JOURNAL_BASE_DIR", str(tmp_path / "journal")),
+    ):
+        yield analysis_cache
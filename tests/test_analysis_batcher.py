@@ -0,0 +1,70 @@
+import asyncio
+from typing import List
+
+import pytest
+
+from service.analysis_batcher import AnalysisBatcher
+
+
+@pytest.mark.asyncio
+async def test_small_files_are_packed_first_fit_and_flushed_once_all_are_decided() -> None:
+    batches: List[List[str]] = []
+
+    async def run_batch(items: List[str]) -> List[str | None]:
+        batches.append(items)
+        return [f"analysis of {item}" for item in items]
+
+    batcher = AnalysisBatcher(run_batch, token_budget=100, max_item_tokens=30, max_items=10)
+    slots = [batcher.expect() for _ in range(5)]
+    results = [
+        slots[0].submit("a", 60),
+        slots[1].submit("b", 50),
+        slots[2].submit("c", 30),
+    ]
+    # `a` and `c` fill the first batch, nothing else could fit it, so it's sent right away
+    await asyncio.sleep(0)
+    assert batches == [["a", "c"]]
+
+    batcher.close()
+    slots[3].skip()
+    await asyncio.sleep(0)
+    assert len(batches) == 1
+
+    slots[4].skip()
+    assert await asyncio.gather(*results) == ["analysis of a", "analysis of b", "analysis of c"]
+    assert batches == [["a", "c"], ["b"]]
+
+
+@pytest.mark.asyncio
+async def test_files_of_a_failed_or_incomplete_batch_resolve_to_none() -> None:
+    async def run_batch(items: List[str]) -> List[str | None]:
+        if "fail" in items:
+            raise ValueError("Malformed answer")
+        return ["analysis"]
+
+    batcher = AnalysisBatcher(run_batch, token_budget=100, max_item_tokens=10, max_items=2)
+    first = [batcher.expect().submit(item, 10) for item in ("x", "y")]
+    second = [batcher.expect().submit(item, 10) for item in ("fail", "z")]
+
+    assert await asyncio.gather(*first) == ["analysis", None]
+    assert await asyncio.gather(*second) == [None, None]
+
+
+@pytest.mark.asyncio
+async def test_batches_are_sent_right_away_while_paused() -> None:
+    batches: List[List[str]] = []
+
+    async def run_batch(items: List[str]) -> List[str | None]:
+        batches.append(items)
+        return list(items)
+
+    batcher = AnalysisBatcher(run_batch, token_budget=100, max_item_tokens=30, max_items=10)
+    slots = [batcher.expect() for _ in range(3)]
+    first = slots[0].submit("a", 10)
+    batcher.pause()
+    second = slots[1].submit("b", 10)
+    batcher.resume()
+    third = slots[2].submit("c", 10)
+
+    assert await asyncio.gather(first, second) == ["a", "b"]
+    assert batches == [["a"], ["b"]] and not third.done()
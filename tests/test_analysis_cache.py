@@ -0,0 +1,70 @@
+import os
+import time
+from pathlib import Path
+
+from service.analysis_cache import AnalysisCache, content_hash
+
+
+def test_key_depends_on_every_part() -> None:
+    key = AnalysisCache.compute_key("analysis", "template", "gpt-4o-mini", "class A {}")
+
+    assert key == AnalysisCache.compute_key("analysis", "template", "gpt-4o-mini", "class A {}")
+    assert key != AnalysisCache.compute_key("migration", "template", "gpt-4o-mini", "class A {}")
+    assert key != AnalysisCache.compute_key("analysis", "template v2", "gpt-4o-mini", "class A {}")
+    assert key != AnalysisCache.compute_key("analysis", "template", "gpt-4o", "class A {}")
+    assert key != AnalysisCache.compute_key("analysis", "template", "gpt-4o-mini", "class B {}")
+
+
+def test_get_returns_what_was_put(tmp_path: Path) -> None:
+    cache = AnalysisCache(tmp_path)
+    key = AnalysisCache.compute_key("migration", "class A {}")
+
+    assert cache.get(key) is None
+    cache.put(key, {"new_file": "class A {}", "file_category": "Model"})
+
+    assert AnalysisCache(tmp_path).get(key) == {"new_file": "class A {}", "file_category": "Model"}
+
+
+def test_manifest_diff_between_runs(tmp_path: Path) -> None:
+    first_run = AnalysisCache(tmp_path)
+    first_run.save_manifest("project", {"A.java": content_hash("class A {}"), "B.java": content_hash("class B {}")})
+
+    diff = AnalysisCache(tmp_path).diff_manifest(
+        "project", {"A.java": content_hash("class A {}"), "B.java": content_hash("class B2 {}"), "C.java": "c"}
+    )
+
+    assert diff.unchanged == ["A.java"]
+    assert diff.modified == ["B.java"]
+    assert diff.added == ["C.java"]
+    assert diff.removed == []
+    assert AnalysisCache(tmp_path).diff_manifest("project", {}).removed == ["A.java", "B.java"]
+
+
+def test_garbage_collection_evicts_least_recently_used_entries(tmp_path: Path) -> None:
+    writer = AnalysisCache(tmp_path)
+    keys = [AnalysisCache.compute_key("analysis", str(i)) for i in range(4)]
+    for age, key in zip([40, 30, 20, 10], keys):
+        writer.put(key, "analysis")
+        past = time.time() - age
+        os.utime(writer._entry_path(key), (past, past))
+
+    cache = AnalysisCache(tmp_path, max_entries=2)
+    # Reading an entry makes it the most recently used one
+    cache.get(keys[0])
+
+    assert cache.collect_garbage() == 2
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) is None
+    assert cache.get(keys[3]) is not None
+
+
+def test_garbage_collection_keeps_entries_of_the_latest_manifest(tmp_path: Path) -> None:
+    previous_run = AnalysisCache(tmp_path)
+    live_key = AnalysisCache.compute_key("analysis", "live")
+    previous_run.put(live_key, "analysis")
+    previous_run.save_manifest("project", {})
+    os.utime(previous_run._entry_path(live_key), (0, 0))
+
+    assert AnalysisCache(tmp_path, max_age_days=1).collect_garbage() == 0
+    assert AnalysisCache(tmp_path).get(live_key) == "analysis"
@@ -0,0 +1,41 @@
+from pathlib import Path
+
+import pytest
+from langchain_openai import ChatOpenAI
+from pydantic import SecretStr
+
+from benchmarks.fake_openai_server import FakeOpenAIServer, FakeServerSettings
+from benchmarks.synthetic_repo import generate_repository
+from model.llm_response_models import CurrentApplication, FileAnalyses
+
+
+def test_generates_the_requested_number_of_files(tmp_path: Path) -> None:
+    assert generate_repository(tmp_path, 23, fields_per_entity=2) == 23
+    files = [path for path in tmp_path.rglob("*") if path.is_file()]
+
+    assert len(files) == 23
+    assert (tmp_path / "src/main/java/com/example/app/model/Entity0.java").read_text().count("@Column") == 2
+
+
+@pytest.mark.asyncio
+async def test_fake_server_answers_structured_output_requests() -> None:
+    with FakeOpenAIServer(FakeServerSettings(seed=1)) as server:
+        llm = ChatOpenAI(model="gpt-4o-mini", api_key=SecretStr("fake"), base_url=server.base_url)
+
+        overview = await llm.with_structured_output(CurrentApplication).ainvoke("Summarize the application")
+        batch = await llm.with_structured_output(FileAnalyses).ainvoke(
+            "===== File: a/A.java =====\nclass A {}\n===== File: b/B.java =====\nclass B {}"
+        )
+
+    assert isinstance(overview, CurrentApplication) and overview.database_tables
+    assert isinstance(batch, FileAnalyses)
+    assert [analysis.file_path for analysis in batch.analyses] == ["a/A.java", "b/B.java"]
+    assert server.stats.completed == 2 and server.stats.prompt_tokens > 0
+
+
+def test_fake_server_rate_limits_with_a_retry_after() -> None:
+    with FakeOpenAIServer(FakeServerSettings(rate_limit_rate=1.0, retry_after_seconds=7)) as server:
+        status, _, headers = server.respond({"model": "gpt-4o-mini", "messages": []})
+
+    assert (status, headers) == (429, {"Retry-After": "7"})
+    assert server.stats.rate_limited == 1
@@ -0,0 +1,32 @@
+from pathlib import Path
+
+from model.llm_response_models import MigratedFileSchema
+from service.chain_registry import ChainRegistry
+from util.config import get_config
+
+
+def test_templates_are_read_and_compiled_once(tmp_path: Path) -> None:
+    (tmp_path / "migrate_file.prompt").write_text("Migrate {file_content} given {analysis}")
+    chains = ChainRegistry(get_config(), tmp_path)
+
+    prompt = chains.prompt("migrate_file", ["analysis", "file_content"])
+    (tmp_path / "migrate_file.prompt").write_text("Changed on disk")
+
+    assert chains.prompt("migrate_file", ["analysis", "file_content"]) is prompt
+    assert prompt.format(analysis="an entity", file_content="class A {}") == "Migrate class A {} given an entity"
+    assert chains.template_tokens("migrate_file") > 0
+    # Nothing needed the LLM client yet
+    assert chains._llm is None
+
+    chains.clear()
+    assert chains.template("migrate_file") == "Changed on disk"
+
+
+def test_the_llm_client_and_structured_outputs_are_built_on_first_use() -> None:
+    chains = ChainRegistry(get_config())
+
+    model = chains.model(MigratedFileSchema)
+
+    assert chains._llm is not None
+    assert chains.model(MigratedFileSchema) is model
+    assert chains.model() is chains.llm
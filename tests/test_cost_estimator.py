@@ -0,0 +1,141 @@
+import asyncio
+import dataclasses
+from typing import Any, Dict
+from unittest.mock import MagicMock, patch
+
+import pytest
+from langchain_core.documents import Document
+
+from service import migration_planner
+from service.cost_estimator import BudgetExceededError, ModelPricing, RunEstimate, SpendLimit, pack_into_batches
+from test_migration_planner import _mock_llm_responses, _respond_by_stage
+
+PRICING = ModelPricing(input_price_per_million=1.0, output_price_per_million=4.0)
+
+
+def _documents() -> list[Document]:
+    return [
+        Document(
+            page_content="@Entity\npublic class Member {\n    @Id\n    private Long id;\n}",
+            metadata={"source": "input/Member.java"},
+        ),
+        *(
+            Document(
+                page_content=f"public class Test{i} {{ void run() {{}} }}", metadata={"source": f"input/Test{i}.java"}
+            )
+            for i in range(3)
+        ),
+    ]
+
+
+def test_run_estimate_totals_and_wall_time() -> None:
+    estimate = RunEstimate(PRICING, max_concurrency=2, request_latency_seconds=1.0, output_tokens_per_second=100.0)
+    for _ in range(4):
+        estimate.add_request("analysis", 1000, 100)
+    estimate.add_request("plan", 5000, 1000)
+
+    assert (estimate.requests, estimate.total_tokens) == (5, 10400)
+    assert estimate.cost_usd == pytest.approx((9000 * 1.0 + 1400 * 4.0) / 1e6)
+    # 4 requests of 2 seconds over 2 slots, then the 11 seconds plan
+    assert estimate.wall_seconds == pytest.approx(4 + 11)
+    estimate.requests_per_minute = 60
+    assert estimate.wall_seconds == pytest.approx(4 + 11)
+    estimate.requests_per_minute = 30
+    assert estimate.wall_seconds == pytest.approx(8 + 11)
+
+
+def test_pack_into_batches() -> None:
+    assert pack_into_batches([3, 3, 3, 5, 1], token_budget=6) == [[3, 3], [3], [5, 1]]
+    assert pack_into_batches([1, 1, 1], token_budget=10, max_items=2) == [[1, 1], [1]]
+    assert pack_into_batches([5, 5, 5], token_budget=4, min_items=2) == [[5, 5], [5]]
+
+
+def test_requests_in_flight_reserve_their_spend_until_they_are_done() -> None:
+    spend_limit = SpendLimit(PRICING, max_tokens=1000)
+
+    first = spend_limit.reserve("analysis", 400, 200)
+    with pytest.raises(BudgetExceededError):
+        spend_limit.reserve("analysis", 400, 200)
+
+    spend_limit.record(300, 100)
+    spend_limit.release(first)
+    second = spend_limit.reserve("analysis", 400, 200)
+
+    assert (spend_limit.spent_tokens, spend_limit.reserved_tokens) == (400, 600)
+    spend_limit.release(second)
+    assert spend_limit.reserved_tokens == 0 and SpendLimit(PRICING).reserve("analysis", 10**9) is None
+
+
+def test_spend_limit_degrades_only_the_migrations() -> None:
+    spend_limit = SpendLimit(PRICING, max_tokens=1000, on_exceed="degrade")
+    spend_limit.record(900, 50)
+
+    spend_limit.reserve("plan", 500)
+    with pytest.raises(BudgetExceededError):
+        spend_limit.reserve("migration", 10)
+
+    failing_limit = SpendLimit(PRICING, max_cost_usd=0.001)
+    failing_limit.reserve("analysis", 900)
+    with pytest.raises(BudgetExceededError):
+        failing_limit.reserve("analysis", 1100)
+    with pytest.raises(ValueError):
+        SpendLimit(PRICING, on_exceed="ignore")
+
+
+@pytest.mark.asyncio
+@patch("service.migration_planner._load_files")
+async def test_dry_run_sends_nothing(mock_load_files: MagicMock, mock_ainvoke_pipeline: Any) -> None:
+    mock_load_files.side_effect = lambda project: iter(_documents())
+
+    estimate = await migration_planner.estimate_migration_plan()
+
+    assert not mock_ainvoke_pipeline.called
+    assert (estimate.files, estimate.files_without_analysis_request) == (4, 1)
+    requests = {name: stage.requests for name, stage in estimate.stages.items()}
+    # The 3 small files share a request, the entity is described by its facts and its table gets a schema
+    assert requests == {"analysis": 1, "migration": 4, "overview": 1, "schema": 1, "plan": 1}
+
+
+@pytest.mark.asyncio
+@patch("service.migration_planner._load_files")
+async def test_run_projected_over_the_limit_fails_before_any_request(
+    mock_load_files: MagicMock, mock_ainvoke_pipeline: Any
+) -> None:
+    mock_load_files.side_effect = lambda project: iter(_documents())
+
+    with patch.object(migration_planner, "spend_limit", SpendLimit(PRICING, max_tokens=100)):
+        with pytest.raises(BudgetExceededError):
+            await migration_planner.create_migration_plan()
+
+    assert not mock_ainvoke_pipeline.called
+
+
+@pytest.mark.asyncio
+@patch("service.migration_planner._load_files")
+async def test_degraded_run_skips_the_migrations_past_the_limit(
+    mock_load_files: MagicMock, mock_ainvoke_pipeline: Any
+) -> None:
+    mock_load_files.side_effect = lambda project: iter(_documents())
+    spend_limit = SpendLimit(PRICING, max_tokens=1_000_000, on_exceed="degrade")
+    respond = _respond_by_stage(_mock_llm_responses())
+
+    entity_migrated = asyncio.Event()
+
+    async def spend_everything_on_the_analysis(inputs: Dict[str, Any], config: Dict[str, Any]) -> Any:
+        if "analysis" in inputs:
+            entity_migrated.set()
+        elif "files" in inputs:
+            # Spent once the entity's migration got its reservation, whichever request is sent first
+            await asyncio.wait_for(entity_migrated.wait(), 5)
+            spend_limit.record(1_000_000, 0)
+        return respond(inputs)
+
+    mock_ainvoke_pipeline.side_effect = spend_everything_on_the_analysis
+    # Without the dependency graph, the entity's migration doesn't wait for the scan to be done
+    config = dataclasses.replace(migration_planner.config, dependency_graph_enabled=False)
+    with patch.object(migration_planner, "spend_limit", spend_limit), patch.object(migration_planner, "config", config):
+        result: Dict[str, Any] = await migration_planner.create_migration_plan()
+
+    assert result["implementation_steps"][0]["name"] == "Step 1"
+    # Only the entity, analyzed from its facts, was migrated before the batch analysis spent the budget
+    assert [migrated_file["name"] for migrated_file in result["migrated_files"]["Service"]] == ["Member.java"]
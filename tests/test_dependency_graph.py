@@ -0,0 +1,119 @@
+from typing import Any, Dict, List
+from unittest.mock import MagicMock, patch
+
+import pytest
+from langchain_core.documents import Document
+
+from model.llm_response_models import MigratedFileSchema
+from service import migration_planner
+from service.dependency_graph import DependencyGraph, extract_type_references
+from test_migration_planner import _mock_llm_responses, _respond_by_stage
+
+FILES = {
+    "model/Member.java": "package app.model;\n\npublic class Member {\n    private Address address;\n}\n",
+    "model/Address.java": "package app.model;\n\npublic class Address {\n    private Member owner;\n}\n",
+    "data/MemberRepository.java": (
+        "package app.data;\n\nimport app.model.Member;\nimport java.util.List;\n\n"
+        "public class MemberRepository {\n    List<Member> findAll() { return null; }\n}\n"
+    ),
+    "service/MemberService.java": (
+        "package app.service;\n\nimport app.data.*;\n\n"
+        '// Not an Address\npublic class MemberService {\n    MemberRepository repository;\n    String s = "Address";\n}\n'
+    ),
+}
+
+
+def _graph() -> DependencyGraph:
+    graph = DependencyGraph()
+    for relative_path, content in FILES.items():
+        graph.add_file(relative_path, extract_type_references(content))
+    graph.resolve()
+    return graph
+
+
+def test_dependencies_are_resolved_through_imports_and_packages() -> None:
+    graph = _graph()
+
+    assert graph.dependencies == {
+        "model/Member.java": ["model/Address.java"],
+        "model/Address.java": ["model/Member.java"],
+        # `List` is a JDK type, ignored
+        "data/MemberRepository.java": ["model/Member.java"],
+        # Through the on-demand import, the comment and the string don't count
+        "service/MemberService.java": ["data/MemberRepository.java"],
+    }
+
+
+def test_cycles_are_migrated_together_in_the_first_wave_they_can() -> None:
+    graph = _graph()
+
+    assert graph.waves() == [
+        ["model/Address.java", "model/Member.java"],
+        ["data/MemberRepository.java"],
+        ["service/MemberService.java"],
+    ]
+    assert graph.in_same_cycle("model/Address.java", "model/Member.java")
+    assert graph.prerequisites("model/Member.java") == []
+    assert graph.prerequisites("data/MemberRepository.java") == ["model/Member.java"]
+    assert graph.report() == {
+        "files": 4,
+        "dependencies": 4,
+        "cycles": 1,
+        "largest_cycle": 2,
+        "waves": 3,
+        "largest_wave": 2,
+    }
+
+
+def test_extra_edges_only_join_files_in_the_graph() -> None:
+    graph = DependencyGraph()
+    for relative_path in ("a/Copy.java", "b/Copy.java"):
+        graph.add_file(relative_path, extract_type_references("package x;\nclass Copy {}"))
+    graph.add_edge("b/Copy.java", "a/Copy.java")
+    graph.add_edge("b/Copy.java", "beans.xml")
+    graph.resolve()
+
+    assert graph.dependencies == {"a/Copy.java": [], "b/Copy.java": ["a/Copy.java"]}
+
+
+def test_type_references_are_cached_by_content() -> None:
+    content = FILES["data/MemberRepository.java"]
+    references = migration_planner._type_references(content)
+
+    with patch("service.migration_planner.extract_type_references", side_effect=AssertionError):
+        assert migration_planner._type_references(content) == references
+
+
+@pytest.mark.asyncio
+@patch("service.migration_planner._load_files")
+async def test_files_are_migrated_after_their_dependencies_with_their_migrated_signatures(
+    mock_load_files: MagicMock, mock_ainvoke_pipeline: Any
+) -> None:
+    mock_load_files.return_value = [
+        Document(page_content=content, metadata={"source": f"input/{relative_path}"})
+        for relative_path, content in FILES.items()
+    ]
+    respond = _respond_by_stage(_mock_llm_responses())
+    migrations: List[Dict[str, Any]] = []
+
+    def respond_with_signatures(inputs: Dict[str, Any], config: Any = None) -> Any:
+        if "analysis" in inputs:
+            migrations.append(inputs)
+            name = inputs["file_content"].split("public class ")[1].split(" ")[0]
+            return MigratedFileSchema(
+                new_file=f"public class {name}Document {{\n    public void migrated{name}() {{}}\n}}",
+                file_category="Service",
+            )
+        return respond(inputs)
+
+    mock_ainvoke_pipeline.side_effect = respond_with_signatures
+    await migration_planner.create_migration_plan()
+
+    order = [inputs["file_content"].split("public class ")[1].split(" ")[0] for inputs in migrations]
+    assert order.index("Member") < order.index("MemberRepository") < order.index("MemberService")
+    dependencies = {name: inputs.get("dependencies", "") for name, inputs in zip(order, migrations)}
+    assert dependencies["Member"] == dependencies["Address"] == ""
+    assert dependencies["MemberRepository"].startswith("input/model/Member.java:\n")
+    assert "public void migratedMember()" in dependencies["MemberRepository"]
+    assert "migratedMemberRepository" in dependencies["MemberService"]
+    assert "migratedMember()" not in dependencies["MemberService"]
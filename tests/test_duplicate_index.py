@@ -0,0 +1,100 @@
+import dataclasses
+from typing import Any, Dict
+from unittest.mock import MagicMock, patch
+
+import pytest
+from langchain_core.documents import Document
+
+from service import migration_planner
+from service.duplicate_index import DuplicateIndex, DuplicateMatch, file_diff, sketch_file
+from test_migration_planner import _mock_llm_responses, _respond_by_stage
+
+METHODS = "".join(
+    f"\n    public Member find{i}(long id) {{\n        return em.find(Member.class, id + {i});\n    }}\n"
+    for i in range(12)
+)
+DAO = f"package com.example;\n\npublic class MemberDao {{\n    @PersistenceContext\n    private EntityManager em;\n{METHODS}}}\n"
+# One more method and a different comment and formatting
+NEAR_DAO = DAO.replace(
+    "    private EntityManager em;\n", "    // The entity manager\n    private   EntityManager em;\n"
+).replace("\n}\n", "\n\n    public void delete(Member member) {\n        em.remove(member);\n    }\n}\n")
+OTHER = "\n".join(f'<bean id="bean{i}" class="com.example.Bean{i}" scope="prototype"/>' for i in range(30))
+
+
+def test_identical_files_are_exact_duplicates() -> None:
+    index = DuplicateIndex()
+
+    assert index.add("a/MemberDao.java", sketch_file("a/MemberDao.java", DAO)) is None
+    assert index.add("b/MemberDao.java", sketch_file("b/MemberDao.java", DAO)) == DuplicateMatch(
+        "a/MemberDao.java", 1.0, True
+    )
+
+
+def test_similar_files_are_near_duplicates_of_the_most_similar_earlier_file() -> None:
+    index = DuplicateIndex()
+    index.add("beans.xml", sketch_file("beans.xml", OTHER))
+    index.add("MemberDao.java", sketch_file("MemberDao.java", DAO))
+
+    match = index.add("OtherDao.java", sketch_file("OtherDao.java", NEAR_DAO))
+
+    assert match is not None and match.representative == "MemberDao.java"
+    assert not match.exact and 0.85 <= match.similarity < 1
+
+
+def test_dissimilar_and_small_files_have_no_match() -> None:
+    index = DuplicateIndex()
+    index.add("MemberDao.java", sketch_file("MemberDao.java", DAO))
+    index.add("Small.java", sketch_file("Small.java", "class Small {}"))
+
+    assert index.add("beans.xml", sketch_file("beans.xml", OTHER)) is None
+    assert index.add("Tiny.java", sketch_file("Tiny.java", "class Tiny {}")) is None
+
+
+def test_report_counts_the_clusters_and_the_reused_results() -> None:
+    index = DuplicateIndex()
+    for path, content in [("A.java", DAO), ("B.java", DAO), ("C.java", NEAR_DAO), ("beans.xml", OTHER)]:
+        index.add(path, sketch_file(path, content))
+    index.reused["analysis", "exact"] += 1
+    index.reused["migration", "near"] += 1
+
+    assert index.report() == {
+        "files": 4,
+        "exact_duplicates": 1,
+        "near_duplicates": 1,
+        "clusters": 1,
+        "largest_cluster": 3,
+        "requests_saved": 1,
+        "requests_adapted": 1,
+    }
+
+
+def test_file_diff_only_has_the_changes_with_their_context() -> None:
+    diff = file_diff("MemberDao.java", DAO, "OtherDao.java", NEAR_DAO)
+
+    assert diff.startswith("--- MemberDao.java\n+++ OtherDao.java\n")
+    assert "+    public void delete(Member member) {\n" in diff
+    assert "find5" not in diff
+
+
+@pytest.mark.asyncio
+@patch("service.migration_planner._load_files")
+async def test_duplicates_reuse_or_adapt_the_results_of_their_representative(
+    mock_load_files: MagicMock, mock_ainvoke_pipeline: Any
+) -> None:
+    mock_load_files.return_value = [
+        Document(page_content=content, metadata={"source": f"input/{name}.java"})
+        for name, content in [("MemberDao", DAO), ("CopyDao", DAO), ("OtherDao", NEAR_DAO)]
+    ]
+    mock_ainvoke_pipeline.side_effect = _respond_by_stage(_mock_llm_responses())
+
+    with patch.object(migration_planner, "config", dataclasses.replace(migration_planner.config, dedup_enabled=True)):
+        result: Dict[str, Any] = await migration_planner.create_migration_plan()
+
+    requests = [call.args[0] for call in mock_ainvoke_pipeline.call_args_list]
+    # The exact copy costs no request, the near duplicate's results are adapted from the first file's
+    assert len([inputs for inputs in requests if set(inputs) == {"file_content"}]) == 1
+    assert len([inputs for inputs in requests if set(inputs) == {"analysis", "file_content"}]) == 1
+    assert [(inputs["file_path"], inputs["original_path"]) for inputs in requests if "diff" in inputs] == [
+        ("input/OtherDao.java", "input/MemberDao.java")
+    ] * 2
+    assert len(result["migrated_files"]["Service"]) == 3
@@ -0,0 +1,108 @@
+import dataclasses
+from typing import Any, Dict
+from unittest.mock import patch
+
+import pytest
+
+from model.llm_response_models import MigratedFilePartSchema
+from service import migration_planner
+from service.file_chunker import FileChunk, chunk_file, merge_analyses, merge_migrated_parts
+from service.record_store import RecordStore
+
+HEADER = "package com.example;\n\nimport javax.ejb.Stateless;\n\n@Stateless\npublic class MemberService {\n"
+METHODS = "".join(
+    f"\n    // Finds member {i}\n    public Member find{i}(long id) {{\n        return em.find(Member.class, id);\n    }}\n"
+    for i in range(30)
+)
+JAVA_SOURCE = HEADER + METHODS + "}\n"
+
+
+def test_small_files_are_a_single_chunk() -> None:
+    assert chunk_file("MemberService.java", JAVA_SOURCE, 100000) == [
+        FileChunk("", JAVA_SOURCE, 1, JAVA_SOURCE.count("\n") + 1)
+    ]
+
+
+def test_java_files_are_split_between_members_with_the_header_as_context() -> None:
+    chunks = chunk_file("MemberService.java", JAVA_SOURCE, 200)
+
+    assert len(chunks) > 1
+    assert all(chunk.context == HEADER for chunk in chunks)
+    # Every method stays whole, with its comment, and the chunks cover the whole body in order
+    assert "".join(chunk.content for chunk in chunks) == "\n" + METHODS
+    for chunk in chunks:
+        assert chunk.content.strip().startswith("// Finds member") and chunk.content.rstrip().endswith("}")
+    assert chunks[0].first_line == 8
+
+
+def test_xml_files_are_split_between_the_children_of_the_root() -> None:
+    dependencies = "".join(
+        f"\n    <dependency>\n      <groupId>g{i}</groupId>\n      <artifactId>a{i}</artifactId>\n    </dependency>"
+        for i in range(40)
+    )
+    prolog = '<?xml version="1.0"?>\n<!-- build -->\n<project xmlns="http://maven.apache.org/POM/4.0.0">'
+    chunks = chunk_file("pom.xml", f"{prolog}{dependencies}\n</project>\n", 150)
+
+    assert len(chunks) > 1
+    assert all(chunk.context == prolog + "\n" for chunk in chunks)
+    assert "".join(chunk.content for chunk in chunks) == dependencies + "\n"
+    assert all(chunk.content.rstrip().endswith("</dependency>") for chunk in chunks)
+
+
+def test_other_files_and_oversized_members_are_split_between_lines() -> None:
+    properties = "".join(f"property.{i}=value {i}\n" for i in range(200))
+
+    chunks = chunk_file("application.properties", properties, 100)
+
+    assert len(chunks) > 1
+    assert "".join(chunk.content for chunk in chunks) == properties
+    assert all(chunk.content.endswith("\n") for chunk in chunks)
+
+
+def test_migrated_parts_are_merged_in_order_with_their_imports() -> None:
+    chunks = [FileChunk("class A", "a", 1, 2), FileChunk("class A", "b", 3, 4)]
+    parts = [
+        ("package com.example;\n\nimport java.util.List;\n\npublic class A {", "    void a() {}", "}"),
+        (
+            "package com.example;\nimport java.util.Map;\nimport java.util.List;\npublic class A {",
+            "    void b() {}",
+            "}",
+        ),
+    ]
+
+    assert merge_migrated_parts(chunks, parts) == (
+        "package com.example;\n\nimport java.util.List;\nimport java.util.Map;\n\npublic class A {\n"
+        "    void a() {}\n    void b() {}\n}\n"
+    )
+    assert merge_analyses(chunks, ["First half", "Second half"]) == (
+        "Part 1/2 (lines 1-2):\nFirst half\n\nPart 2/2 (lines 3-4):\nSecond half"
+    )
+
+
+@pytest.mark.asyncio
+async def test_oversized_files_are_migrated_in_parts(mock_ainvoke_pipeline: Any) -> None:
+    def respond(inputs: Dict[str, Any], config: Any = None) -> MigratedFilePartSchema:
+        method = inputs["file_content"].strip().splitlines()[0]
+        return MigratedFilePartSchema(
+            header="package com.example;\n\n@Service\npublic class MemberService {",
+            body=f"    {method}",
+            footer="}",
+            file_category="Service",
+        )
+
+    mock_ainvoke_pipeline.side_effect = respond
+    store = RecordStore()
+    store.add_file("src/MemberService.java", JAVA_SOURCE)
+    analyzed_file = store.set_analysis("src/MemberService.java", "A stateless EJB finding members")
+
+    with patch.object(
+        migration_planner, "config", dataclasses.replace(migration_planner.config, chunk_migration_max_tokens=200)
+    ):
+        migrated_file = await migration_planner._migrate_file(analyzed_file)
+
+    parts = mock_ainvoke_pipeline.call_count
+    assert parts > 1
+    assert migrated_file["file_category"] == "Service"
+    assert migrated_file["new_file"].startswith("package com.example;\n\n@Service\npublic class MemberService {\n")
+    assert migrated_file["new_file"].count("// Finds member") == parts
+    assert migrated_file["new_file"].endswith("\n}\n")
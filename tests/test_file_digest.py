@@ -0,0 +1,98 @@
+from service.file_digest import OMITTED_MARKER, TRUNCATION_MARKER, digest_file, fit_to_token_budget
+from util.token_counter import count_tokens
+
+ENTITY = """package com.example.model;
+
+import jakarta.persistence.Column;
+import jakarta.persistence.Entity;
+
+@Entity
+public class Customer {
+    @Id
+    private Long id;
+
+    @Column(name = "email_address")
+    private String email;
+
+    private String internalNote;
+
+    public Long getId() {
+        return id;
+    }
+
+    public void setId(Long id) {
+        this.id = id;
+    }
+
+    public boolean hasEmail() {
+        return email != null;
+    }
+
+    private void audit() {
+    }
+}
+"""
+
+PERSISTENCE_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<persistence version="3.0" xmlns="https://jakarta.ee/xml/ns/persistence">
+    <persistence-unit name="primary">
+        <jta-data-source>java:jboss/datasources/ExampleDS</jta-data-source>
+        <properties>
+            <property name="hibernate.hbm2ddl.auto" value="create-drop" />
+        </properties>
+    </persistence-unit>
+</persistence>
+"""
+
+
+def test_java_digest_keeps_the_structure_and_drops_the_bodies() -> None:
+    assert digest_file("src/Customer.java", ENTITY).splitlines() == [
+        "File: src/Customer.java",
+        "package com.example.model",
+        "@Entity public class Customer",
+        "  @Id private Long id",
+        '  @Column(name = "email_address") private String email',
+        "  public boolean hasEmail()",
+        "  accessors for: Id",
+        "persistence touch points: jakarta.persistence",
+    ]
+
+
+def test_xml_digest_keeps_the_configuration_values() -> None:
+    assert digest_file("META-INF/persistence.xml", PERSISTENCE_XML).splitlines() == [
+        "File: META-INF/persistence.xml",
+        "root element: persistence version=3.0",
+        "persistence-unit: name=primary",
+        "jta-data-source: java:jboss/datasources/ExampleDS",
+        "property: name=hibernate.hbm2ddl.auto value=create-drop",
+    ]
+
+
+def test_digests_are_fitted_into_the_budget() -> None:
+    small = "File: Small.java\npackage a"
+    big = "\n".join(["File: Big.java", *(f"public void method{i}()" for i in range(200))])
+
+    fitted = fit_to_token_budget([small, big], 200)
+
+    assert fitted[0] == small
+    assert fitted[1].startswith("File: Big.java\npublic void method0()")
+    assert fitted[1].endswith(TRUNCATION_MARKER)
+    assert sum(count_tokens(digest) for digest in fitted) <= 200
+    assert fit_to_token_budget([small, big], 10_000) == [small, big]
+
+
+def test_thousands_of_digests_are_fitted_into_the_budget_by_omitting_the_last_ones() -> None:
+    digests = [
+        "\n".join([f"File: src/module{i % 7}/Entity{i}.java", *(f"public void method{j}()" for j in range(20))])
+        for i in range(5000)
+    ]
+
+    fitted = fit_to_token_budget(digests, 20_000)
+
+    assert count_tokens("\n\n".join(fitted)) <= 20_000
+    # As many files as possible are named, down to their first line
+    assert fitted[0] == f"File: src/module0/Entity0.java\n{TRUNCATION_MARKER}"
+    omitted = fitted[-1].splitlines()
+    assert all(line.startswith(OMITTED_MARKER) for line in omitted)
+    assert sum(int(line.split()[2]) for line in omitted) == 5000 - (len(fitted) - 1)
+    assert count_tokens("\n\n".join(fit_to_token_budget(digests, 50))) <= 50
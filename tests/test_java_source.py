@@ -0,0 +1,72 @@
+from util.java_source import mask_comments_and_literals, parse_java
+
+SOURCE = """package com.example.model;
+
+import jakarta.persistence.Entity;
+import static java.util.Objects.requireNonNull;
+
+/** A customer, with a { brace in its javadoc */
+@Entity
+@Table(name = "customer", uniqueConstraints = @UniqueConstraint(columnNames = {"email"}))
+public class Customer implements Serializable {
+    private static final Map<String, String> DEFAULTS = new HashMap<>() {{ put("a", "}"); }};
+
+    @Id
+    @GeneratedValue
+    private Long id;
+
+    private String email = "{;}";
+
+    public Customer(String email) {
+        this.email = requireNonNull(email);
+    }
+
+    @Transient
+    public String getEmail() {
+        Runnable r = () -> { System.out.println("}"); };
+        return email;
+    }
+
+    public enum Status { ACTIVE, INACTIVE }
+}
+"""
+
+
+def test_masking_keeps_offsets_and_structure() -> None:
+    source = "String s = \"a{b}\"; // comment {\nchar c = '}';"
+    masked = mask_comments_and_literals(source)
+
+    assert len(masked) == len(source)
+    assert masked.split("\n") == ['String s = "    ";' + " " * 13, "char c = ' ';"]
+
+
+def test_parses_the_package_imports_and_declarations() -> None:
+    source = parse_java(SOURCE)
+
+    assert source.package == "com.example.model"
+    assert source.imports == ["jakarta.persistence.Entity", "java.util.Objects.requireNonNull"]
+    (customer,) = source.types
+    assert customer.name == "Customer"
+    assert SOURCE[source.header_end :].startswith("@Entity")
+    assert [str(annotation) for annotation in customer.annotations] == [
+        "@Entity",
+        '@Table(name = "customer", uniqueConstraints = @UniqueConstraint(columnNames = {"email"}))',
+    ]
+    assert customer.signature == "public class Customer implements Serializable"
+    assert [(member.kind, member.name) for member in customer.members] == [
+        ("field", "DEFAULTS"),
+        ("field", "id"),
+        ("field", "email"),
+        ("constructor", "Customer"),
+        ("method", "getEmail"),
+        ("type", "Status"),
+    ]
+
+
+def test_member_offsets_cover_annotations_and_bodies() -> None:
+    customer = parse_java(SOURCE).types[0]
+    get_email = customer.members[4]
+
+    assert get_email.has_annotation("Transient")
+    assert SOURCE[get_email.start : get_email.end].startswith("@Transient\n    public String getEmail() {")
+    assert SOURCE[get_email.start : get_email.end].endswith("return email;\n    }")
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Generator, List
+
+import pytest
+from langchain_openai import ChatOpenAI
+from pydantic import SecretStr
+
+from service.llm_scheduler import LLMScheduler, is_retryable
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code: int) -> None:
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+class _FakeChatCompletionsHandler(BaseHTTPRequestHandler):
+    # Number of requests to reject with a 429 before answering
+    rate_limited_requests = 0
+    received_requests: List[dict[str, Any]] = []
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        type(self).received_requests.append(body)
+        if type(self).rate_limited_requests > 0:
+            type(self).rate_limited_requests -= 1
+            self._respond(429, {"error": {"message": "Rate limit reached", "type": "requests"}})
+            return
+        self._respond(
+            200,
+            {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": 0,
+                "model": body["model"],
+                "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": "fake analysis"}, "finish_reason": "stop"}
+                ],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+            },
+        )
+
+    def _respond(self, status: int, payload: dict[str, Any]) -> None:
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+@pytest.fixture
+def fake_endpoint() -> Generator[str, Any, None]:
+    _FakeChatCompletionsHandler.received_requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeChatCompletionsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+
+
+def test_is_retryable() -> None:
+    assert is_retryable(_StatusError(429))
+    assert is_retryable(_StatusError(503))
+    assert is_retryable(TimeoutError())
+    assert not is_retryable(_StatusError(400))
+    assert not is_retryable(ValueError())
+
+
+@pytest.mark.asyncio
+async def test_concurrency_cap_is_respected() -> None:
+    scheduler = LLMScheduler(max_concurrency=3)
+    in_flight = 0
+    peak = 0
+
+    async def call() -> None:
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+
+    await asyncio.gather(*(scheduler.submit("test", call) for _ in range(20)))
+
+    assert peak == 3
+
+
+@pytest.mark.asyncio
+async def test_retries_transient_errors_and_backs_off_concurrency() -> None:
+    scheduler = LLMScheduler(max_concurrency=8, backoff_base_seconds=0.001, backoff_max_seconds=0.01)
+    attempts = 0
+
+    async def call() -> str:
+        nonlocal attempts
+        attempts += 1
+        if attempts < 3:
+            raise _StatusError(429)
+        return "done"
+
+    assert await scheduler.submit("test", call) == "done"
+    assert attempts == 3
+    assert scheduler.concurrency_limit < 8
+
+
+@pytest.mark.asyncio
+async def test_non_retryable_errors_fail_right_away() -> None:
+    scheduler = LLMScheduler(backoff_base_seconds=0.001)
+    attempts = 0
+
+    async def call() -> None:
+        nonlocal attempts
+        attempts += 1
+        raise _StatusError(400)
+
+    with pytest.raises(_StatusError):
+        await scheduler.submit("test", call)
+    assert attempts == 1
+
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_retries() -> None:
+    scheduler = LLMScheduler(max_retries=2, backoff_base_seconds=0.001, backoff_max_seconds=0.001)
+    attempts = 0
+
+    async def call() -> None:
+        nonlocal attempts
+        attempts += 1
+        raise _StatusError(503)
+
+    with pytest.raises(_StatusError):
+        await scheduler.submit("test", call)
+    assert attempts == 3
+
+
+@pytest.mark.asyncio
+async def test_concurrency_grows_back_after_successes() -> None:
+    scheduler = LLMScheduler(max_concurrency=4, backoff_base_seconds=0)
+    scheduler._decrease("test")
+    scheduler._decrease("test")
+    assert scheduler.concurrency_limit == 1
+
+    async def call() -> None:
+        pass
+
+    for _ in range(10):
+        await scheduler.submit("test", call)
+
+    assert scheduler.concurrency_limit == 4
+
+
+@pytest.mark.asyncio
+async def test_request_budget_delays_requests() -> None:
+    # 600 requests per minute refill one request every 0.1 seconds once the initial burst is spent
+    scheduler = LLMScheduler(requests_per_minute=600)
+    scheduler._request_bucket._tokens = 0
+
+    async def call() -> None:
+        pass
+
+    loop = asyncio.get_running_loop()
+    start_time = loop.time()
+    await asyncio.gather(*(scheduler.submit("test", call) for _ in range(2)))
+
+    assert loop.time() - start_time >= 0.15
+
+
+@pytest.mark.asyncio
+async def test_retries_rate_limited_requests_against_a_local_endpoint(fake_endpoint: str) -> None:
+    _FakeChatCompletionsHandler.rate_limited_requests = 2
+    llm = ChatOpenAI(model="gpt-4o-mini", api_key=SecretStr("fake"), base_url=fake_endpoint, max_retries=0)
+    scheduler = LLMScheduler(backoff_base_seconds=0.001, backoff_max_seconds=0.01)
+
+    response = await scheduler.submit("test", lambda: llm.ainvoke("Analyze this file"), estimated_tokens=5)
+
+    assert response.content == "fake analysis"
+    assert len(_FakeChatCompletionsHandler.received_requests) == 3
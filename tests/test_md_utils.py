@@ -0,0 +1,55 @@
+from pathlib import Path
+from typing import Any, Dict
+
+import pytest
+
+from util.md_utils import generate_markdown_from_json
+from test_migration_planner import _mock_llm_responses
+
+TEMPLATE_PATH = Path("./resources/output_templates/migration_plan.md.j2")
+
+
+def _plan() -> Dict[str, Any]:
+    responses = _mock_llm_responses()
+    return (
+        responses["overview"].model_dump()
+        | {"mongo_db_schemas": [responses["schema"].model_dump()]}
+        | responses["implementation_plan"].model_dump()
+        | {
+            "application_name": "kitchensink",
+            "migrated_files": {
+                "Service": [
+                    {"relative_path": "input/app/service/Member.java", "new_file": "class MemberService {}"},
+                    {"relative_path": "input/app/model/Member.java", "new_file": "class MemberDocument {}"},
+                ],
+                "Model": [{"relative_path": "input/app/model/Address.java", "new_file": "class Address {}"}],
+            },
+        }
+    )
+
+
+def test_plan_includes_the_migrated_files(tmp_path: Path) -> None:
+    generate_markdown_from_json(_plan(), TEMPLATE_PATH, tmp_path / "migration_plan.md")
+
+    markdown = (tmp_path / "migration_plan.md").read_text()
+    assert markdown.startswith("# kitchensink MongoDB Migration Plan")
+    assert "File: `input/app/model/Member.java`\n```java\nclass MemberDocument {}\n```" in markdown
+    assert not (tmp_path / "migration_plan_files").exists()
+
+
+def test_plan_sharded_by_package_links_to_the_shards(tmp_path: Path) -> None:
+    generate_markdown_from_json(_plan(), TEMPLATE_PATH, tmp_path / "migration_plan.md", shard_by="package")
+
+    index = (tmp_path / "migration_plan.md").read_text()
+    assert "class MemberDocument" not in index
+    assert "- [input/app/model](migration_plan_files/001_input_app_model.md) (2 files)" in index
+    assert "- [input/app/service](migration_plan_files/002_input_app_service.md) (1 files)" in index
+    shard = (tmp_path / "migration_plan_files" / "001_input_app_model.md").read_text()
+    assert shard.startswith("# kitchensink Files to Change: input/app/model")
+    assert "class MemberDocument {}" in shard and "class Address {}" in shard
+    assert "class MemberService" not in shard
+
+
+def test_unknown_sharding_is_rejected(tmp_path: Path) -> None:
+    with pytest.raises(ValueError):
+        generate_markdown_from_json(_plan(), TEMPLATE_PATH, tmp_path / "migration_plan.md", shard_by="file")
@@ -0,0 +1,92 @@
+import json
+from dataclasses import replace
+from pathlib import Path
+from typing import Any, Dict
+from unittest.mock import MagicMock, patch
+
+import pytest
+from langchain_core.documents import Document
+
+from service import migration_planner
+from util.metrics import TOKENS_BUCKETS, MetricsRegistry
+from test_migration_planner import _mock_llm_responses, _respond_by_stage
+
+
+def test_disabled_registry_records_nothing() -> None:
+    registry = MetricsRegistry()
+    registry.increment("requests_total")
+    registry.observe("latency_seconds", 1.0)
+    with registry.span("work"):
+        pass
+
+    assert registry.report()["counters"] == []
+    assert registry.report()["histograms"] == []
+    assert registry.to_chrome_trace()["traceEvents"] == []
+
+
+def test_prometheus_export() -> None:
+    registry = MetricsRegistry(enabled=True)
+    registry.increment("requests_total", stage="analysis")
+    registry.increment("requests_total", 2, stage="analysis")
+    registry.set_gauge("in_flight", 3)
+    for tokens in (200, 3000):
+        registry.observe("prompt_tokens", tokens, buckets=TOKENS_BUCKETS, stage="analysis")
+
+    text = registry.to_prometheus()
+
+    assert "# TYPE code_migrator_requests_total counter" in text
+    assert 'code_migrator_requests_total{stage="analysis"} 3' in text
+    assert "code_migrator_in_flight 3" in text
+    assert 'code_migrator_prompt_tokens_bucket{stage="analysis",le="250"} 1' in text
+    assert 'code_migrator_prompt_tokens_bucket{stage="analysis",le="+Inf"} 2' in text
+    assert 'code_migrator_prompt_tokens_sum{stage="analysis"} 3200' in text
+    histogram = registry.report()["histograms"][0]
+    assert (histogram["count"], histogram["p50"], histogram["p99"]) == (2, 200, 3000)
+
+
+def test_overlapping_spans_take_separate_lanes() -> None:
+    registry = MetricsRegistry(enabled=True)
+    with registry.span("first", stage="analysis"):
+        with registry.span("second", stage="analysis"):
+            pass
+    with registry.span("third", stage="migration"):
+        pass
+
+    lanes = {event["name"]: event["tid"] for event in registry.to_chrome_trace()["traceEvents"]}
+    assert lanes == {"first": 0, "second": 1, "third": 0}
+
+
+@pytest.mark.asyncio
+@patch("service.migration_planner._load_files")
+async def test_run_metrics_are_exported(mock_load_files: MagicMock, mock_ainvoke_pipeline: Any, tmp_path: Path) -> None:
+    mock_load_files.return_value = [
+        Document(page_content="public class Test {}", metadata={"source": "input/Test.java"})
+    ]
+    respond = _respond_by_stage(_mock_llm_responses())
+    run_configs = []
+
+    def respond_and_record_config(inputs: Dict[str, Any], config: Dict[str, Any]) -> Any:
+        run_configs.append(config)
+        return respond(inputs)
+
+    mock_ainvoke_pipeline.side_effect = respond_and_record_config
+    metrics_config = replace(migration_planner.config, metrics_dir=str(tmp_path), metrics_chrome_trace=True)
+
+    with (
+        patch.object(migration_planner, "config", metrics_config),
+        patch.object(migration_planner.metrics, "enabled", True),
+    ):
+        await migration_planner.create_migration_plan()
+
+    project = metrics_config.input_project
+    report: Dict[str, Any] = json.loads((tmp_path / f"{project}.json").read_text())
+    requests = {
+        counter["labels"]["stage"]: counter["value"]
+        for counter in report["counters"]
+        if counter["name"] == "llm_requests_total"
+    }
+    assert all(len(run_config["callbacks"]) == 1 for run_config in run_configs)
+    assert requests == {"analysis": 1, "overview": 1, "schema": 1, "migration": 1, "plan": 1}
+    assert "code_migrator_llm_request_seconds_count" in (tmp_path / f"{project}.prom").read_text()
+    trace = json.loads((tmp_path / f"{project}.trace.json").read_text())
+    assert {event["cat"] for event in trace["traceEvents"]} >= {"pipeline", "analysis", "plan"}
@@ -1,4 +1,7 @@
-from typing import Any, Dict
+import asyncio
+import dataclasses
+import re
+from typing import Any, Callable, Dict
 from unittest.mock import MagicMock, patch
 
 import pytest
@@ -7,6 +10,8 @@ from langchain_core.documents import Document
 from model.llm_response_models import (
     CurrentApplication,
     DBTable,
+    FileAnalyses,
+    FileAnalysis,
     MongoDBSchema,
     MongoDBDesignDecision,
     MigratedFileSchema,
@@ -15,19 +20,16 @@ from model.llm_response_models import (
     ImplementationConsideration,
     MigratedAppTestingStrategy,
 )
+from service import migration_planner
 from service.migration_planner import create_migration_plan
 
 
-@pytest.mark.asyncio
-@patch("service.migration_planner._load_files")
-async def test_create_migration_plan_success(mock_load_files: MagicMock, mock_ainvoke_pipeline: Any) -> None:
-    mock_doc = Document(page_content="public class Test {}", metadata={"source": "input/Test.java"})
-    mock_load_files.return_value = [mock_doc]
-    mock_ainvoke_pipeline.side_effect = [
+def _mock_llm_responses() -> Dict[str, Any]:
+    return {
         # This is for `_analyze_file`: it expects `.content`
-        MagicMock(content="Mocked analysis content"),
+        "analysis": MagicMock(content="Mocked analysis content"),
         # For `_create_application_overview`
-        CurrentApplication(
+        "overview": CurrentApplication(
             application_summary="Mocked app summary",
             db_entities=[],
             database_tables=[DBTable(name="users", db_schema="CREATE TABLE users (...)")],
@@ -36,18 +38,18 @@ async def test_create_migration_plan_success(mock_load_files: MagicMock, mock_ai
             api_definitions=[],
         ),
         # For `_create_mongo_db_schema`
-        MongoDBSchema(
+        "schema": MongoDBSchema(
             collection_name="users",
             mongo_db_schema="{ _id: ObjectId, name: String }",
             schema_decisions=[MongoDBDesignDecision(name="Design rationale", considerations=["Simplified data model"])],
         ),
         # For `_migrate_file`
-        MigratedFileSchema(
+        "migration": MigratedFileSchema(
             new_file="public class Migrated {}",
             file_category="Service",
         ),
         # For `_create_implementation_plan`
-        ImplementationPlan(
+        "implementation_plan": ImplementationPlan(
             implementation_steps=[ImplementationStep(name="Step 1", sub_tasks=["Task A", "Task B"])],
             data_initialization_script="db.collection.insertMany(...)",
             additional_considerations=[
@@ -59,7 +61,38 @@ async def test_create_migration_plan_success(mock_load_files: MagicMock, mock_ai
                 test_class_template="@SpringBootTest",
             ),
         ),
-    ]
+    }
+
+
+def _respond_by_stage(responses: Dict[str, Any]) -> Callable[[Dict[str, Any]], Any]:
+    # Stages run concurrently, so the responses are matched to the prompt inputs rather than to the call order
+    def respond(inputs: Dict[str, Any], config: Any = None) -> Any:
+        if "existing_files" in inputs:
+            return responses["implementation_plan"]
+        if "schema" in inputs:
+            return responses["schema"]
+        if "analyses" in inputs:
+            return responses["overview"]
+        if "analysis" in inputs or "migrated_file" in inputs:
+            return responses["migration"]
+        if "files" in inputs:
+            return FileAnalyses(
+                analyses=[
+                    FileAnalysis(file_path=file_path, analysis=f"Mocked analysis of {file_path}")
+                    for file_path in re.findall(r"===== File: (.+) =====", inputs["files"])
+                ]
+            )
+        return responses["analysis"]
+
+    return respond
+
+
+@pytest.mark.asyncio
+@patch("service.migration_planner._load_files")
+async def test_create_migration_plan_success(mock_load_files: MagicMock, mock_ainvoke_pipeline: Any) -> None:
+    mock_doc = Document(page_content="public class Test {}", metadata={"source": "input/Test.java"})
+    mock_load_files.return_value = [mock_doc]
+    mock_ainvoke_pipeline.side_effect = _respond_by_stage(_mock_llm_responses())
 
     result: Dict[str, Any] = await create_migration_plan()
 
@@ -74,6 +107,48 @@ async def test_create_migration_plan_success(mock_load_files: MagicMock, mock_ai
     assert result["testing_strategy"]["test_class_template"] == "@SpringBootTest"
 
 
+@pytest.mark.asyncio
+@patch("service.migration_planner._load_files")
+async def test_the_scan_waits_while_too_many_files_are_being_analyzed(
+    mock_load_files: MagicMock, mock_ainvoke_pipeline: Any
+) -> None:
+    scanned = 0
+    analyzed = 0
+    max_ahead = 0
+
+    def load_files(project: str) -> Any:
+        nonlocal scanned, max_ahead
+        for i in range(40):
+            scanned += 1
+            max_ahead = max(max_ahead, scanned - analyzed)
+            yield Document(
+                page_content=f"public class Test{i} {{ void run{i}() {{}} }}",
+                metadata={"source": f"input/Test{i}.java"},
+            )
+
+    respond = _respond_by_stage(_mock_llm_responses())
+
+    async def slow_analysis(inputs: Dict[str, Any], config: Any = None) -> Any:
+        nonlocal analyzed
+        await asyncio.sleep(0.01)
+        if "files" in inputs:
+            analyzed += inputs["files"].count("===== File:")
+        elif "file_content" in inputs and "analysis" not in inputs:
+            analyzed += 1
+        return respond(inputs)
+
+    mock_load_files.side_effect = load_files
+    mock_ainvoke_pipeline.side_effect = slow_analysis
+    config = dataclasses.replace(migration_planner.config, scan_max_files_in_flight=3, dedup_enabled=False)
+    with patch.object(migration_planner, "config", config):
+        result: Dict[str, Any] = await asyncio.wait_for(create_migration_plan(), 30)
+
+    # The small files held in a batch don't keep the scan waiting for more of them
+    assert len(result["migrated_files"]["Service"]) == 40
+    # The files in flight and the one just read
+    assert max_ahead <= 4
+
+
 @pytest.mark.asyncio
 async def test_create_migration_plan_no_analysis_raises(mock_ainvoke_pipeline: Any) -> None:
     # No files analyzed, simulating empty analysis case
@@ -81,3 +156,155 @@ async def test_create_migration_plan_no_analysis_raises(mock_ainvoke_pipeline: A
 
     with pytest.raises(Exception):
         await create_migration_plan()
+
+
+@pytest.mark.asyncio
+@patch("service.migration_planner._load_files")
+async def test_create_migration_plan_reuses_cached_file_results(
+    mock_load_files: MagicMock, mock_ainvoke_pipeline: Any
+) -> None:
+    mock_load_files.return_value = [
+        Document(page_content="public class Test {}", metadata={"source": "input/Test.java"})
+    ]
+    responses = _mock_llm_responses()
+    mock_ainvoke_pipeline.side_effect = _respond_by_stage(responses)
+    await create_migration_plan()
+
+    # Only the project wide stages are sent to the LLM again, the file analysis and migration come from the cache
+    del responses["analysis"], responses["migration"]
+    result: Dict[str, Any] = await create_migration_plan()
+
+    assert result["migrated_files"]["Service"][0]["new_file"] == "public class Migrated {}"
+    assert mock_ainvoke_pipeline.call_count == 8
+
+
+@pytest.mark.asyncio
+@patch("service.migration_planner._load_files")
+async def test_files_are_migrated_without_waiting_for_the_overview(
+    mock_load_files: MagicMock, mock_ainvoke_pipeline: Any
+) -> None:
+    mock_load_files.return_value = [
+        Document(page_content="public class Test {}", metadata={"source": "input/Test.java"})
+    ]
+    respond = _respond_by_stage(_mock_llm_responses())
+    migration_started = asyncio.Event()
+
+    async def respond_after_migration_started(inputs: Dict[str, Any], config: Any = None) -> Any:
+        if "analysis" in inputs:
+            migration_started.set()
+        elif "analyses" in inputs and "schema" not in inputs:
+            # A barrier between the analysis and migration stages would never get past this
+            await asyncio.wait_for(migration_started.wait(), timeout=5)
+        return respond(inputs)
+
+    mock_ainvoke_pipeline.side_effect = respond_after_migration_started
+    result: Dict[str, Any] = await create_migration_plan()
+
+    assert result["application_summary"] == "Mocked app summary"
+    assert result["migrated_files"]["Service"][0]["name"] == "Test.java"
+
+
+@pytest.mark.asyncio
+@patch("service.migration_planner._load_files")
+async def test_files_described_by_their_facts_skip_the_llm_analysis(
+    mock_load_files: MagicMock, mock_ainvoke_pipeline: Any
+) -> None:
+    mock_load_files.return_value = [
+        Document(
+            page_content="@Entity\npublic class Member {\n    @Id\n    private Long id;\n}",
+            metadata={"source": "input/Member.java"},
+        )
+    ]
+    prompts_inputs = []
+    respond = _respond_by_stage(_mock_llm_responses())
+
+    async def record_inputs(inputs: Dict[str, Any], config: Any = None) -> Any:
+        prompts_inputs.append(inputs)
+        return respond(inputs)
+
+    mock_ainvoke_pipeline.side_effect = record_inputs
+    result: Dict[str, Any] = await create_migration_plan()
+
+    assert not any(set(inputs) <= {"file_content", "facts"} for inputs in prompts_inputs)
+    assert "CREATE TABLE Member" in next(inputs for inputs in prompts_inputs if "analysis" in inputs)["analysis"]
+    assert [table["name"] for table in result["database_tables"]] == ["Member", "users"]
+
+
+@pytest.mark.asyncio
+@patch("service.migration_planner._load_files")
+async def test_small_files_are_analyzed_in_a_batch(mock_load_files: MagicMock, mock_ainvoke_pipeline: Any) -> None:
+    mock_load_files.return_value = [
+        Document(page_content=f"public class Test{i} {{ void run() {{}} }}", metadata={"source": f"input/Test{i}.java"})
+        for i in range(3)
+    ]
+    respond = _respond_by_stage(_mock_llm_responses())
+
+    def drop_the_last_file(inputs: Dict[str, Any], config: Any = None) -> Any:
+        response = respond(inputs)
+        if "files" in inputs:
+            # A malformed batch answer, the missing file falls back to an analysis of its own
+            response.analyses = [analysis for analysis in response.analyses if analysis.file_path != "input/Test2.java"]
+        return response
+
+    mock_ainvoke_pipeline.side_effect = drop_the_last_file
+    await create_migration_plan()
+
+    requests = [call.args[0] for call in mock_ainvoke_pipeline.call_args_list]
+    assert len([inputs for inputs in requests if "files" in inputs]) == 1
+    assert [inputs["file_content"] for inputs in requests if set(inputs) == {"file_content"}] == [
+        "public class Test2 { void run() {} }\n"
+    ]
+    with open(f"{migration_planner.LLM_RESPONSE_OUTPUT_BASE_DIR}/file_analyses.txt") as f:
+        assert f.read().count("Mocked analysis of input/Test") == 2
+
+
+@pytest.mark.asyncio
+@patch("service.migration_planner._load_files")
+async def test_resume_only_redoes_the_missing_units_of_work(
+    mock_load_files: MagicMock, mock_ainvoke_pipeline: Any
+) -> None:
+    mock_load_files.return_value = [
+        Document(page_content="public class Test {}", metadata={"source": "input/Test.java"})
+    ]
+    respond = _respond_by_stage(_mock_llm_responses())
+
+    def fail_the_plan(inputs: Dict[str, Any], config: Any = None) -> Any:
+        if "existing_files" in inputs:
+            raise KeyboardInterrupt
+        return respond(inputs)
+
+    mock_ainvoke_pipeline.side_effect = fail_the_plan
+    with pytest.raises(KeyboardInterrupt):
+        await create_migration_plan()
+
+    mock_ainvoke_pipeline.reset_mock()
+    mock_ainvoke_pipeline.side_effect = respond
+    result: Dict[str, Any] = await create_migration_plan(resume=True)
+
+    assert result["implementation_steps"][0]["name"] == "Step 1"
+    assert [list(call.args[0]) for call in mock_ainvoke_pipeline.call_args_list] == [
+        ["existing_files", "new_files", "mongo_db_schemas"]
+    ]
+
+
+@pytest.mark.asyncio
+@patch("service.migration_planner._load_files")
+async def test_migrated_files_are_written_at_their_source_path(
+    mock_load_files: MagicMock, mock_ainvoke_pipeline: Any
+) -> None:
+    project_root = f"input/{migration_planner.config.input_project}"
+    mock_load_files.return_value = [
+        Document(
+            page_content=f"public class {package.title()} {{}}",
+            metadata={"source": f"{project_root}/src/{package}/Test.java"},
+        )
+        for package in ("service", "model")
+    ]
+    mock_ainvoke_pipeline.side_effect = _respond_by_stage(_mock_llm_responses())
+
+    await create_migration_plan()
+
+    migrated_files_dir = f"{migration_planner.LLM_RESPONSE_OUTPUT_BASE_DIR}/migrated_files"
+    for package in ("service", "model"):
+        with open(f"{migrated_files_dir}/src/{package}/Test.java") as f:
+            assert f.read() == "public class Migrated {}"
@@ -0,0 +1,70 @@
+import dataclasses
+from typing import Any, Dict
+from unittest.mock import patch
+
+import pytest
+
+from model.llm_response_models import APIDefinition, ApplicationSummary, CurrentApplication, DBEntity, DBTable
+from service import migration_planner
+from service.overview_reducer import merge_application_overviews
+
+
+def _overview(name: str, **fields: Any) -> CurrentApplication:
+    return CurrentApplication(
+        application_summary=f"Summary of {name}",
+        db_entities=fields.get("db_entities", []),
+        database_tables=fields.get("database_tables", []),
+        repositories=fields.get("repositories", []),
+        database_configurations=fields.get("database_configurations", []),
+        api_definitions=fields.get("api_definitions", []),
+    )
+
+
+def test_merge_deduplicates_the_partial_lists() -> None:
+    first = _overview(
+        "first",
+        db_entities=[DBEntity(entity_name="Member", summary="A registered member")],
+        database_tables=[DBTable(name="Member", db_schema="CREATE TABLE member (id BIGINT)")],
+        repositories=["MemberRepository reads members"],
+        api_definitions=[APIDefinition(api_name="List members", api_path="/members", api_summary="Lists")],
+    )
+    second = _overview(
+        "second",
+        db_entities=[DBEntity(entity_name="member", summary="Duplicate"), DBEntity(entity_name="Team", summary="")],
+        database_tables=[DBTable(name="member", db_schema="CREATE TABLE member (id BIGINT, email VARCHAR(255))")],
+        repositories=["MemberRepository reads members"],
+        api_definitions=[
+            APIDefinition(api_name="List members", api_path="/members/", api_summary="Duplicate"),
+            APIDefinition(api_name="Create member", api_path="/members", api_summary="Creates"),
+        ],
+    )
+
+    merged = merge_application_overviews([first, second], "Merged summary")
+
+    assert merged.application_summary == "Merged summary"
+    assert [entity.entity_name for entity in merged.db_entities] == ["Member", "Team"]
+    assert [table.db_schema for table in merged.database_tables] == [
+        "CREATE TABLE member (id BIGINT, email VARCHAR(255))"
+    ]
+    assert merged.repositories == ["MemberRepository reads members"]
+    assert [api.api_name for api in merged.api_definitions] == ["List members", "Create member"]
+
+
+@pytest.mark.asyncio
+async def test_overview_is_reduced_hierarchically_when_over_the_token_budget(mock_ainvoke_pipeline: Any) -> None:
+    def respond(inputs: Dict[str, Any], config: Any = None) -> Any:
+        if "summaries" in inputs:
+            return ApplicationSummary(application_summary=" + ".join(inputs["summaries"]))
+        (analysis,) = inputs["analyses"]
+        return _overview(analysis, db_entities=[DBEntity(entity_name=analysis, summary="")])
+
+    mock_ainvoke_pipeline.side_effect = respond
+    # Every analysis gets a batch of its own and the summaries are merged in pairs
+    small_budget_config = dataclasses.replace(migration_planner.config, overview_token_budget=1)
+    with patch("service.migration_planner.config", small_budget_config):
+        overview = await migration_planner._create_application_overview(["A", "B", "C"])
+
+    assert overview.application_summary == "Summary of A + Summary of B + Summary of C"
+    assert [entity.entity_name for entity in overview.db_entities] == ["A", "B", "C"]
+    # 3 partial overviews, then 2 merge rounds of a single request each
+    assert mock_ainvoke_pipeline.call_count == 5
@@ -0,0 +1,151 @@
+from service.pre_analyzer import extract_facts, facts_to_overview
+
+ENTITY = """package com.example.model;
+
+@Entity
+@Table(name = "customers", uniqueConstraints = @UniqueConstraint(columnNames = "email"))
+public class Customer implements Serializable {
+    @Id
+    @GeneratedValue
+    private Long id;
+
+    @NotNull
+    @Size(min = 1, max = 25)
+    private String name;
+
+    @Column(name = "email_address")
+    private String email;
+
+    @ManyToOne
+    @JoinColumn(name = "account_id", nullable = false)
+    private Account account;
+
+    @OneToMany(mappedBy = "customer")
+    private List<Order> orders;
+
+    public Long getId() {
+        return id;
+    }
+
+    public void setId(Long id) {
+        this.id = id;
+    }
+}
+"""
+
+RESOURCE = """@Path("/customers")
+@RequestScoped
+public class CustomerResource {
+    @GET
+    @Produces(MediaType.APPLICATION_JSON)
+    public List<Customer> listAll() {
+        return repository.findAll();
+    }
+
+    @POST
+    @Path("/{id}")
+    public Response update(@PathParam("id") long id) {
+        return Response.ok().build();
+    }
+}
+"""
+
+ACTIVATOR = """@ApplicationPath("/rest")
+public class JaxRsActivator extends Application {
+}
+"""
+
+DATASOURCE = """<?xml version="1.0" encoding="UTF-8"?>
+<datasources xmlns="http://www.jboss.org/ironjacamar/schema">
+    <datasource jndi-name="java:jboss/datasources/ExampleDS" pool-name="example">
+        <connection-url>jdbc:h2:mem:example</connection-url>
+        <driver>h2</driver>
+        <security><user-name>sa</user-name><password>secret</password></security>
+    </datasource>
+</datasources>
+"""
+
+
+def test_extracts_the_table_schema_of_an_entity() -> None:
+    facts = extract_facts("src/Customer.java", ENTITY)
+
+    (entity,) = facts.entities
+    assert facts.trivial
+    assert entity.table == "customers"
+    assert entity.ddl() == (
+        "CREATE TABLE customers (\n"
+        "  id BIGINT PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,\n"
+        "  name VARCHAR(25) NOT NULL,\n"
+        "  email_address VARCHAR(255),\n"
+        "  account_id BIGINT NOT NULL\n"
+        ");"
+    )
+
+
+def test_extracts_rest_endpoints_and_keeps_files_with_logic_for_the_llm() -> None:
+    facts = extract_facts("src/CustomerResource.java", RESOURCE)
+
+    assert not facts.trivial
+    assert [(endpoint.http_method, endpoint.path, endpoint.handler) for endpoint in facts.endpoints] == [
+        ("GET", "/customers", "CustomerResource.listAll"),
+        ("POST", "/customers/{id}", "CustomerResource.update"),
+    ]
+    assert facts.endpoints[0].produces == "MediaType.APPLICATION_JSON"
+
+
+def test_extracts_data_sources_without_credentials() -> None:
+    facts = extract_facts("src/example-ds.xml", DATASOURCE)
+
+    assert facts.trivial
+    assert [(source.name, source.connection_url, source.driver) for source in facts.data_sources] == [
+        ("java:jboss/datasources/ExampleDS", "jdbc:h2:mem:example", "h2")
+    ]
+    assert "secret" not in str(facts)
+
+
+SPRING_CONTEXT = """<beans xmlns="http://www.springframework.org/schema/beans">
+    <bean id="dataSource" class="org.apache.commons.dbcp2.BasicDataSource"/>
+</beans>
+"""
+
+ANT_BUILD = """<project name="app" default="dist">
+    <target name="dist"><jar destfile="app.jar" basedir="classes"/></target>
+</project>
+"""
+
+POM = """<project xmlns="http://maven.apache.org/POM/4.0.0">
+    <modelVersion>4.0.0</modelVersion>
+    <artifactId>app</artifactId>
+    <dependencies>
+        <dependency><groupId>jakarta.platform</groupId><artifactId>jakarta.jakartaee-api</artifactId></dependency>
+    </dependencies>
+</project>
+"""
+
+
+def test_only_recognized_descriptors_fully_described_by_their_facts_are_trivial() -> None:
+    spring_context = extract_facts("src/main/resources/applicationContext.xml", SPRING_CONTEXT)
+    ant_build = extract_facts("build.xml", ANT_BUILD)
+    pom = extract_facts("pom.xml", POM)
+    pom_with_plugins = extract_facts("pom.xml", POM.replace("</project>", "<build><plugins/></build></project>"))
+    cdi = extract_facts("WEB-INF/beans.xml", '<beans xmlns="https://jakarta.ee/xml/ns/jakartaee"/>')
+
+    assert (spring_context.kind, spring_context.trivial) == ("unknown", False)
+    assert (ant_build.kind, ant_build.trivial) == ("unknown", False)
+    assert (pom.kind, pom.trivial, len(pom.dependencies)) == ("maven build", True, 1)
+    assert (pom_with_plugins.kind, pom_with_plugins.trivial) == ("maven build", False)
+    assert (cdi.kind, cdi.trivial) == ("cdi config", True)
+
+
+def test_overview_combines_the_facts_of_all_files() -> None:
+    files = [
+        ("src/CustomerResource.java", RESOURCE),
+        ("src/JaxRsActivator.java", ACTIVATOR),
+        ("src/Customer.java", ENTITY),
+    ]
+    all_facts = [extract_facts(relative_path, content) for relative_path, content in files]
+
+    overview = facts_to_overview(all_facts)
+
+    assert [table.name for table in overview.database_tables] == ["customers"]
+    assert [api.api_path for api in overview.api_definitions] == ["GET /rest/customers", "POST /rest/customers/{id}"]
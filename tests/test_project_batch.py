@@ -0,0 +1,80 @@
+import json
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Dict, Iterator
+from unittest.mock import MagicMock, patch
+
+import pytest
+from langchain_core.documents import Document
+
+from service.project_batch import estimate_projects, migrate_projects, resolve_projects
+from test_migration_planner import _mock_llm_responses, _respond_by_stage
+
+
+def _write_plan(plan: Dict[str, Any], output_path: Path) -> None:
+    # The migrated files are records reading from the record store, the documents aren't serializable
+    output_path.write_text(
+        json.dumps(plan, default=lambda value: dict(value) if isinstance(value, Mapping) else str(value))
+    )
+
+
+def test_resolve_projects(tmp_path: Path) -> None:
+    for name in ("billing-api", "billing-jobs", "inventory", "shared"):
+        (tmp_path / name).mkdir()
+    (tmp_path / "notes.txt").write_text("not a project")
+
+    assert resolve_projects(["billing-*", "inventory", "missing"], tmp_path) == [
+        "billing-api",
+        "billing-jobs",
+        "inventory",
+    ]
+
+
+@pytest.mark.asyncio
+@patch("service.migration_planner._load_files")
+async def test_projects_are_migrated_into_their_own_output(
+    mock_load_files: MagicMock, mock_ainvoke_pipeline: Any, tmp_path: Path
+) -> None:
+    def load_files(project: str) -> Iterator[Document]:
+        if project == "broken":
+            raise OSError("unreadable repository")
+        yield Document(
+            page_content=f"public class {project.title()} {{}}", metadata={"source": f"input/{project}/A.java"}
+        )
+
+    mock_load_files.side_effect = load_files
+    mock_ainvoke_pipeline.side_effect = _respond_by_stage(_mock_llm_responses())
+
+    outcomes = await migrate_projects(["billing", "broken", "inventory"], _write_plan, tmp_path)
+
+    assert [(outcome.project, outcome.succeeded) for outcome in outcomes] == [
+        ("billing", True),
+        ("broken", False),
+        ("inventory", True),
+    ]
+    plan = json.loads((tmp_path / "inventory" / "migration_plan.md").read_text())
+    assert plan["application_name"] == "inventory"
+    assert plan["migrated_files"]["Service"][0]["relative_path"] == "input/inventory/A.java"
+    assert (tmp_path / "billing" / "llm_responses" / "implementation_plan.json").exists()
+    summary = json.loads((tmp_path / "batch_summary.json").read_text())
+    assert (summary["succeeded"], summary["failed"]) == (2, ["broken"])
+    assert "unreadable repository" in summary["outcomes"][1]["error"]
+
+
+@pytest.mark.asyncio
+@patch("service.migration_planner._load_files")
+async def test_projects_are_estimated_as_one_batch(mock_load_files: MagicMock) -> None:
+    def load_files(project: str) -> Iterator[Document]:
+        for i in range(2 if project == "billing" else 1):
+            yield Document(
+                page_content=f"public class {project.title()}{i} {{ void run() {{}} }}",
+                metadata={"source": f"input/{project}/A{i}.java"},
+            )
+
+    mock_load_files.side_effect = load_files
+
+    estimate = await estimate_projects(["billing", "inventory"])
+
+    assert estimate.files == 3
+    # One overview, and one plan, per project
+    assert (estimate.stages["overview"].requests, estimate.stages["plan"].requests) == (2, 2)
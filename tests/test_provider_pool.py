@@ -0,0 +1,215 @@
+import asyncio
+import dataclasses
+from typing import Awaitable, Callable, Dict, List
+from unittest.mock import patch
+
+import pytest
+from langchain_core.documents import Document
+
+from benchmarks.fake_openai_server import FakeOpenAIServer, FakeServerSettings
+from model.llm_response_models import CurrentApplication
+from service import migration_planner
+from service.chain_registry import ChainRegistry
+from service.cost_estimator import RunEstimate, SpendLimit
+from service.pre_analyzer import extract_facts
+from service.provider_pool import Endpoint, ProviderPool
+from util.config import RouteConfig
+
+
+def _route(name: str, *base_urls: str, model: str = "gpt-4o-mini") -> RouteConfig:
+    return RouteConfig(name, model, base_urls, ("fake",), 0.15, 0.6)
+
+
+@pytest.mark.asyncio
+async def test_a_slow_request_is_hedged_on_another_endpoint_and_the_loser_is_cancelled() -> None:
+    pool = ProviderPool(
+        [_route("main", "http://slow", "http://fast")],
+        hedge_percentile=0.9,
+        hedge_min_samples=1,
+        hedge_min_delay_seconds=0.05,
+        hedge_max_fraction=1.0,
+    )
+    pool.stats["main"].latencies.append(0.01)
+    cancelled: List[str] = []
+
+    async def call(endpoint: Endpoint) -> str:
+        try:
+            await asyncio.sleep(10 if endpoint.base_url == "http://slow" else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(str(endpoint.base_url))
+            raise
+        return str(endpoint.base_url)
+
+    # The endpoints take turns while they're tied, the slow one first
+    assert await asyncio.wait_for(pool.run("main", call), 1) == "http://fast"
+
+    assert cancelled == ["http://slow"]
+    report = pool.report()["main"]
+    assert (report["requests"], report["hedged"], report["hedges_won"], report["failures"]) == (1, 1, 1, 0)
+
+
+@pytest.mark.asyncio
+async def test_a_failed_attempt_waits_for_the_hedge() -> None:
+    pool = ProviderPool(
+        [_route("main", "http://a", "http://b")],
+        hedge_percentile=0.5,
+        hedge_min_samples=1,
+        hedge_min_delay_seconds=0,
+        hedge_max_fraction=1.0,
+    )
+    pool.stats["main"].latencies.append(0.01)
+
+    async def call(endpoint: Endpoint) -> str:
+        if endpoint.base_url == "http://a":
+            await asyncio.sleep(0.05)
+            raise ConnectionError("Connection reset")
+        return "answer"
+
+    assert await pool.run("main", call) == "answer"
+    assert pool.stats["main"].hedges_won == 1
+
+
+@pytest.mark.asyncio
+async def test_hedges_are_submitted_like_the_first_attempt_and_capped_to_a_fraction_of_the_requests() -> None:
+    pool = ProviderPool(
+        [_route("main", "http://a", "http://b"), _route("single", "http://c")],
+        hedge_percentile=0.5,
+        hedge_min_samples=1,
+        hedge_min_delay_seconds=0.01,
+        hedge_max_fraction=0.25,
+    )
+    pool.stats["main"].latencies.append(0.001)
+    pool.stats["single"].latencies.append(0.001)
+    submitted: List[str] = []
+
+    async def call(endpoint: Endpoint) -> str:
+        await asyncio.sleep(0.05)
+        return str(endpoint.base_url)
+
+    async def submit(request: Callable[[], Awaitable[str]]) -> str:
+        submitted.append("attempt")
+        return await request()
+
+    await asyncio.gather(*(pool.run("main", call, submit) for _ in range(8)))
+    await pool.run("single", call, submit)
+
+    # Every hedge went through `submit`, and the route with one endpoint wasn't hedged
+    assert (pool.stats["main"].requests, pool.stats["main"].hedged, pool.stats["single"].hedged) == (8, 2, 0)
+    assert len(submitted) == 8 + 2 + 1
+
+
+@pytest.mark.asyncio
+async def test_requests_are_balanced_away_from_a_slow_endpoint() -> None:
+    pool = ProviderPool([_route("main", "http://slow", "http://fast")])
+    calls: Dict[str, int] = {"http://slow": 0, "http://fast": 0}
+
+    async def call(endpoint: Endpoint) -> None:
+        calls[str(endpoint.base_url)] += 1
+        await asyncio.sleep(0.05 if endpoint.base_url == "http://slow" else 0.001)
+
+    for _ in range(10):
+        await asyncio.gather(*(pool.run("main", call) for _ in range(4)))
+
+    assert calls["http://fast"] > 2 * calls["http://slow"] > 0
+
+
+def test_stages_and_simple_files_are_routed_to_their_models() -> None:
+    pool = ProviderPool(
+        [_route("default", "http://a"), _route("large", "http://b", model="gpt-4o"), _route("small", "http://c")],
+        stage_routes={"overview": "large"},
+        simple_file_route="small",
+    )
+
+    assert pool.route("overview") == "large"
+    assert pool.route("migration") == "default"
+    assert pool.route("migration", simple_file=True) == "small"
+    assert pool.model("large") == "gpt-4o"
+    with pytest.raises(ValueError, match="Unknown route: missing"):
+        ProviderPool([_route("default", "http://a")], stage_routes={"plan": "missing"})
+
+
+def test_cache_keys_and_estimates_follow_the_models_and_prices_of_the_routes() -> None:
+    routes = (_route("default", "http://a"), RouteConfig("large", "gpt-4o", ("http://b",), ("fake",), 2.5, 10.0))
+    pool = ProviderPool(routes, stage_routes={"plan": "large"})
+    with patch.object(migration_planner, "pool", pool):
+        large_key = migration_planner._cache_key("plan", pool.route("plan"), "template", "input")
+        assert large_key != migration_planner._cache_key("plan", "default", "template", "input")
+
+    estimate = RunEstimate(pool.pricing("default"), max_concurrency=1)
+    estimate.add_request("analysis", 1000, 100)
+    estimate.add_request("plan", 1000, 100, pool.pricing("large"))
+    assert estimate.stages["plan"].cost_usd == pytest.approx((1000 * 2.5 + 100 * 10.0) / 1e6)
+    assert estimate.cost_usd == pytest.approx((1000 * 0.15 + 100 * 0.6 + 1000 * 2.5 + 100 * 10.0) / 1e6)
+
+
+def test_a_file_is_journaled_under_the_route_its_analysis_prompt_is_sent_to() -> None:
+    pool = ProviderPool([_route("default", "http://a"), _route("small", "http://b")], simple_file_route="small")
+    config = dataclasses.replace(migration_planner.config, routing_simple_file_max_tokens=50)
+    content = "/**\n" + " * A long comment.\n" * 40 + " */\npublic class Test { void run() {} }"
+    doc = Document(page_content=content, metadata={"source": "input/Test.java"})
+    with patch.object(migration_planner, "config", config), patch.object(migration_planner, "pool", pool):
+        # The analysis prompt carries the Java file without its comments
+        assert migration_planner._route("analysis", [content]) == "default"
+        assert migration_planner._analysis_route(doc, extract_facts("input/Test.java", content)) == "small"
+        assert migration_planner._analysis_route(doc, None) == "default"
+
+
+@pytest.mark.asyncio
+async def test_routes_balance_between_local_servers_and_report_their_usage() -> None:
+    settings = FakeServerSettings(median_latency_seconds=0.01, seed=1)
+    with FakeOpenAIServer(settings) as first, FakeOpenAIServer(settings) as second, FakeOpenAIServer() as small:
+        routes = (_route("main", first.base_url, second.base_url), _route("small", small.base_url))
+        config = dataclasses.replace(
+            migration_planner.config, routes=routes, routing_simple_file_route="small", hedge_percentile=0.0
+        )
+        pool = ProviderPool(routes, simple_file_route="small")
+        prompt = migration_planner.chains.prompt("create_application_overview", ["analyses"])
+        with (
+            patch.object(migration_planner, "config", config),
+            patch.object(migration_planner, "pool", pool),
+            patch.object(migration_planner, "chains", ChainRegistry(config)),
+        ):
+            await asyncio.gather(
+                *(
+                    migration_planner._invoke(
+                        "overview", f"overview {i}", prompt, CurrentApplication, {"analyses": "An entity"}
+                    )
+                    for i in range(6)
+                )
+            )
+            await migration_planner._invoke(
+                "analysis",
+                "A.java",
+                prompt,
+                CurrentApplication,
+                {"analyses": "An entity"},
+                migration_planner._route("analysis", ["class A {}"]),
+            )
+
+    assert first.stats.completed > 0 and second.stats.completed > 0
+    assert first.stats.completed + second.stats.completed == 6 and small.stats.completed == 1
+    report = pool.report()
+    assert report["main"]["requests"] == 6 and report["small"]["requests"] == 1
+    assert report["main"]["prompt_tokens"] == first.stats.prompt_tokens + second.stats.prompt_tokens
+    assert report["main"]["cost_usd"] > 0 and report["main"]["p95_seconds"] > 0
+
+
+@pytest.mark.asyncio
+async def test_the_default_route_reports_its_usage_without_metrics_or_a_spend_limit() -> None:
+    with FakeOpenAIServer() as server:
+        config = dataclasses.replace(migration_planner.config, routes=(), openai_base_url=server.base_url)
+        pool = ProviderPool.from_config(config)
+        prompt = migration_planner.chains.prompt("create_application_overview", ["analyses"])
+        with (
+            patch.object(migration_planner, "config", config),
+            patch.object(migration_planner, "pool", pool),
+            patch.object(migration_planner, "chains", ChainRegistry(config)),
+            patch.object(migration_planner, "spend_limit", SpendLimit(pool.pricing("default"))),
+            patch.object(migration_planner.metrics, "enabled", False),
+        ):
+            await migration_planner._invoke(
+                "overview", "overview", prompt, CurrentApplication, {"analyses": "An entity"}
+            )
+
+    report = pool.report()["default"]
+    assert report["prompt_tokens"] == server.stats.prompt_tokens > 0 and report["cost_usd"] > 0
@@ -0,0 +1,62 @@
+import gc
+import pickle
+from pathlib import Path
+
+import pytest
+
+from service.analysis_cache import content_hash
+from service.record_store import PAGE_SIZE, RecordStore
+
+
+def test_records_read_their_content_from_the_store() -> None:
+    store = RecordStore()
+    store.add_file("src/Member.java", "class Member {}")
+
+    analyzed_file = store.set_analysis("src/Member.java", "JPA entity")
+    migrated_file = store.set_migration("src/Member.java", "@Document class Member {}", "Entity")
+
+    assert (analyzed_file.name, analyzed_file.file_extension) == ("Member.java", ".java")
+    assert (analyzed_file.content, analyzed_file.analysis) == ("class Member {}", "JPA entity")
+    assert dict(migrated_file) == {
+        "name": "Member.java",
+        "relative_path": "src/Member.java",
+        "file_extension": ".java",
+        "file_category": "Entity",
+        "new_file": "@Document class Member {}",
+    }
+    assert not hasattr(analyzed_file, "__dict__") and not hasattr(migrated_file, "__dict__")
+    assert store.file_hashes() == {"src/Member.java": content_hash("class Member {}")}
+    with pytest.raises(KeyError):
+        store.new_file("src/Missing.java")
+
+
+def test_migrated_files_are_pickled_as_plain_dicts() -> None:
+    store = RecordStore()
+    store.add_file("src/Member.java", "class Member {}")
+    migrated_file = store.set_migration("src/Member.java", "@Document class Member {}", "Entity")
+
+    assert pickle.loads(pickle.dumps(migrated_file)) == dict(migrated_file)
+
+
+def test_contents_are_iterated_by_page_in_path_order() -> None:
+    store = RecordStore()
+    paths = [f"src/File{i:04d}.java" for i in range(PAGE_SIZE * 2 + 3)]
+    for path in reversed(paths):
+        store.add_file(path, f"class {path}")
+
+    assert [path for path, _ in store.iter_contents()] == paths
+    assert len(store) == len(paths)
+
+
+def test_the_temporary_database_outlives_the_store_while_records_use_it() -> None:
+    store = RecordStore()
+    store.add_file("src/Member.java", "class Member {}")
+    analyzed_file = store.set_analysis("src/Member.java", "JPA entity")
+    database_dir = Path(store._connection.execute("PRAGMA database_list").fetchone()[2]).parent
+    del store
+    gc.collect()
+
+    assert analyzed_file.content == "class Member {}"
+    del analyzed_file
+    gc.collect()
+    assert not database_dir.exists()
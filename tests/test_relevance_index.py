@@ -0,0 +1,53 @@
+from model.llm_response_models import DBTable
+from model.util_data_classes import AnalyzedFileDefinition
+from service import migration_planner
+from service.record_store import RecordStore
+from service.relevance_index import RelevanceIndex, tokenize_identifiers
+
+
+def _analyzed_file(store: RecordStore, name: str, analysis: str, content: str = "") -> AnalyzedFileDefinition:
+    store.add_file(f"src/{name}", content)
+    return store.set_analysis(f"src/{name}", analysis)
+
+
+def test_tokenize_splits_identifiers() -> None:
+    assert tokenize_identifiers("MemberRepository findByEmail(member_id)") == [
+        "memberrepository",
+        "member",
+        "repository",
+        "findbyemail",
+        "find",
+        "email",
+        "member",
+        "id",
+    ]
+    assert tokenize_identifiers("CREATE TABLE Member (id BIGINT NOT NULL)") == ["member", "id"]
+
+
+def test_search_ranks_the_files_mentioning_the_query_first() -> None:
+    index = RelevanceIndex()
+    index.add("Member.java", '@Entity @Table(name = "member") class Member { String email; String phoneNumber; }')
+    index.add("MemberRepository.java", "class MemberRepository { Member findByEmail(String email) }")
+    index.add("Order.java", "@Entity class Order { BigDecimal total; }")
+    index.add("JaxRsActivator.java", '@ApplicationPath("/rest") class JaxRsActivator extends Application {}')
+
+    results = index.search("CREATE TABLE member (id BIGINT, email VARCHAR(25), phone_number VARCHAR(12))", 10)
+
+    assert [document_id for document_id, _ in results] == ["Member.java", "MemberRepository.java"]
+    assert index.search("member", 1)[0][0] == "Member.java"
+
+
+def test_selected_analyses_only_include_relevant_files_within_the_budget() -> None:
+    store = RecordStore()
+    analyzed_files = [
+        _analyzed_file(store, "Member.java", "JPA entity for the member table with name, email and phone number."),
+        _analyzed_file(store, "MemberRegistration.java", "Service persisting new Member entities."),
+        _analyzed_file(store, "Resources.java", "CDI producer for the logger and the entity manager."),
+    ]
+    index = migration_planner._build_relevance_index(analyzed_files)
+
+    selected = migration_planner._select_relevant_analyses(
+        index, store, DBTable(name="Member", db_schema="CREATE TABLE Member (id BIGINT, email VARCHAR)")
+    )
+
+    assert selected == [analyzed_files[0].analysis, analyzed_files[1].analysis]
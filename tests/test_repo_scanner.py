@@ -0,0 +1,95 @@
+from pathlib import Path
+from typing import Dict
+
+from util.repo_scanner import ScanStats, parse_ignore_patterns, scan_repository
+
+
+def _write_files(root: Path, files: Dict[str, bytes]) -> None:
+    for relative_path, content in files.items():
+        path = root / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+
+
+def _scanned_paths(root: Path, **kwargs: object) -> list[str]:
+    return [
+        Path(doc.metadata["source"]).relative_to(root).as_posix()
+        for doc in scan_repository(root, ["java", "xml"], **kwargs)  # type: ignore[arg-type]
+    ]
+
+
+def test_ignore_patterns() -> None:
+    rule = parse_ignore_patterns(["target/"])[0]
+    assert rule.directory_only and rule.regex.match("module/target")
+    assert parse_ignore_patterns(["/generated"])[0].regex.match("generated")
+    assert not parse_ignore_patterns(["/generated"])[0].regex.match("module/generated")
+    assert parse_ignore_patterns(["src/**/*.xml"])[0].regex.match("src/main/resources/beans.xml")
+    assert parse_ignore_patterns(["src/**/*.xml"])[0].regex.match("src/beans.xml")
+
+
+def test_scans_matching_files_in_a_single_sorted_walk(tmp_path: Path) -> None:
+    _write_files(
+        tmp_path,
+        {
+            "pom.xml": b"<project/>",
+            "src/main/java/B.java": b"class B {}",
+            "src/main/java/A.java": b"class A {}",
+            "README.md": b"# readme",
+        },
+    )
+
+    assert _scanned_paths(tmp_path) == ["pom.xml", "src/main/java/A.java", "src/main/java/B.java"]
+
+
+def test_honours_gitignore_files_and_exclude_globs(tmp_path: Path) -> None:
+    _write_files(
+        tmp_path,
+        {
+            ".gitignore": b"generated/\n*.tmp.java\n",
+            "A.java": b"class A {}",
+            "A.tmp.java": b"class ATmp {}",
+            "generated/G.java": b"class G {}",
+            "module/.gitignore": b"*.xml\n!keep.xml\n",
+            "module/drop.xml": b"<drop/>",
+            "module/keep.xml": b"<keep/>",
+            "target/T.java": b"class T {}",
+        },
+    )
+    stats = ScanStats()
+
+    assert _scanned_paths(tmp_path, exclude_globs=["target/"], stats=stats) == ["A.java", "module/keep.xml"]
+    assert stats.ignored == 4
+
+
+def test_skips_binary_and_oversized_files(tmp_path: Path) -> None:
+    _write_files(
+        tmp_path,
+        {"Binary.java": b"\xca\xfe\xba\xbe\x00\x00", "Big.java": b"x" * 2048, "Small.java": b"class Small {}"},
+    )
+    stats = ScanStats()
+
+    assert _scanned_paths(tmp_path, max_file_size_bytes=1024, stats=stats) == ["Small.java"]
+    assert stats.binary == 1
+    assert stats.too_large == 1
+
+
+def test_detects_encodings_and_memory_maps_large_files(tmp_path: Path) -> None:
+    _write_files(
+        tmp_path,
+        {
+            "Bom.java": b"\xef\xbb\xbfclass Bom {}",
+            "Latin.java": "class Café {}".encode("cp1252"),
+            "Large.java": "// über\n".encode("utf-8") + b"class Large {}\n" * 100,
+        },
+    )
+    stats = ScanStats()
+
+    documents = {
+        Path(doc.metadata["source"]).name: doc.page_content
+        for doc in scan_repository(tmp_path, ["java"], mmap_threshold_bytes=1024, stats=stats)
+    }
+
+    assert documents["Bom.java"] == "class Bom {}"
+    assert documents["Latin.java"] == "class Café {}"
+    assert documents["Large.java"].startswith("// über\nclass Large {}")
+    assert stats.encodings == {"utf-8-sig": 1, "cp1252": 1, "utf-8": 1}
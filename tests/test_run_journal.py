@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from service.run_journal import RunJournal
+
+
+def test_resume_reloads_the_journaled_units(tmp_path: Path) -> None:
+    path = tmp_path / "run.jsonl"
+    journal = RunJournal(path)
+    journal.record("analysis", "a", "Analysis of a")
+    journal.record("overview", "all", {"application_summary": "Summary"})
+
+    resumed = RunJournal(path, resume=True)
+
+    assert len(resumed) == 2
+    assert resumed.get("analysis", "a") == "Analysis of a"
+    assert resumed.get("overview", "all") == {"application_summary": "Summary"}
+    assert RunJournal(path).get("analysis", "a") is None
+
+
+def test_a_torn_last_record_is_dropped(tmp_path: Path) -> None:
+    path = tmp_path / "run.jsonl"
+    RunJournal(path).record("analysis", "a", "Analysis of a")
+    with open(path, "a") as f:
+        f.write('{"kind": "analysis", "key": "b", "val')
+
+    resumed = RunJournal(path, resume=True)
+    resumed.record("analysis", "c", "Analysis of c")
+
+    assert RunJournal(path, resume=True).get("analysis", "c") == "Analysis of c"
+    assert len(path.read_text().splitlines()) == 2
+
+
+def test_concurrent_writers_never_interleave_records(tmp_path: Path) -> None:
+    path = tmp_path / "run.jsonl"
+    journal = RunJournal(path)
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda i: journal.record("analysis", str(i), "x" * 10_000), range(200)))
+
+    assert len(RunJournal(path, resume=True)) == 200